@@ -1 +1 @@
-__all__=['params','parser','demand','planner','forms']
+__all__=['params','compiled','parser','demand','planner','forms']
@@ -0,0 +1,125 @@
+from enum import IntEnum
+import numpy as np
+from . import params
+
+
+class Area(IntEnum):
+    US = 0
+    EU = 1
+    BR = 2
+    CM = 3   # Casa matriz (solo en tablas financieras)
+
+
+class Producto(IntEnum):
+    X = 0
+    Y = 1
+
+
+class Transporte(IntEnum):
+    SUPERFICIE = 0
+    AEREO = 1
+
+
+N_AREAS = len(params.AREAS)   # Áreas de operación (sin CM)
+# Las tablas se construyen en el orden de params.AREAS e indexan con Area: deben coincidir
+# (la gaceta ya rechaza reordenar AREAS, ver gazette.validar)
+if list(Area.__members__)[:N_AREAS] != list(params.AREAS):
+    raise ImportError(f"params.AREAS {params.AREAS} no sigue el orden de Area {list(Area.__members__)}")
+N_GRADOS_TEC = len(params.X_TO_Y)
+
+
+def _indice(enum, k):
+    # 'EU' -> 1, Area.EU -> 1, 1 -> 1
+    if isinstance(k, str):
+        return int(enum[k])
+    return k
+
+
+class Tabla(np.ndarray):
+    """
+    Array de solo lectura con ejes etiquetados por enums: admite tanto
+    t[Area.EU, Producto.X] como el acceso estilo dict t['EU']['X'].
+    """
+    def __new__(cls, datos, ejes):
+        obj = np.array(datos, dtype=float).view(cls)
+        obj.ejes = tuple(ejes)
+        obj.flags.writeable = False
+        return obj
+
+    def __array_finalize__(self, obj):
+        self.ejes = getattr(obj, 'ejes', None)
+
+    def __getitem__(self, key):
+        claves = key if isinstance(key, tuple) else (key,)
+        ejes = self.ejes or ()
+        if ejes and len(claves) <= len(ejes) and all(isinstance(k, (str, int, slice, IntEnum)) for k in claves):
+            claves = tuple(_indice(e, k) if e is not None else k for e, k in zip(ejes, claves))
+            resto = tuple(e for e, k in zip(ejes, claves) if isinstance(k, slice)) + ejes[len(claves):]
+            res = super().__getitem__(claves)
+            if isinstance(res, Tabla):
+                res.ejes = resto
+            return res
+        res = super().__getitem__(key)
+        if isinstance(res, Tabla):
+            res.ejes = None
+        return res
+
+
+def _tabla_ap(dic, ejes=(Area, Producto)):
+    return Tabla([[dic[a][p] for p in Producto.__members__] for a in params.AREAS], ejes)
+
+
+def _tabla_ruta(dic):
+    # (origen, destino, producto); NaN en las rutas que no existen (misma área)
+    datos = np.full((N_AREAS, N_AREAS, len(Producto)), np.nan)
+    for (o, d, p), v in dic.items():
+        datos[Area[o], Area[d], Producto[p]] = v
+    return datos
+
+
+class CompiledParams:
+    """
+    Tablas de src.params como arrays NumPy de solo lectura, construidas una vez al importar.
+    Índices: Area (US, EU, BR[, CM]), Producto (X, Y), Transporte (SUPERFICIE, AEREO).
+    Las usan los cálculos vectorizados (v3.cashflow, v3.league, Planner); OptimizerV3 y
+    PrescreenAnalitico siguen leyendo los dicts de src.params, que son la fuente.
+    Se compilan a partir de las tablas ya validadas (gaceta incluida, ver src/gazette.py).
+    """
+    def __init__(self):
+        self.VERSION = params.PARAMS_VERSION
+        self.CAP_MAX = _tabla_ap(params.CAP_MAX)
+        self.CAPEX_PLANTA = _tabla_ap(params.CAPEX_PLANTA)
+        self.PRECIOS_TIPICOS = _tabla_ap(params.PRECIOS_TIPICOS)
+        self.SALTO_MIN = _tabla_ap(params.SALTO_MIN)
+        self.ALMACEN_MIN = _tabla_ap(params.ALMACEN_MIN)
+        self.COSTE_FIJO = Tabla([[params.COSTE_FIJO[a][p] for p in Producto.__members__] for a in params.AREAS],
+                                (Area, Producto, None))
+        self.DEPRE = Tabla([params.DEPRE[p] for p in Producto.__members__], (Producto,))
+        self.TOPE_BR_Y_LE3 = params.TOPE_BR_Y_LE3
+
+        # Transporte: (modo, origen, destino, producto)
+        self.TRANSPORTE = Tabla([_tabla_ruta(params.TRANSP_SUP), _tabla_ruta(params.TRANSP_AIR)],
+                                (Transporte, Area, Area, Producto))
+        self.PUNTOS_CRITICOS = Tabla([_tabla_ruta(params.PUNTOS_SUP), _tabla_ruta(params.PUNTOS_AIR)],
+                                     (Transporte, Area, Area, Producto))
+
+        # Cobros/pagos: columnas contado, próximo, subsiguiente
+        self.AR = Tabla([[params.AR_STRUCTURE[a][k] for k in ('cash', 'cxc1', 'cxc2')] for a in params.AREAS], (Area, None))
+        self.AP = Tabla([[params.AP_STRUCTURE[a][k] for k in ('cash', 'cxc1', 'cxc2')] for a in params.AREAS], (Area, None))
+
+        # Tablas financieras con casa matriz (CM) como cuarta área
+        todas = list(Area.__members__)
+        self.IMPUESTOS = Tabla([params.IMPUESTOS[a] for a in todas], (Area,))
+        self.INTERES_SALDO_POS = Tabla([params.INTERES_SALDO_POS[a] for a in todas], (Area,))
+        self.INTERES_SALDO_NEG_MENOR = Tabla([params.INTERES_SALDO_NEG_MENOR[a] for a in todas], (Area,))
+        self.INTERES_SALDO_NEG_MAYOR = Tabla([params.INTERES_SALDO_NEG_MAYOR[a] for a in todas], (Area,))
+        self.SUMAS_CRITICAS = Tabla([params.SUMAS_CRITICAS[a] for a in params.AREAS], (Area,))
+
+        # Chips por PC: (grado de PC, grado de chip)
+        self.X_TO_Y = Tabla(params.X_TO_Y, (None, None))
+
+    def __getitem__(self, nombre):
+        return getattr(self, nombre)
+
+
+PARAMS = CompiledParams()
@@ -1,62 +1,228 @@
-import csv, os
+import csv, os, io, json, zipfile
 from typing import Dict, Any, List
+import numpy as np
+from .profiling import medido
+
+BUFFER_BUNDLE = 1 << 20   # Bytes de buffer del fichero del bundle (un solo fichero para todos los escenarios)
+INDICE_BUNDLE = 'indice.json'
 
 class FormsExporter:
     def __init__(self, out_dir:str):
         self.out_dir=out_dir
         os.makedirs(out_dir, exist_ok=True)
 
-    def export_A1(self, periodo:int, decisions:Dict[tuple, Dict[str,int]]):
-        path=os.path.join(self.out_dir, f'A1_marketing_p{periodo}.csv')
-        cols=['Area','Producto','Grado','Precio','Publicidad(miles)']
+    def _escribir(self, formulario:str, periodo:int, nombre:str, cols:List[str], filas):
+        # Punto de extensión: BundleExporter escribe en el zip en lugar de un CSV suelto
+        path=os.path.join(self.out_dir, nombre)
         with open(path,'w',newline='',encoding='utf-8') as f:
-            w=csv.writer(f); w.writerow(cols)
-            for (area,prod,g),d in decisions.items():
-                w.writerow([area,prod,g,d.get('price',0), d.get('ad',0)])
+            w=csv.writer(f); w.writerow(cols); w.writerows(filas)
         return path
 
+    @medido('export.A1')
+    def export_A1(self, periodo:int, decisions:Dict[tuple, Dict[str,int]]):
+        cols=['Area','Producto','Grado','Precio','Publicidad(miles)']
+        filas=[[area,prod,g,d.get('price',0), d.get('ad',0)] for (area,prod,g),d in decisions.items()]
+        return self._escribir('A1', periodo, f'A1_marketing_p{periodo}.csv', cols, filas)
+
+    @medido('export.A2')
     def export_A2(self, periodo:int, a2:Dict[str,Any]):
-        path=os.path.join(self.out_dir, f'A2_produccion_p{periodo}.csv')
         cols=['Area','Producto','PlantasNuevas','MejoraMetodos(miles)',
               'GradoInf','Prod_P1(k)','Prod_P2(k)','Prod_P3(k)',
               'GradoSup','ProdSup_P1(k)','ProdSup_P2(k)','ProdSup_P3(k)']
-        with open(path,'w',newline='',encoding='utf-8') as f:
-            w=csv.writer(f); w.writerow(cols)
-            for area,prod_dict in a2.items():
-                for prod,val in prod_dict.items():
-                    p=val.get('prod_planta',[0,0,0])
-                    ps=val.get('prod_planta_sup',[0,0,0])
-                    w.writerow([area,prod,val.get('nuevas',0),val.get('mejora_k',0),
-                                val.get('grado_inf',0), p[0],p[1],p[2],
-                                val.get('grado_sup',0), ps[0],ps[1],ps[2]])
-        return path
+        filas=[]
+        for area,prod_dict in a2.items():
+            for prod,val in prod_dict.items():
+                p=val.get('prod_planta',[0,0,0])
+                ps=val.get('prod_planta_sup',[0,0,0])
+                filas.append([area,prod,val.get('nuevas',0),val.get('mejora_k',0),
+                              val.get('grado_inf',0), p[0],p[1],p[2],
+                              val.get('grado_sup',0), ps[0],ps[1],ps[2]])
+        return self._escribir('A2', periodo, f'A2_produccion_p{periodo}.csv', cols, filas)
 
+    @medido('export.A3')
     def export_A3(self, periodo:int, a3_list:List[Dict[str,Any]]):
-        path=os.path.join(self.out_dir, f'A3_finanzas_p{periodo}.csv')
         cols=['Area','Tipo(F/T/R)','Moneda(1..4)','Monto(miles)','Conversion(S/N)']
-        with open(path,'w',newline='',encoding='utf-8') as f:
-            w=csv.writer(f); w.writerow(cols)
-            for r in a3_list:
-                w.writerow([r['area'], r['tipo'], r['moneda'], r['monto_k'], r['conversion']])
-        return path
+        filas=[[r['area'], r['tipo'], r['moneda'], r['monto_k'], r['conversion']] for r in a3_list]
+        return self._escribir('A3', periodo, f'A3_finanzas_p{periodo}.csv', cols, filas)
 
+    @medido('export.A4')
     def export_A4(self, periodo:int, a4:Dict[str,Any]):
-        path=os.path.join(self.out_dir, f'A4_prioridades_p{periodo}.csv')
         cols=['Area','PrecioCompX_std','PrecioCompX_lujo','ReservaX_std(k)','ReservaX_lujo(k)','PrioridadX(S/D)','PrioridadY(S/D)']
-        with open(path,'w',newline='',encoding='utf-8') as f:
-            w=csv.writer(f); w.writerow(cols)
-            for area,val in a4.items():
-                w.writerow([area, val.get('precio_comp_x_std',''), val.get('precio_comp_x_lujo',''),
-                            val.get('reserva_x_std_k',0), val.get('reserva_x_lujo_k',0),
-                            val.get('prioridad_x','S'), val.get('prioridad_y','S')])
-        return path
+        filas=[[area, val.get('precio_comp_x_std',''), val.get('precio_comp_x_lujo',''),
+                val.get('reserva_x_std_k',0), val.get('reserva_x_lujo_k',0),
+                val.get('prioridad_x','S'), val.get('prioridad_y','S')] for area,val in a4.items()]
+        return self._escribir('A4', periodo, f'A4_prioridades_p{periodo}.csv', cols, filas)
 
+    @medido('export.H1')
     def export_H1(self, periodo:int, h1:Dict[str,Any]):
-        path=os.path.join(self.out_dir, f'H1_casa_matriz_p{periodo}.csv')
         cols=['I+D_X(kFS)','I+D_Y(kFS)','IM_monto(kFS)','IM_estudios(coma)','Dividendos(kFS)']
-        with open(path,'w',newline='',encoding='utf-8') as f:
-            w=csv.writer(f); w.writerow(cols)
-            w.writerow([h1.get('I+D_X_kFS',0), h1.get('I+D_Y_kFS',0),
-                        h1.get('IM_monto_kFS',0), ','.join(map(str,h1.get('IM_estudios',[]))),
-                        h1.get('dividendos_kFS',0)])
-        return path
\ No newline at end of file
+        filas=[[h1.get('I+D_X_kFS',0), h1.get('I+D_Y_kFS',0),
+                h1.get('IM_monto_kFS',0), ','.join(map(str,h1.get('IM_estudios',[]))),
+                h1.get('dividendos_kFS',0)]]
+        return self._escribir('H1', periodo, f'H1_casa_matriz_p{periodo}.csv', cols, filas)
+
+    @medido('export.H6')
+    def export_H6(self, periodo:int, h6_list:List[Dict[str,Any]]):
+        cols=['CiaVende','AreaVende','CiaCompra','AreaCompra','PagoCont(%)','PagoProx(%)','PagoSubs(%)',
+              'Conversion(S/N)','Producto','Grado','Unidades(k)','Moneda(1..4)','PrecioUnit','Via','PerEjec']
+        filas=[[r['cia_vende'], r['area_vende'], r['cia_compra'], r['area_compra'],
+                r['contado'], r['proximo'], r['subsiguiente'], r.get('conversion','N'),
+                r['producto'], r['grado'], r['unidades_k'], r['moneda'], r['precio'],
+                r.get('via','EXPR'), r.get('periodo',periodo)] for r in h6_list]
+        return self._escribir('H6', periodo, f'H6_ventas_industriales_p{periodo}.csv', cols, filas)
+
+    @medido('export.manifest')
+    def export_manifest(self, periodo:int, info:Dict[str,Any]):
+        # Qué generó estos formularios (versión de parámetros, LSTs de entrada...)
+        path=os.path.join(self.out_dir, f'manifest_p{periodo}.json')
+        with open(path,'w',encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        return path
+
+
+def _columna(valores):
+    # Tipo más compacto que conserva el texto del CSV al extraer: int64, float64 o texto
+    if all(isinstance(v,(int,np.integer)) and not isinstance(v,bool) for v in valores):
+        return np.array(valores, dtype=np.int64)
+    if all(isinstance(v,float) for v in valores):
+        return np.array(valores, dtype=np.float64)
+    return np.array([str(v) for v in valores])
+
+
+class BundleExporter(FormsExporter):
+    """
+    Formularios de muchos escenarios en un solo zip, para barridos y backtests: mismo API que
+    FormsExporter (o agregar() con el dict de DecisionAssembler.ensamblar), pero cada
+    formulario va al fichero abierto una sola vez en vez de a un CSV suelto en outputs/forms.
+    Al cerrar se añade indice.json: {escenario: {periodo: {formulario: entrada}}}.
+
+    - Por filas (por defecto): cada formulario es el miembro '{prefijo}/A1_marketing_p6.csv', con
+      un prefijo único por escenario (el nombre sin '/'; '~2', '~3'... si ya está cogido) que
+      queda en la entrada del índice.
+    - columnar=True: una tabla por formulario con una columna .npy por campo (más Escenario
+      y Periodo); la entrada del índice da el rango de filas del formulario.
+    Un mismo (escenario, periodo, formulario) dos veces es un error, no una sobrescritura.
+    """
+    def __init__(self, path:str, columnar:bool=False):
+        self.out_dir=self.path=path
+        self.columnar=columnar
+        self.escenario=None
+        self.indice={}
+        self.prefijos={}  # escenario -> prefijo de sus miembros en el zip
+        self.tablas={}   # formulario -> {'cols', 'datos': [valores por columna], 'escenario', 'periodo'}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fichero=open(path,'wb',buffering=BUFFER_BUNDLE)
+        self.zip=zipfile.ZipFile(self._fichero,'w',zipfile.ZIP_DEFLATED)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
+
+    def _entrada(self, formulario:str, periodo:int, entrada:Dict[str,Any]):
+        if self.escenario is None:
+            raise ValueError("BundleExporter: falta el escenario (agregar() o .escenario)")
+        periodos=self.indice.setdefault(self.escenario, {}).setdefault(str(periodo), {})
+        if formulario in periodos:
+            raise ValueError(f"{formulario} del periodo {periodo} ya está en el escenario '{self.escenario}'")
+        periodos[formulario]=entrada
+        return f"{self.path}:{entrada.get('miembro', entrada['fichero'])}"
+
+    def _miembro(self, nombre:str):
+        # 's/1' y 's_1' se sanean igual: el segundo escenario recibe 's_1~2'
+        prefijo=self.prefijos.get(self.escenario)
+        if prefijo is None:
+            base=prefijo=self.escenario.replace('/','_') or '_'
+            usados=set(self.prefijos.values())
+            n=2
+            while prefijo in usados:
+                prefijo=f'{base}~{n}'; n+=1
+            self.prefijos[self.escenario]=prefijo
+        return f"{prefijo}/{nombre}"
+
+    def _escribir(self, formulario:str, periodo:int, nombre:str, cols:List[str], filas):
+        if not self.columnar:
+            miembro=self._miembro(nombre)
+            ruta=self._entrada(formulario, periodo, {'fichero': nombre, 'miembro': miembro})
+            f=io.StringIO(newline='')
+            w=csv.writer(f); w.writerow(cols); w.writerows(filas)
+            self.zip.writestr(miembro, f.getvalue())
+            return ruta
+        tabla=self.tablas.setdefault(formulario, {'cols': cols, 'datos': [[] for _ in cols], 'escenario': [], 'periodo': []})
+        inicio=len(tabla['periodo'])
+        for fila in filas:
+            for columna,valor in zip(tabla['datos'], fila):
+                columna.append(valor)
+            tabla['escenario'].append(self.escenario); tabla['periodo'].append(periodo)
+        return self._entrada(formulario, periodo, {'fichero': nombre, 'filas': [inicio, len(tabla['periodo'])]})
+
+    def export_manifest(self, periodo:int, info:Dict[str,Any]):
+        nombre=f'manifest_p{periodo}.json'
+        miembro=self._miembro(nombre)
+        ruta=self._entrada('manifest', periodo, {'fichero': nombre, 'miembro': miembro})
+        self.zip.writestr(miembro, json.dumps(info, ensure_ascii=False, indent=2))
+        return ruta
+
+    def agregar(self, escenario:str, periodo:int, decisiones:Dict[str,Any], info:Dict[str,Any]=None):
+        """Todos los formularios de 'decisiones' ({'A1': ..., 'H1': ...}) de un escenario."""
+        self.escenario=escenario
+        rutas={form: getattr(self, f'export_{form}')(periodo, contenido) for form,contenido in decisiones.items()}
+        if info is not None:
+            rutas['manifest']=self.export_manifest(periodo, info)
+        return rutas
+
+    def cerrar(self):
+        if self.zip is None:
+            return
+        cabeceras={}
+        for formulario,tabla in self.tablas.items():
+            cabeceras[formulario]=tabla['cols']
+            columnas=[('escenario', tabla['escenario']), ('periodo', tabla['periodo'])]
+            columnas+=[(str(i), valores) for i,valores in enumerate(tabla['datos'])]
+            for nombre,valores in columnas:
+                with self.zip.open(f'columnas/{formulario}/{nombre}.npy','w') as f:
+                    np.lib.format.write_array(f, _columna(valores), allow_pickle=False)
+        self.zip.writestr(INDICE_BUNDLE, json.dumps({'columnar': self.columnar, 'cabeceras': cabeceras,
+                                                     'escenarios': self.indice}, ensure_ascii=False))
+        self.zip.close(); self._fichero.close()
+        self.zip=None
+
+
+def leer_indice(path:str)->Dict[str,Any]:
+    """indice.json de un bundle, con los periodos como enteros."""
+    with zipfile.ZipFile(path) as zf:
+        indice=json.loads(zf.read(INDICE_BUNDLE))
+    indice['escenarios']={esc: {int(per): forms for per,forms in periodos.items()}
+                          for esc,periodos in indice['escenarios'].items()}
+    return indice
+
+
+def extraer_escenario(path:str, escenario:str, out_dir:str, periodo:int=None)->List[str]:
+    """Escribe en out_dir los CSV estándar (A1_marketing_p6.csv...) de un escenario del bundle."""
+    indice=leer_indice(path)
+    if escenario not in indice['escenarios']:
+        raise KeyError(f"'{escenario}' no está en {path}")
+    os.makedirs(out_dir, exist_ok=True)
+    rutas, columnas=[], {}
+    with zipfile.ZipFile(path) as zf:
+        for per,forms in sorted(indice['escenarios'][escenario].items()):
+            if periodo is not None and per!=periodo:
+                continue
+            for formulario,entrada in forms.items():
+                ruta=os.path.join(out_dir, entrada['fichero'])
+                if 'miembro' in entrada:
+                    with open(ruta,'wb') as f:
+                        f.write(zf.read(entrada['miembro']))
+                else:
+                    if formulario not in columnas:
+                        cols=indice['cabeceras'][formulario]
+                        columnas[formulario]=[np.lib.format.read_array(zf.open(f'columnas/{formulario}/{i}.npy'))
+                                              for i in range(len(cols))]
+                    inicio,fin=entrada['filas']
+                    with open(ruta,'w',newline='',encoding='utf-8') as f:
+                        w=csv.writer(f); w.writerow(indice['cabeceras'][formulario])
+                        w.writerows(zip(*[c[inicio:fin].tolist() for c in columnas[formulario]]))
+                rutas.append(ruta)
+    return rutas
@@ -0,0 +1,174 @@
+"""
+Gacetas: ficheros JSON de cambios de reglas que se aplican sobre los valores por
+defecto de src/params.py (curso 2024-25), sin editar el código.
+
+    {
+      "version": "URJC-2025-26",
+      "overrides": {
+        "CAP_MAX": {"EU": {"X": 35000}},
+        "TRANSP_SUP": {"US,EU,X": 0.30},
+        "TOPE_BR_Y_LE3": 3800
+      }
+    }
+
+Las claves-tupla (transporte) se escriben separadas por comas. Solo se pueden cambiar
+tablas y claves que ya existen, y AREAS no (su orden es el de las columnas del LST).
+La gaceta se elige al arrancar con INTOPIA_GACETA. El resultado validado se guarda en
+disco con la huella (sha256) de defaults + gaceta + este módulo, así que las siguientes
+ejecuciones solo leen la caché.
+"""
+import os
+import json
+import copy
+import pickle
+import hashlib
+
+TABLAS = [
+    'AREAS', 'MONEDAS', 'TIPO_CAMBIO', 'CAP_MAX', 'CAPEX_PLANTA', 'COSTE_FIJO', 'DEPRE', 'PRECIOS_TIPICOS', 'SALTO_MIN',
+    'TOPE_BR_Y_LE3', 'TRANSP_SUP', 'TRANSP_AIR', 'PUNTOS_SUP', 'PUNTOS_AIR', 'ALMACEN_MIN',
+    'AR_STRUCTURE', 'AP_STRUCTURE', 'IMPUESTOS', 'INTERES_SALDO_POS', 'INTERES_SALDO_NEG_MENOR',
+    'INTERES_SALDO_NEG_MAYOR', 'SUMAS_CRITICAS', 'X_TO_Y',
+]
+VERSION_DEFECTO = '2024-25'
+CLAVES_GACETA = {'version', 'overrides'}
+# Orden fijo de áreas: columnas del LST, COL_MAP y src.compiled.Area dependen de él
+ORDEN_AREAS = ['US', 'EU', 'BR']
+DIR_CACHE = os.environ.get('INTOPIA_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'intopia_helper'))
+
+
+class GacetaError(ValueError):
+    pass
+
+
+def _clave(k, referencia):
+    # "US,EU,X" -> ('US','EU','X') si la tabla usa claves-tupla
+    if isinstance(k, str) and any(isinstance(r, tuple) for r in referencia):
+        return tuple(p.strip() for p in k.split(','))
+    return k
+
+
+def _fusionar(base, cambios, ruta):
+    """Copia de 'base' con 'cambios' encima, validando claves, tipos y formas."""
+    if isinstance(base, dict):
+        if not isinstance(cambios, dict):
+            raise GacetaError(f"{ruta}: se esperaba un objeto")
+        res = dict(base)
+        for k, v in cambios.items():
+            k = _clave(k, base)
+            if k not in base:
+                raise GacetaError(f"{ruta}: clave desconocida {k!r}")
+            res[k] = _fusionar(base[k], v, f"{ruta}[{k!r}]")
+        return res
+    if isinstance(base, list):
+        if not isinstance(cambios, list) or len(cambios) != len(base):
+            raise GacetaError(f"{ruta}: se esperaba una lista de {len(base)} elementos")
+        return [_fusionar(b, c, f"{ruta}[{i}]") for i, (b, c) in enumerate(zip(base, cambios))]
+    if isinstance(base, (int, float)) and not isinstance(base, bool):
+        if isinstance(cambios, bool) or not isinstance(cambios, (int, float)):
+            raise GacetaError(f"{ruta}: se esperaba un número, no {cambios!r}")
+        if cambios < 0:
+            raise GacetaError(f"{ruta}: valor negativo {cambios}")
+        return cambios
+    if type(cambios) is not type(base):
+        raise GacetaError(f"{ruta}: tipo {type(cambios).__name__} en lugar de {type(base).__name__}")
+    return cambios
+
+
+def validar(tablas):
+    """Reglas de coherencia entre tablas (se ejecuta una vez por contenido distinto)."""
+    if list(tablas['AREAS']) != ORDEN_AREAS:
+        raise GacetaError(f"AREAS: no se puede cambiar ni reordenar (debe ser {ORDEN_AREAS})")
+    for nombre in ('AR_STRUCTURE', 'AP_STRUCTURE'):
+        for area, reparto in tablas[nombre].items():
+            if abs(sum(reparto.values()) - 1.0) > 1e-9:
+                raise GacetaError(f"{nombre}[{area!r}]: los porcentajes de cobro/pago no suman 1")
+    for area, costes in tablas['COSTE_FIJO'].items():
+        for prod, tramos in costes.items():
+            if any(b < a for a, b in zip(tramos, tramos[1:])):
+                raise GacetaError(f"COSTE_FIJO[{area!r}][{prod!r}]: los tramos deben ser crecientes")
+    n = len(tablas['X_TO_Y'])
+    if any(len(fila) != n for fila in tablas['X_TO_Y']):
+        raise GacetaError("X_TO_Y debe ser cuadrada")
+    for nombre in ('INTERES_SALDO_POS', 'INTERES_SALDO_NEG_MENOR', 'INTERES_SALDO_NEG_MAYOR', 'IMPUESTOS'):
+        if any(v >= 1 for v in tablas[nombre].values()):
+            raise GacetaError(f"{nombre}: las tasas van en tanto por uno")
+    return tablas
+
+
+def huella(defaults, gaceta_bytes=b''):
+    h = hashlib.sha256(repr([(k, defaults[k]) for k in TABLAS]).encode('utf-8'))
+    # El código de fusión/validación también forma parte de la huella
+    with open(__file__, 'rb') as f:
+        h.update(f.read())
+    h.update(gaceta_bytes)
+    return h.hexdigest()
+
+
+def instantanea(espacio):
+    """Copia profunda de las tablas por defecto (antes de aplicar ninguna gaceta)."""
+    return {k: copy.deepcopy(espacio[k]) for k in TABLAS}
+
+
+def cargar_gaceta(defaults, path=None, dir_cache=DIR_CACHE):
+    """
+    Tablas efectivas (defaults + gaceta) y su versión 'nombre-huella'.
+    Usa la caché en disco si existe; si no, fusiona, valida y la escribe.
+    """
+    contenido = b''
+    if path:
+        with open(path, 'rb') as f:
+            contenido = f.read()
+    clave = huella(defaults, contenido)
+    cache = os.path.join(dir_cache, f'params_{clave}.pkl')
+    try:
+        with open(cache, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    nombre = VERSION_DEFECTO
+    tablas = {k: copy.deepcopy(defaults[k]) for k in TABLAS}
+    if path:
+        try:
+            gaceta = json.loads(contenido.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise GacetaError(f"{path}: JSON no válido ({e})")
+        if not isinstance(gaceta, dict):
+            raise GacetaError(f"{path}: se esperaba un objeto con {sorted(CLAVES_GACETA)}")
+        desconocidas = set(gaceta) - CLAVES_GACETA
+        if desconocidas:
+            raise GacetaError(f"{path}: claves desconocidas {sorted(desconocidas)} (solo {sorted(CLAVES_GACETA)})")
+        nombre = str(gaceta.get('version') or os.path.splitext(os.path.basename(path))[0])
+        for tabla, cambios in (gaceta.get('overrides') or {}).items():
+            if tabla not in tablas:
+                raise GacetaError(f"{path}: tabla desconocida {tabla!r}")
+            tablas[tabla] = _fusionar(tablas[tabla], cambios, tabla)
+    resultado = (validar(tablas), f"{nombre}-{clave[:12]}")
+
+    try:
+        os.makedirs(dir_cache, exist_ok=True)
+        tmp = f"{cache}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(resultado, f)
+        os.replace(tmp, cache)
+    except OSError:
+        pass  # Sin caché en disco: se recalcula en la próxima ejecución
+    return resultado
+
+
+def aplicar(espacio, defaults, path=None, dir_cache=DIR_CACHE):
+    """
+    Aplica la gaceta (sobre los defaults) al espacio de nombres de src.params, una sola
+    vez al importarlo. Devuelve la versión de parámetros.
+    """
+    tablas, version = cargar_gaceta(defaults, path, dir_cache)
+    for k, v in tablas.items():
+        actual = espacio[k]
+        if isinstance(actual, dict):
+            actual.clear()
+            actual.update(v)
+        elif isinstance(actual, list):
+            actual[:] = v
+        else:
+            espacio[k] = v
+    return version
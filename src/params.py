@@ -1,6 +1,8 @@
 # Parámetros (URJC 2024-25)
 AREAS = ['US','EU','BR']
 MONEDAS = {'US':'$','EU':'€','BR':'BRL','CM':'FS'}
+# FS por unidad de moneda local (tablas TIPO DE CAMBIO del LST); el parser da los del periodo
+TIPO_CAMBIO = {'US':2.0,'EU':3.0,'BR':0.32,'CM':1.0}
 
 # Capacidades por planta (unidades/trim)
 CAP_MAX = {'US':{'X':50000,'Y':25000}, 'EU':{'X':30000,'Y':18000}, 'BR':{'X':12000,'Y':9000}}
@@ -67,4 +69,15 @@ X_TO_Y = [
  [0,0,0,0,0,0,0,1,2,3],
  [0,0,0,0,0,0,0,0,1,2],
  [0,0,0,0,0,0,0,0,0,1],
-]
\ No newline at end of file
+]
+
+# --- Gaceta del curso: cambios de reglas sin editar este fichero (ver src/gazette.py) ---
+import os as _os
+from . import gazette as _gazette
+
+DEFAULTS = _gazette.instantanea(globals())
+GACETA = _os.environ.get('INTOPIA_GACETA') or None
+# Solo al arrancar: src.compiled, v3.cashflow y los 'from src.params import X' de escalares
+# se derivan al importarse, así que la gaceta no se cambia en caliente
+PARAMS_VERSION = _gazette.aplicar(globals(), DEFAULTS, GACETA)
+
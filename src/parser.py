@@ -1,4 +1,188 @@
+import os
 import re
+import glob
+from .params import AREAS
+from .profiling import medido
+from .state import TablaMercado, TablaPatentes
+
+
+def numero_decision(filepath):
+    # Nº de decisión a partir del nombre 'Decisión N...' (también la errata 'Descisión')
+    match = re.search(r'[Dd]e(?:s)?cisión (\d+)', os.path.basename(filepath))
+    return int(match.group(1)) if match else None
+
+
+def localizar_lsts(data_dir):
+    """
+    Ficheros de Decisión de data_dir ordenados por periodo.
+    Prioriza los '_fixed.txt' (generados por data/fix_files.py) si existen.
+    Devuelve (ficheros, usa_fixed).
+    """
+    files_fixed = [f for f in glob.glob(os.path.join(data_dir, '*_fixed.txt')) if numero_decision(f) is not None]
+    if files_fixed:
+        return sorted(files_fixed, key=numero_decision), True
+    files = (glob.glob(os.path.join(data_dir, 'Decisión [0-9]*.lst.txt')) +
+             glob.glob(os.path.join(data_dir, 'Descisión [0-9]*.lst.txt')))
+    return sorted(files, key=numero_decision), False
+
+
+# --- Eco de formularios ---
+# Códigos de los formularios: CHIP=X, PC=Y; áreas US=1, EU=2, BR=3 y casa matriz=4 (CM)
+PRODUCTO_ECO = {'CHIP': 'X', 'PC': 'Y'}
+FORMULARIOS_ECO = ('A1', 'A2', 'A3', 'A4', 'H1', 'H6')
+FORMULARIOS_LISTA = ('A3', 'H6')   # Varias filas por clave (transferencias, ventas industriales)
+_LINEA_FORM = re.compile(r'^\s+([AH]\d)\s+\d+\s+\S\s+(\d+)\.\s+(\d+)\.\s+(.*)$')
+
+
+def _area_eco(token):
+    codigo = int(float(token))
+    return AREAS[codigo - 1] if 1 <= codigo <= len(AREAS) else 'CM'
+
+
+def _fila_eco(form, area, toks):
+    """(producto, registro) de una fila del eco; toks empieza en el producto (A1, A2) o en el tipo (A3)."""
+    n = [float(t) for t in toks[1:]] if form in ('A1', 'A2') else None
+    if form == 'A1':
+        # Precio estándar, precio de lujo y publicidad (miles), como A1_marketing
+        return PRODUCTO_ECO[toks[0]], {'precios': (int(n[0]), int(n[1])), 'ad': n[2]}
+    if form == 'A2':
+        return PRODUCTO_ECO[toks[0]], {
+            'nuevas': int(n[0]), 'mejora_k': n[1], 'grado_inf': int(n[2]), 'prod_planta': n[3:6],
+            'grado_sup': int(n[6]), 'prod_planta_sup': n[7:10]}
+    if form == 'A3':
+        return None, {'area': area, 'tipo': toks[0], 'moneda': int(float(toks[1])), 'monto_k': float(toks[2]),
+                      'conversion': 'S' if toks[3] in ('SI', 'S') else 'N'}
+    raise ValueError(form)
+
+
+def parse_formularios(bloque):
+    """
+    Decisiones del eco 'FORMULARIOS DE DECISION' de un listado:
+    {(formulario, área, producto, periodo): registro}. Los registros usan las mismas claves
+    que DecisionAssembler / FormsExporter; A3 y H6 guardan la lista de filas de la clave.
+    Las filas de continuación (otro producto en A1/A2, otra transferencia en A3) heredan
+    el formulario y el área de la fila anterior. Las líneas que no se entienden se ignoran.
+    """
+    formularios = {}
+    actual = None   # (formulario, área, periodo) de la última fila con cabecera
+
+    def guardar(form, area, prod, per, registro):
+        if form in FORMULARIOS_LISTA:
+            formularios.setdefault((form, area, prod, per), []).append(registro)
+        else:
+            formularios[(form, area, prod, per)] = registro
+
+    for linea in bloque.splitlines():
+        m = _LINEA_FORM.match(linea)
+        try:
+            if m:
+                form, per, toks = m.group(1), int(m.group(2)), m.group(4).split()
+                actual = None
+                if form not in FORMULARIOS_ECO:
+                    continue
+                if form == 'H1':
+                    n = [float(t) for t in toks[:10]]
+                    guardar(form, None, None, per, {
+                        'I+D_X_kFS': n[0], 'I+D_Y_kFS': n[1], 'IM_monto_kFS': n[2],
+                        'IM_estudios': [int(i) for i in n[3:9] if i], 'dividendos_kFS': n[9]})
+                elif form == 'H6':
+                    # La compañía vendedora es el grupo 3 (la columna CIA del resto de formularios)
+                    area = _area_eco(toks[0])
+                    guardar(form, area, PRODUCTO_ECO[toks[7]], per, {
+                        'cia_vende': int(m.group(3)), 'area_vende': int(float(toks[0])),
+                        'cia_compra': int(float(toks[1])), 'area_compra': int(float(toks[2])),
+                        'contado': float(toks[3]), 'proximo': float(toks[4]), 'subsiguiente': float(toks[5]),
+                        'conversion': toks[6], 'producto': toks[7], 'grado': int(toks[8]),
+                        'unidades_k': float(toks[9]), 'moneda': int(float(toks[10])), 'precio': float(toks[11]),
+                        'via': toks[12], 'periodo': int(float(toks[13]))})
+                elif form == 'A4':
+                    area, n = _area_eco(toks[0]), [float(t) for t in toks[1:5]]
+                    guardar(form, area, None, per, {
+                        'precio_comp_x_std': n[0], 'precio_comp_x_lujo': n[1],
+                        'reserva_x_std_k': n[2], 'reserva_x_lujo_k': n[3],
+                        'prioridad_x': toks[5], 'prioridad_y': toks[6]})
+                else:
+                    area = _area_eco(toks[0])
+                    prod, registro = _fila_eco(form, area, toks[1:])
+                    guardar(form, area, prod, per, registro)
+                    actual = (form, area, per)
+            elif actual and linea.startswith(' ' * 20) and linea.split():
+                form, area, per = actual
+                prod, registro = _fila_eco(form, area, linea.split())
+                guardar(form, area, prod, per, registro)
+            else:
+                actual = None
+        except (ValueError, IndexError, KeyError):
+            actual = None
+    return formularios
+
+
+class IndiceDecisiones:
+    """
+    Decisiones propias de varios periodos (eco de formularios de cada LST parseado) por
+    (formulario, área, producto, periodo). Recuperar o comparar una decisión pasada es
+    un acceso a dict: get('A2', 'EU', 'X', 5), ultimo('A2', 'EU', 'X'), formulario('A1', 5).
+    """
+    def __init__(self, historicos=()):
+        self.registros = {}
+        self._ultimo = {}    # (formulario, área, producto) -> último periodo
+        self._claves = {}    # (formulario, periodo) -> [(área, producto)]
+        for datos in historicos:
+            self.agregar(datos.get('formularios', {}))
+
+    def agregar(self, formularios):
+        for (form, area, prod, per), registro in formularios.items():
+            if (form, area, prod, per) not in self.registros:
+                self._claves.setdefault((form, per), []).append((area, prod))
+            self.registros[(form, area, prod, per)] = registro
+            if per >= self._ultimo.get((form, area, prod), per):
+                self._ultimo[(form, area, prod)] = per
+
+    def get(self, formulario, area=None, producto=None, periodo=None, defecto=None):
+        """Registro de ese periodo (por defecto, el último en que se envió)."""
+        if periodo is None:
+            periodo = self._ultimo.get((formulario, area, producto))
+        return self.registros.get((formulario, area, producto, periodo), defecto)
+
+    def ultimo(self, formulario, area=None, producto=None, defecto=None):
+        return self.get(formulario, area, producto, None, defecto)
+
+    def periodos(self):
+        return sorted({per for _, per in self._claves})
+
+    def formulario(self, formulario, periodo):
+        """El formulario de ese periodo con la forma de DecisionAssembler.ensamblar (para reutilizarlo)."""
+        claves = self._claves.get((formulario, periodo), [])
+        regs = {clave: self.registros[(formulario, *clave, periodo)] for clave in claves}
+        if formulario == 'A1':
+            a1 = {(a, p, g): {'price': 0, 'ad': 0} for a in AREAS for p in PRODUCTO_ECO.values() for g in (0, 1)}
+            for (area, prod), r in regs.items():
+                for g in (0, 1):
+                    a1[(area, prod, g)] = {'price': r['precios'][g], 'ad': r['ad'] if r['precios'][g] else 0}
+            return a1
+        if formulario == 'A2':
+            a2 = {area: {'X': {}, 'Y': {}} for area in AREAS}
+            for (area, prod), r in regs.items():
+                # Las filas a cero del eco son productos sin decisión (DecisionAssembler deja {})
+                if r['nuevas'] or r['mejora_k'] or any(r['prod_planta']) or any(r['prod_planta_sup']):
+                    a2.setdefault(area, {})[prod] = r
+            return a2
+        if formulario in FORMULARIOS_LISTA:
+            return [fila for filas in regs.values() for fila in filas]
+        if formulario == 'A4':
+            return {area: r for (area, _), r in regs.items()}
+        return regs.get((None, None), {})
+
+    def diferencias(self, periodo, decisiones):
+        """{formulario: (enviado en periodo, nuevo)} de los formularios de 'decisiones' que cambian."""
+        cambios = {}
+        for form, nuevo in decisiones.items():
+            if form in FORMULARIOS_ECO:
+                anterior = self.formulario(form, periodo)
+                if anterior != nuevo:
+                    cambios[form] = (anterior, nuevo)
+        return cambios
+
 
 class LSTParser:
     def clean_content(self, content):
@@ -13,6 +197,7 @@ class LSTParser:
         content = re.sub(r'\n\d', '\n', content)
         return content
 
+    @medido('parse', lambda self, filepath: os.path.basename(filepath))
     def parse_file(self, filepath):
         parsed_data = {}
         try:
@@ -41,6 +226,20 @@ class LSTParser:
         # --- 1. BALANCE (Caja) ---
         # Busca desde "CAJA" hasta "CxC PERIODO" para capturar toda la fila(s)
         parsed_data['caja_total'] = get_last_number_in_block(r'CAJA', r'CxC', content)
+        # Misma fila por área en moneda local: US, EU, BR, CM y consolidado (FS)
+        match_caja = re.search(r'CAJA((?:\s+-?\d+\.){5})', content)
+        if match_caja:
+            caja = [float(v) for v in re.findall(r'(-?\d+)\.', match_caja.group(1))]
+            parsed_data['caja_area'] = dict(zip(AREAS + ['CM'], caja[:4]))
+
+        # --- 1b. TIPOS DE CAMBIO (FS por unidad de moneda local) ---
+        # Una tabla por moneda (DOLLAR, EURO, CRUZEIRO, SWISS FRANC); la columna LIECHTENST. da el cambio a FS
+        cambios = re.findall(r'TIPO\s+DE\s+CAMBIO((?:\s+\d*\.\d+){4})', content)
+        if len(cambios) >= 4:
+            parsed_data['tipo_cambio'] = {
+                moneda: float(re.findall(r'(\d*\.\d+)', fila)[3])
+                for moneda, fila in zip(AREAS + ['CM'], cambios[:4])
+            }
 
         # --- 2. ESTADO DE RESULTADOS (Beneficio) ---
         # Busca desde "UTILIDAD DEL PERIODO" hasta "DIVIDENDOS" o "A UTILIDADES"
@@ -79,8 +278,8 @@ class LSTParser:
                 if i_std[i] > 0: inventarios_detalle[keys_std[i]] = i_std[i]
                 if i_luj[i] > 0: inventarios_detalle[keys_lujo[i]] = i_luj[i]
 
-        parsed_data['ventas_propias'] = ventas_propias
-        parsed_data['inventarios_detalle'] = inventarios_detalle
+        parsed_data['ventas_propias'] = TablaMercado(ventas_propias)
+        parsed_data['inventarios_detalle'] = TablaMercado(inventarios_detalle)
 
         # --- 4. PATENTES ---
         match_pat = re.search(r'MAXIMO\s+GRADO\s+POSEIDO[\s\S]*?(\d+\.[\s\S]*?){6}', content)
@@ -93,7 +292,14 @@ class LSTParser:
                     ('EU','X'): g[2], ('EU','Y'): g[3],
                     ('BR','X'): g[4], ('BR','Y'): g[5]
                 }
-        parsed_data['patentes_poseidas'] = patentes_poseidas
+        parsed_data['patentes_poseidas'] = TablaPatentes(patentes_poseidas)
+
+        # --- 4b. PLANTAS PROPIAS (mismo orden de columnas que las patentes) ---
+        match_plantas = re.search(r'CANTIDAD\s+DE\s+PLANTAS((?:\s+\d+\.){6})', content)
+        if match_plantas:
+            n = [int(v) for v in re.findall(r'(\d+)\.', match_plantas.group(1))]
+            parsed_data['plantas'] = {(area, prod): n[2 * i + j] for i, area in enumerate(AREAS)
+                                      for j, prod in enumerate(('X', 'Y'))}
 
         # --- 5. CUOTA DE MERCADO (Asesoría 3) ---
         # Buscamos el bloque entre "VENTAS TOTALES:" y "ASESORIA NUMERO 28" (o "COMPAÑIA")
@@ -126,5 +332,14 @@ class LSTParser:
                     mercado_precios[nombre] = [float(p) for p in precios[:12]]
         
         parsed_data['mercado_precios'] = mercado_precios
-        
+
+        # --- 7. COMPAÑÍA PROPIA (cabecera de formularios) ---
+        match_cia = re.search(r'FORMULARIOS\s+DE\s+DECISION\s+PARA\s+LA\s+COMPA[NÑ¥]IA\s+NUMERO:\s+(\d+)', content)
+        if match_cia:
+            parsed_data['compania'] = int(match_cia.group(1))
+
+        # --- 8. ECO DE FORMULARIOS (decisiones propias del periodo) ---
+        match_forms = re.search(r'FORMULARIOS\s+DE\s+DECISION([\s\S]*?)(?:RESUMEN\s+DE\s+TRANSACCIONES|$)', content)
+        parsed_data['formularios'] = parse_formularios(match_forms.group(1)) if match_forms else {}
+
         return parsed_data
\ No newline at end of file
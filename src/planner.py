@@ -1,5 +1,11 @@
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
+import numpy as np
 from . import params
+from .compiled import PARAMS, Area, Producto
+from .parser import IndiceDecisiones
+
+GRADOS_MERCADO=(0,1)
+RANGO_PRECIOS=(0.8,1.4)   # Escala por defecto: fracción del precio típico (ajustado por grado)
 
 class Planner:
     def __init__(self, scenario:str='b2b'):
@@ -7,13 +13,47 @@ class Planner:
         self.scenario=scenario
 
     def _enforce_price(self, area:str, product:str, price:int, grade:int)->int:
-        step=params.SALTO_MIN[area][product]
+        step=int(PARAMS.SALTO_MIN[area,product])
         if area=='BR' and product=='Y' and grade<=3:
             price=min(price, params.TOPE_BR_Y_LE3)
-        base=params.PRECIOS_TIPICOS[area][product]
+        base=int(PARAMS.PRECIOS_TIPICOS[area,product])
         k=round((price-base)/step)
         return max(base+k*step, step)
 
+    def valid_price_mask(self, area:str, product:str, grade:int, prices)->np.ndarray:
+        """Máscara de precios admisibles: en la rejilla SALTO_MIN, >= un salto y con el tope de BR-Y."""
+        prices=np.asarray(prices, dtype=float)
+        step=PARAMS.SALTO_MIN[area,product]
+        ok=(np.mod(prices-PARAMS.PRECIOS_TIPICOS[area,product], step)==0) & (prices>=step)
+        if area=='BR' and product=='Y' and grade<=3:
+            ok&=prices<=params.TOPE_BR_Y_LE3
+        return ok
+
+    def price_ladders(self, bounds:Tuple[float,float]=RANGO_PRECIOS,
+                      overrides:Dict[tuple,Tuple[float,float]]=None)->Dict[tuple,np.ndarray]:
+        """
+        Todos los precios admisibles de los 12 mercados (área, producto, grado) de una vez.
+        bounds: fracción del precio típico (+10% por grado, como propose_A1); overrides:
+        límites absolutos (min, max) por mercado. Devuelve arrays enteros crecientes.
+        """
+        areas=[Area[a] for a in params.AREAS]
+        base=PARAMS.PRECIOS_TIPICOS.view(np.ndarray)[areas][:,:,None]            # (A,P,1)
+        step=PARAMS.SALTO_MIN.view(np.ndarray)[areas][:,:,None]
+        centro=base*(1+0.10*np.asarray(GRADOS_MERCADO))                           # (A,P,G)
+        lo=centro*bounds[0]; hi=centro*bounds[1]
+        for (a,p,g),(vmin,vmax) in (overrides or {}).items():
+            lo[Area[a],Producto[p],g]=vmin; hi[Area[a],Producto[p],g]=vmax
+        hi[Area.BR,Producto.Y,[g<=3 for g in GRADOS_MERCADO]]=np.minimum(hi[Area.BR,Producto.Y,:], params.TOPE_BR_Y_LE3)
+        lo=np.maximum(lo, step)
+
+        kmin=np.ceil((lo-base)/step); kmax=np.floor((hi-base)/step)
+        n=np.maximum(kmax-kmin+1, 0).astype(int)
+        rejilla=base[...,None]+(kmin[...,None]+np.arange(n.max()))*step[...,None]   # (A,P,G,K)
+        rejilla=rejilla.astype(int)
+        return {(a,p,g): rejilla[i,j,k,:n[i,j,k]]
+                for i,a in enumerate(params.AREAS) for j,p in enumerate(Producto.__members__)
+                for k,g in enumerate(GRADOS_MERCADO)}
+
     def propose_A1(self, state:Dict[str,Any])->Dict[tuple, Dict[str,int]]:
         decisions={}
         for area in params.AREAS:
@@ -40,17 +80,8 @@ class Planner:
     def _last_mejora_metodos(self, state)->int:
         last = self._last_period(state)
         if not last: return 0
-        forms = state['parsed'][last].get('FORMS',[])
-        for ln in forms:
-            if ln.strip().startswith('A2') and 'CHIP' in ln:
-                try:
-                    toks=ln.split()
-                    i=toks.index('CHIP')
-                    val=float(toks[i+2])
-                    return int(round(val))
-                except Exception:
-                    pass
-        return 0
+        a2 = IndiceDecisiones([state['parsed'][last]]).ultimo('A2','EU','X')
+        return int(round(a2['mejora_k'])) if a2 else 0
 
     def _last_period(self, state)->str:
         files=list(state['parsed'].keys())
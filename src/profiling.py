@@ -0,0 +1,128 @@
+"""
+Instrumentación por etapas: tiempo de pared, nº de llamadas y pico de memoria de cada
+tramo (parse por fichero, ajuste de demanda por mercado, build/solve por candidato,
+export por formulario...).
+
+    from src.profiling import tramo, medido
+    with tramo('parse', nombre_fichero): ...
+    @medido('export.A1')
+    def export_A1(...): ...
+
+Desactivada por defecto: tramo() devuelve un contexto nulo compartido y medido() solo
+comprueba un booleano, así que el coste sin activar es despreciable. Las etiquetas pueden
+ser funciones sin argumentos para no construir textos si no se mide.
+"""
+import json
+import time
+import functools
+import tracemalloc
+from contextlib import nullcontext
+
+ACTIVO = False
+_NULO = nullcontext()
+_agregado = {}     # nombre -> {'llamadas', 'segundos', 'pico_bytes'}
+_eventos = []      # Un evento por tramo (formato Trace Event de Chrome)
+_pila = []
+_t0 = 0.0
+
+
+class _Tramo:
+    __slots__ = ('nombre', 'etiqueta', 'inicio', 'memoria', 'pico')
+
+    def __init__(self, nombre, etiqueta):
+        self.nombre = nombre
+        self.etiqueta = etiqueta() if callable(etiqueta) else etiqueta
+
+    def __enter__(self):
+        memoria, pico = tracemalloc.get_traced_memory()
+        if _pila:
+            _pila[-1].pico = max(_pila[-1].pico, pico)
+        tracemalloc.reset_peak()
+        self.memoria, self.pico = memoria, memoria
+        _pila.append(self)
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duracion = time.perf_counter() - self.inicio
+        _pila.pop()
+        pico = max(tracemalloc.get_traced_memory()[1], self.pico)
+        if _pila:
+            _pila[-1].pico = max(_pila[-1].pico, pico)
+        pico_bytes = pico - self.memoria
+
+        a = _agregado.setdefault(self.nombre, {'llamadas': 0, 'segundos': 0.0, 'pico_bytes': 0})
+        a['llamadas'] += 1
+        a['segundos'] += duracion
+        a['pico_bytes'] = max(a['pico_bytes'], pico_bytes)
+        _eventos.append({
+            'name': self.nombre if self.etiqueta is None else f'{self.nombre}:{self.etiqueta}',
+            'cat': self.nombre.split('.')[0], 'ph': 'X', 'pid': 1, 'tid': 1,
+            'ts': round((self.inicio - _t0) * 1e6, 1), 'dur': round(duracion * 1e6, 1),
+            'args': {'pico_bytes': pico_bytes},
+        })
+        return False
+
+
+def tramo(nombre, etiqueta=None):
+    """Contexto que mide un tramo si la instrumentación está activa."""
+    if not ACTIVO:
+        return _NULO
+    return _Tramo(nombre, etiqueta)
+
+
+def medido(nombre, etiqueta=None):
+    """
+    Decorador equivalente a envolver la función en tramo(nombre); etiqueta, si se da,
+    recibe los mismos argumentos que la función (p.ej. lambda self: ...).
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not ACTIVO:
+                return funcion(*args, **kwargs)
+            with _Tramo(nombre, etiqueta(*args, **kwargs) if etiqueta else None):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def activar():
+    global ACTIVO, _t0
+    reiniciar()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _t0 = time.perf_counter()
+    ACTIVO = True
+
+
+def desactivar():
+    global ACTIVO
+    ACTIVO = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reiniciar():
+    _agregado.clear()
+    _eventos.clear()
+    _pila.clear()
+
+
+def resumen():
+    """{nombre: {'llamadas', 'segundos', 'pico_bytes'}} ordenado por tiempo total."""
+    return dict(sorted(_agregado.items(), key=lambda kv: -kv[1]['segundos']))
+
+
+def imprimir_resumen(salida=None):
+    print(f"{'tramo':<28}{'llamadas':>9}{'total ms':>11}{'media ms':>10}{'pico KiB':>10}", file=salida)
+    for nombre, a in resumen().items():
+        print(f"{nombre:<28}{a['llamadas']:>9}{a['segundos'] * 1000:>11.1f}"
+              f"{a['segundos'] * 1000 / a['llamadas']:>10.2f}{a['pico_bytes'] / 1024:>10.0f}", file=salida)
+
+
+def guardar_traza(path):
+    """Traza JSON (Trace Event de Chrome: chrome://tracing o Perfetto) con el resumen agregado."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': _eventos, 'displayTimeUnit': 'ms', 'resumen': resumen()}, f, indent=1)
+    return path
@@ -0,0 +1,159 @@
+"""
+Registros compactos del estado de una compañía.
+
+TablaMercado guarda las cantidades por (área, producto, grado) (inventarios, ventas) en un
+array de forma fija y TablaPatentes las de (área, producto); las dos se comportan como el
+dict que devolvía el parser (get, [], items, sum(values())...), incluido el orden y el repr,
+así que el resto del código no cambia. EstadoCompania es el estado normalizado que reciben
+OptimizerV3, el pre-filtro y el ranking.
+
+fork() devuelve una copia que comparte los arrays: la primera escritura en cualquiera de las
+dos los duplica (copy-on-write). Así un what-if (pacto, escenario) cuesta lo mismo que
+crear un objeto pequeño, en lugar de copiar el estado entero.
+"""
+from collections.abc import Mapping
+import numpy as np
+from .params import AREAS
+
+PRODUCTOS = ('X', 'Y')
+GRADOS = (0, 1)
+MERCADOS = tuple((a, p, g) for a in AREAS for p in PRODUCTOS for g in GRADOS)
+AREAS_PRODUCTO = tuple((a, p) for a in AREAS for p in PRODUCTOS)
+
+
+class TablaMercado(Mapping):
+    """
+    Mapping de claves fijas sobre un array. Solo 'contiene' las claves asignadas (máscara de
+    bits), que se recorren en el orden de CLAVES, igual que los dicts del parser.
+    Los valores enteros se guardan en int64; si se asigna un float no entero pasa a float64.
+    """
+    __slots__ = ('valores', '_mascara', '_propio')
+    CLAVES = MERCADOS
+    INDICE = {k: i for i, k in enumerate(MERCADOS)}
+
+    def __init__(self, datos=None):
+        self.valores = np.zeros(len(self.CLAVES), dtype=np.int64)
+        self._mascara = 0
+        self._propio = True
+        for k, v in (datos or {}).items():
+            self[k] = v
+
+    def __getitem__(self, clave):
+        i = self.INDICE[clave]
+        if not self._mascara >> i & 1:
+            raise KeyError(clave)
+        return self.valores[i].item()
+
+    def get(self, clave, defecto=None):
+        i = self.INDICE.get(clave)
+        if i is None or not self._mascara >> i & 1:
+            return defecto
+        return self.valores[i].item()
+
+    def __contains__(self, clave):
+        i = self.INDICE.get(clave)
+        return i is not None and bool(self._mascara >> i & 1)
+
+    def __iter__(self):
+        mascara = self._mascara
+        return (k for i, k in enumerate(self.CLAVES) if mascara >> i & 1)
+
+    def __len__(self):
+        return bin(self._mascara).count('1')
+
+    def __setitem__(self, clave, valor):
+        i = self.INDICE[clave]
+        if self.valores.dtype.kind == 'i' and not float(valor).is_integer():
+            self.valores, self._propio = self.valores.astype(np.float64), True
+        elif not self._propio:
+            self.valores, self._propio = self.valores.copy(), True
+        self.valores[i] = valor
+        self._mascara |= 1 << i
+
+    def sumar(self, clave, delta):
+        self[clave] = self.get(clave, 0) + delta
+
+    def total(self):
+        return self.valores.sum().item()
+
+    def fork(self):
+        copia = object.__new__(type(self))
+        copia.valores, copia._mascara = self.valores, self._mascara
+        copia._propio = self._propio = False
+        return copia
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        return (type(self), (dict(self.items()),))
+
+
+class TablaPatentes(TablaMercado):
+    """Grado de patente por (área, producto)."""
+    __slots__ = ()
+    CLAVES = AREAS_PRODUCTO
+    INDICE = {k: i for i, k in enumerate(AREAS_PRODUCTO)}
+
+
+def tabla(datos, clase=TablaMercado):
+    """datos como tabla compacta (sin copiar si ya lo es)."""
+    return datos if isinstance(datos, clase) else clase(datos)
+
+
+class EstadoCompania(Mapping):
+    """
+    Estado normalizado de la compañía con los campos fijos del dict que se usaba antes
+    (estado['beneficio'], estado.get('inventarios_detalle', {}), ...).
+    caja_area es la caja bruta por área en moneda local (fila CAJA del LST) y tipo_cambio
+    los FS por unidad de moneda local del periodo; None si el LST no los trae.
+    """
+    __slots__ = ('beneficio', 'liquidez', 'cuota', 'inventarios_total', 'inventarios_detalle', 'patentes_poseidas',
+                 'caja_area', 'tipo_cambio')
+    CAMPOS = __slots__
+
+    def __init__(self, beneficio=0.0, liquidez=0.0, cuota=0.0, inventarios_total=0.0,
+                 inventarios_detalle=None, patentes_poseidas=None, caja_area=None,
+                 tipo_cambio=None):
+        self.beneficio = beneficio
+        self.liquidez = liquidez
+        self.cuota = cuota
+        self.inventarios_total = inventarios_total
+        self.inventarios_detalle = tabla(inventarios_detalle)
+        self.patentes_poseidas = tabla(patentes_poseidas, TablaPatentes)
+        self.caja_area = caja_area
+        self.tipo_cambio = tipo_cambio
+
+    def __getitem__(self, campo):
+        if campo not in self.CAMPOS:
+            raise KeyError(campo)
+        return getattr(self, campo)
+
+    def get(self, campo, defecto=None):
+        return getattr(self, campo) if campo in self.CAMPOS else defecto
+
+    def __iter__(self):
+        return iter(self.CAMPOS)
+
+    def __len__(self):
+        return len(self.CAMPOS)
+
+    def fork(self, **cambios):
+        """Copia con 'cambios' aplicados; las tablas se comparten hasta que se modifican."""
+        copia = object.__new__(EstadoCompania)
+        copia.beneficio, copia.liquidez, copia.cuota = self.beneficio, self.liquidez, self.cuota
+        copia.inventarios_total = self.inventarios_total
+        copia.inventarios_detalle = self.inventarios_detalle.fork()
+        copia.patentes_poseidas = self.patentes_poseidas.fork()
+        copia.caja_area, copia.tipo_cambio = self.caja_area, self.tipo_cambio
+        for campo, valor in cambios.items():
+            if campo in ('inventarios_detalle', 'patentes_poseidas'):
+                valor = tabla(valor, TablaPatentes if campo == 'patentes_poseidas' else TablaMercado)
+            setattr(copia, campo, valor)
+        return copia
+
+    def __repr__(self):
+        return f"EstadoCompania({', '.join(f'{c}={getattr(self, c)!r}' for c in self.CAMPOS)})"
+
+    def __reduce__(self):
+        return (EstadoCompania, tuple(getattr(self, c) for c in self.CAMPOS))
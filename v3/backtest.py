@@ -0,0 +1,255 @@
+"""
+Backtest walk-forward del flujo de decisión: para cada periodo t se ajusta todo con los
+LST 1..t (demanda, calibración del ranking), se ejecuta la búsqueda de estrategias y se
+compara lo previsto con lo que mostró el LST t+1.
+
+    python -m v3.backtest                          # data/
+    python -m v3.backtest --data /tmp/liga --json outputs/backtest.json
+    python -m v3.backtest --db                     # reutiliza parses y soluciones del historial
+    python -m v3.backtest --bundle outputs/backtest.zip   # formularios de cada estrategia y periodo
+
+Errores por mercado (previsto - real):
+- demanda: recta de DemandEstimator al precio medio real de t+1 frente a las ventas proxy de t+1.
+- cuota: demanda prevista a nuestro precio real x CUOTA_OBJETIVO frente a nuestras ventas reales.
+- plan: ventas de la mejor estrategia frente a nuestras ventas reales.
+Y para el ranking, la puntuación prevista de la mejor estrategia frente al proxy (modelo
+calibrado sobre el estado real de t+1) y frente a la puntuación real del periodo t+1,
+(t+1)·R_{t+1} − t·R_t, ya que 'Ranking N.txt' es el promedio acumulado.
+
+Los periodos son independientes y se reparten entre procesos (como LeagueSimulator).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+PERIODOS_MINIMOS = 2        # LST necesarios antes del primer periodo evaluado
+PERIODOS_POR_PROCESO = 4    # Por debajo de esto no compensa arrancar procesos
+TIPOS = ('demanda', 'cuota', 'plan')
+
+
+def _ventas_plan(solucion):
+    ventas = {}
+    for k, v in (solucion or {}).items():
+        if k.startswith('ventas_'):
+            _, area, prod, grado = k.split('_')
+            ventas[(area, prod, int(grado))] = v
+    return ventas
+
+
+def _evaluar_periodo(args):
+    """
+    Un periodo del backtest. Función de módulo para poder enviarse a otros procesos;
+    devuelve {'periodo', 'errores': [(tipo, mercado, previsto, real)], 'ranking': {...}}.
+    El almacén de soluciones (db) solo está activo durante la llamada y se cierra al salir.
+    """
+    t, historicos, puntos, data_dir, db, con_decisiones = args
+    if not db:
+        return _evaluar(t, historicos, puntos, data_dir, con_decisiones)
+    from v3.store import HistoryStore
+    from v3.strategy import usar_almacen
+    with HistoryStore(db) as almacen:
+        usar_almacen(almacen)
+        try:
+            return _evaluar(t, historicos, puntos, data_dir, con_decisiones)
+        finally:
+            usar_almacen(None)
+
+
+def _evaluar(t, historicos, puntos, data_dir, con_decisiones):
+    from src.planner import Planner
+    from src.state import EstadoCompania
+    from v3.demand_estimator import DemandEstimator, COL_MAP
+    from v3.league import _num_compania
+    from v3.ranking import load_ranking_data, cargar_modelo_calibrado, estado_bruto, COMPANIA_PROPIA
+    from v3.strategy import find_best_strategy, CUOTA_OBJETIVO, COSTE_PUBLICIDAD_Y_EU
+    from v3.quickstart_v3 import configuraciones_estrategia
+    from v3.decisions import DecisionAssembler
+
+    entrenamiento, actual, siguiente = historicos[:t], historicos[t - 1], historicos[t]
+    modelo = cargar_modelo_calibrado(data_dir, entrenamiento)
+    estimador = DemandEstimator(entrenamiento, puntos_periodos=puntos[:t])
+
+    # --- Búsqueda de estrategias con el estado de t (como el quickstart) ---
+    norm = modelo.normalizar(*estado_bruto(actual))
+    patentes = actual.get('patentes_poseidas') or {('EU', 'X'): 0, ('EU', 'Y'): 0}
+    estado = EstadoCompania(norm['beneficio'], norm['liquidez'], norm['cuota'], norm['inventarios'],
+                            actual.get('inventarios_detalle'), patentes, actual.get('caja_area'),
+                            actual.get('tipo_cambio'))
+    mejor, decisiones = None, {}
+    for nombre, _, config in configuraciones_estrategia(Planner().price_ladders(), COSTE_PUBLICIDAD_Y_EU):
+        ranking, precios, solucion, _ = find_best_strategy(estado, patentes, estimador, config, modelo)
+        if mejor is None or ranking > mejor[1]:
+            mejor = (nombre, ranking, solucion)
+        if con_decisiones:
+            decisiones[nombre] = DecisionAssembler(patentes).ensamblar(solucion, precios, config)
+
+    # --- Errores por mercado frente al LST de t+1 ---
+    compania = siguiente.get('compania', COMPANIA_PROPIA)
+    precios_propios = next((p for nombre, p in siguiente.get('mercado_precios', {}).items()
+                            if _num_compania(nombre) == compania), [0.0] * 12)
+    ventas_reales = siguiente.get('ventas_propias', {})
+    ventas_plan = _ventas_plan(mejor[2])
+    errores = []
+    for mercado, col in COL_MAP.items():
+        modelo_demanda = estimador.get_demand_function(*mercado)
+        if mercado in estimador.modelos_demanda and mercado in puntos[t]:
+            precio, ventas = puntos[t][mercado]
+            errores.append(('demanda', mercado, modelo_demanda['interseccion'] + modelo_demanda['pendiente'] * precio,
+                            ventas))
+        if precios_propios[col] > 0:
+            demanda = max(modelo_demanda['interseccion'] + modelo_demanda['pendiente'] * precios_propios[col], 0)
+            errores.append(('cuota', mercado, demanda * CUOTA_OBJETIVO[mercado[2]], ventas_reales.get(mercado, 0)))
+        if mercado in ventas_plan or mercado in ventas_reales:
+            errores.append(('plan', mercado, ventas_plan.get(mercado, 0), ventas_reales.get(mercado, 0)))
+
+    # --- Ranking: previsto vs proxy del modelo y vs la puntuación del periodo t+1 ---
+    real = next((p['score_periodo'] for p in load_ranking_data(data_dir, historicos[:t + 1])
+                 if p['periodo'] == t + 1 and p['estado'] is not None), None)
+    return {
+        'periodo': t + 1, 'estrategia': mejor[0], 'decisiones': decisiones,
+        'errores': [(tipo, mercado, float(previsto), float(real_)) for tipo, mercado, previsto, real_ in errores],
+        'ranking': {'previsto': float(mejor[1]), 'proxy': float(modelo.score(modelo.normalizar(*estado_bruto(siguiente)))),
+                    'real': real},
+    }
+
+
+def metricas(resultados):
+    """{tipo: {mercado: {'n', 'mae', 'sesgo', 'mape'}}} y errores del ranking."""
+    por_mercado = {}
+    for res in resultados:
+        for tipo, mercado, previsto, real in res['errores']:
+            por_mercado.setdefault(tipo, {}).setdefault(tuple(mercado), []).append((previsto, real))
+
+    tablas = {}
+    for tipo in TIPOS:
+        tablas[tipo] = {}
+        for mercado, pares in sorted(por_mercado.get(tipo, {}).items()):
+            previsto, real = np.array(pares).T
+            error = previsto - real
+            positivos = real > 0
+            tablas[tipo][mercado] = {
+                'n': len(pares), 'mae': float(np.abs(error).mean()), 'sesgo': float(error.mean()),
+                'mape': float(np.abs(error[positivos] / real[positivos]).mean()) if positivos.any() else None,
+            }
+
+    ranking = {}
+    for referencia in ('proxy', 'real'):
+        pares = [(r['ranking']['previsto'], r['ranking'][referencia]) for r in resultados
+                 if r['ranking'][referencia] is not None and np.isfinite(r['ranking']['previsto'])]
+        if pares:
+            error = np.subtract(*np.array(pares).T)
+            ranking[referencia] = {'n': len(pares), 'mae': float(np.abs(error).mean()), 'sesgo': float(error.mean())}
+    return {'mercados': tablas, 'ranking': ranking}
+
+
+class WalkForwardBacktester:
+    """
+    Carga (y parsea una sola vez) los LST de data_dir y evalúa cada periodo t >= desde con
+    los datos hasta t. almacen: HistoryStore opcional para reutilizar parses y soluciones.
+    """
+    def __init__(self, data_dir=None, almacen=None, procesos=None, desde=PERIODOS_MINIMOS, con_decisiones=False):
+        self.data_dir = data_dir or os.path.join(os.getcwd(), 'data')
+        self.almacen = almacen
+        self.procesos = procesos
+        self.desde = max(desde, PERIODOS_MINIMOS)
+        self.con_decisiones = con_decisiones
+        self.decisiones = {}   # periodo -> {estrategia: formularios de DecisionAssembler}
+
+    def cargar(self):
+        from src.parser import localizar_lsts
+        from v3.demand_estimator import puntos_periodo
+        from v3.quickstart_v3 import QuickstartPipeline
+        self.files, _ = localizar_lsts(self.data_dir)
+        # Mismo parseo que el quickstart (con el historial, los LST ya vistos no se vuelven a parsear)
+        self.historicos = QuickstartPipeline(self.data_dir, almacen=self.almacen)._parsear(self.files)
+        self.puntos = [puntos_periodo(h) for h in self.historicos]
+        return self
+
+    def ejecutar(self):
+        """Resultados por periodo (ordenados) y sus métricas; con con_decisiones, también self.decisiones."""
+        if not hasattr(self, 'historicos'):
+            self.cargar()
+        db = self.almacen.path if self.almacen is not None else None
+        tareas = [(t, self.historicos[:t + 1], self.puntos[:t + 1], self.data_dir, db, self.con_decisiones)
+                  for t in range(self.desde, len(self.historicos))]
+        procesos = self.procesos
+        if procesos is None:
+            procesos = min(os.cpu_count() or 1, len(tareas)) if len(tareas) >= PERIODOS_POR_PROCESO else 1
+        if procesos > 1:
+            with ProcessPoolExecutor(max_workers=procesos) as pool:
+                self.resultados = list(pool.map(_evaluar_periodo, tareas))
+        else:
+            self.resultados = [_evaluar_periodo(tarea) for tarea in tareas]
+        self.decisiones = {res['periodo']: res.pop('decisiones') for res in self.resultados}
+        self.metricas = metricas(self.resultados)
+        return self.resultados, self.metricas
+
+
+def imprimir(resultados, tablas, salida=None):
+    for res in resultados:
+        r = res['ranking']
+        real = f"{r['real']:.4f}" if r['real'] is not None else '-'
+        print(f"P{res['periodo']}: {res['estrategia']} | ranking previsto {r['previsto']:.4f} "
+              f"proxy {r['proxy']:.4f} real {real}", file=salida)
+    for tipo, mercados in tablas['mercados'].items():
+        print(f"\n{tipo:<10}{'n':>4}{'MAE':>12}{'sesgo':>12}{'MAPE':>8}", file=salida)
+        for mercado, m in mercados.items():
+            mape = f"{m['mape']:.0%}" if m['mape'] is not None else '-'
+            print(f"{'-'.join(map(str, mercado)):<10}{m['n']:>4}{m['mae']:>12,.0f}{m['sesgo']:>12,.0f}{mape:>8}",
+                  file=salida)
+    for referencia, m in tablas['ranking'].items():
+        print(f"\nRanking vs {referencia}: n={m['n']} MAE {m['mae']:.4f} sesgo {m['sesgo']:+.4f}", file=salida)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Backtest walk-forward: ajusta con 1..t y compara con el LST t+1.')
+    ap.add_argument('--data', default=None, help='Carpeta con los LST (por defecto ./data)')
+    ap.add_argument('--desde', type=int, default=PERIODOS_MINIMOS, help='Primer periodo de entrenamiento evaluado')
+    ap.add_argument('--procesos', type=int, default=None, help='Procesos en paralelo (por defecto según nº de periodos)')
+    ap.add_argument('--db', nargs='?', const=os.path.join('outputs', 'historia.sqlite'),
+                    default=os.environ.get('INTOPIA_DB'), metavar='PATH',
+                    help='Historial SQLite (v3.store) para reutilizar parses y soluciones')
+    ap.add_argument('--json', default=None, help='Guarda resultados y métricas en este fichero')
+    ap.add_argument('--bundle', default=None, metavar='ZIP',
+                    help='Guarda los formularios de cada estrategia y periodo en un bundle (src.forms.BundleExporter)')
+    ap.add_argument('--columnar', action='store_true', help='Bundle en columnas .npy en lugar de CSV por formulario')
+    args = ap.parse_args(argv)
+
+    almacen = None
+    if args.db:
+        from v3.store import HistoryStore, temporada_de
+        almacen = HistoryStore(args.db, temporada=temporada_de(args.data))
+    t0 = time.perf_counter()
+    backtester = WalkForwardBacktester(args.data, almacen, args.procesos, args.desde, bool(args.bundle)).cargar()
+    if len(backtester.historicos) <= backtester.desde:
+        print(f"Hacen falta más de {backtester.desde} LST en {backtester.data_dir}")
+        return 1
+    resultados, tablas = backtester.ejecutar()
+    imprimir(resultados, tablas)
+    print(f"\n{len(resultados)} periodos en {time.perf_counter() - t0:.2f} s")
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'resultados': resultados,
+                       'metricas': {'mercados': {tipo: {'-'.join(map(str, k)): v for k, v in m.items()}
+                                                 for tipo, m in tablas['mercados'].items()},
+                                    'ranking': tablas['ranking']}}, f, indent=1)
+    if args.bundle:
+        from src.forms import BundleExporter
+        with BundleExporter(args.bundle, args.columnar) as bundle:
+            for periodo, por_estrategia in backtester.decisiones.items():
+                for nombre, decisiones in por_estrategia.items():
+                    bundle.agregar(nombre, periodo, decisiones)
+        print(f"Formularios de {len(backtester.decisiones)} periodos -> {args.bundle}")
+    if almacen is not None:
+        almacen.cerrar()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
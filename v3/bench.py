@@ -0,0 +1,148 @@
+"""
+Benchmarks sobre ligas sintéticas (v3.synthetic): LSTParser, DemandEstimator, barridos de
+OptimizerV3, FormsExporter y el quickstart completo, por tamaño de liga.
+
+    python -m v3.bench                         # compara con la línea base (si existe)
+    python -m v3.bench --guardar               # guarda la línea base
+    python -m v3.bench --tamanos 5x11,50x11,20x60 --repeticiones 5
+
+Cada medida es el mínimo de varias repeticiones. Se marca regresión si una etapa tarda
+más de (1 + tolerancia) veces su línea base y al menos MARGEN_MIN segundos más.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+BASELINE = os.path.join(os.getcwd(), 'outputs', 'bench', 'baseline.json')
+TAMANOS = ((5, 11), (20, 11), (10, 40))
+TOLERANCIA = 0.25
+MARGEN_MIN = 0.005
+PRECIOS_BARRIDO = 20   # Puntos de la escala de precios resueltos con OptimizerV3
+
+
+def _cronometrar(funcion, repeticiones):
+    """Mínimo de 'repeticiones' tiempos de funcion() y su último resultado."""
+    mejor, resultado = float('inf'), None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, resultado
+
+
+def _limpiar_caches():
+    # Las cachés en memoria falsearían las repeticiones
+    from v3 import ranking, strategy
+    ranking._cache_calibracion.clear()
+    strategy._cache_soluciones.clear()
+
+
+def medir_liga(periodos, companias, repeticiones=3, semilla=0):
+    """Segundos por etapa para una liga sintética de periodos x companias."""
+    from src.parser import LSTParser, localizar_lsts
+    from src.forms import FormsExporter
+    from src.planner import Planner
+    from v3.synthetic import SyntheticLeague
+    from v3.demand_estimator import DemandEstimator
+    from v3.ranking import estado_bruto, cargar_modelo_calibrado
+    from v3.strategy import optimizador_estrategia
+    from v3.decisions import DecisionAssembler, exportar_decisiones
+    from v3.quickstart_v3 import QuickstartPipeline
+
+    tiempos = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, out_dir = os.path.join(tmp, 'data'), os.path.join(tmp, 'forms')
+        SyntheticLeague(periodos, companias, semilla=semilla).generar(data_dir)
+        files, _ = localizar_lsts(data_dir)
+
+        parser = LSTParser()
+        tiempos['parse'], historicos = _cronometrar(lambda: [parser.parse_file(f) for f in files], repeticiones)
+        tiempos['demand'], estimador = _cronometrar(lambda: DemandEstimator(historicos), repeticiones)
+
+        # Barrido de precios resuelto siempre con CBC (sin pre-filtro) para medir el MILP
+        modelo = cargar_modelo_calibrado(data_dir, historicos)
+        beneficio, liquidez, cuota, inventarios = estado_bruto(historicos[-1])
+        norm = modelo.normalizar(beneficio, liquidez, cuota, inventarios)
+        estado = {'beneficio': norm['beneficio'], 'liquidez': norm['liquidez'], 'cuota': norm['cuota'],
+                  'inventarios_detalle': historicos[-1].get('inventarios_detalle', {}),
+                  'inventarios_total': norm['inventarios'], 'patentes_poseidas': {('EU', 'X'): 1, ('EU', 'Y'): 1}}
+        config = {'production_config': {('EU', 'X'): 0, ('EU', 'Y'): 0}}
+        escala = Planner().price_ladders()[('EU', 'Y', 0)][:PRECIOS_BARRIDO]
+        demanda = estimador.get_demand_function('EU', 'Y', 0)
+
+        def barrido():
+            soluciones = []
+            for precio in escala:
+                cond = {('EU', 'Y', 0): {'precio': precio,
+                                         'demanda': max(int(demanda['interseccion'] + demanda['pendiente'] * precio), 0)}}
+                opt = optimizador_estrategia(estado, estado['patentes_poseidas'], config, cond,
+                                             ranking_model=modelo)
+                soluciones.append(opt.solve())
+            return soluciones
+        tiempos['optimizer'], soluciones = _cronometrar(barrido, repeticiones)
+
+        exporter = FormsExporter(out_dir)
+        ensamblador = DecisionAssembler(estado['patentes_poseidas'])
+        tiempos['forms'], _ = _cronometrar(lambda: exportar_decisiones(exporter, periodos + 1, ensamblador.ensamblar(
+            soluciones[0], {('EU', 'Y', 0): escala[0]}, config)), repeticiones)
+
+        def extremo_a_extremo():
+            _limpiar_caches()
+            with contextlib.redirect_stdout(io.StringIO()):
+                QuickstartPipeline(data_dir, out_dir, interactivo=False).run('export')
+        tiempos['e2e'], _ = _cronometrar(extremo_a_extremo, repeticiones)
+    return tiempos
+
+
+def comparar(actual, base, tolerancia=TOLERANCIA):
+    """Lista de (caso, etapa, base, actual) que empeoran más de la tolerancia."""
+    regresiones = []
+    for caso, etapas in actual.items():
+        for etapa, t in etapas.items():
+            t0 = base.get(caso, {}).get(etapa)
+            if t0 is not None and t > t0 * (1 + tolerancia) and t - t0 > MARGEN_MIN:
+                regresiones.append((caso, etapa, t0, t))
+    return regresiones
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Benchmarks de INTOPIA helper sobre ligas sintéticas.')
+    ap.add_argument('--tamanos', default=','.join(f'{p}x{c}' for p, c in TAMANOS),
+                    help='Ligas a medir como PERIODOSxCOMPAÑIAS separadas por comas')
+    ap.add_argument('--repeticiones', type=int, default=3)
+    ap.add_argument('--baseline', default=BASELINE, help='Fichero JSON de línea base')
+    ap.add_argument('--guardar', action='store_true', help='Guarda los resultados como nueva línea base')
+    ap.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    args = ap.parse_args(argv)
+
+    resultados = {}
+    for tamano in args.tamanos.split(','):
+        periodos, companias = (int(x) for x in tamano.lower().split('x'))
+        resultados[tamano] = medir_liga(periodos, companias, args.repeticiones)
+        print(f"{tamano:>8}: " + '  '.join(f"{k} {v * 1000:8.1f} ms" for k, v in resultados[tamano].items()))
+
+    base = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            base = json.load(f)
+    regresiones = comparar(resultados, base, args.tolerancia)
+    for caso, etapa, t0, t in regresiones:
+        print(f"REGRESIÓN {caso} {etapa}: {t0 * 1000:.1f} ms -> {t * 1000:.1f} ms (+{(t / t0 - 1):.0%})")
+    if base and not regresiones:
+        print(f"Sin regresiones respecto a {args.baseline}")
+
+    if args.guardar:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({**base, **resultados}, f, indent=2)
+        print(f"Línea base guardada en {args.baseline}")
+    return 1 if regresiones else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Bundles de formularios (src.forms.BundleExporter): todos los formularios de muchos
+escenarios y periodos en un solo zip, con índice por escenario, periodo y formulario.
+
+    python -m v3.backtest --data /tmp/liga --bundle outputs/backtest.zip [--columnar]
+    python -m v3.bundle indice outputs/backtest.zip
+    python -m v3.bundle extraer outputs/backtest.zip "No hacer nada" --periodo 6 --out outputs/forms
+
+extraer deja los CSV estándar (A1_marketing_p6.csv, ...) igual que FormsExporter.
+"""
+import os
+import sys
+import argparse
+
+from src.forms import leer_indice, extraer_escenario
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Consulta o extrae escenarios de un bundle de formularios.')
+    sub = ap.add_subparsers(dest='orden', required=True)
+    p_indice = sub.add_parser('indice', help='Escenarios, periodos y formularios del bundle')
+    p_indice.add_argument('bundle')
+    p_extraer = sub.add_parser('extraer', help='Escribe los CSV estándar de un escenario')
+    p_extraer.add_argument('bundle')
+    p_extraer.add_argument('escenario')
+    p_extraer.add_argument('--periodo', type=int, default=None, help='Solo este periodo (por defecto todos)')
+    p_extraer.add_argument('--out', default=os.path.join('outputs', 'forms'), help='Carpeta de destino')
+    args = ap.parse_args(argv)
+
+    if not os.path.exists(args.bundle):
+        print(f"No existe {args.bundle}")
+        return 1
+    if args.orden == 'indice':
+        indice = leer_indice(args.bundle)
+        print(f"{args.bundle} ({'columnas' if indice['columnar'] else 'filas'}): {len(indice['escenarios'])} escenarios")
+        for escenario, periodos in indice['escenarios'].items():
+            formularios = sorted({f for forms in periodos.values() for f in forms})
+            print(f"  {escenario}: periodos {min(periodos)}-{max(periodos)} | {', '.join(formularios)}")
+        return 0
+    try:
+        rutas = extraer_escenario(args.bundle, args.escenario, args.out, args.periodo)
+    except KeyError as e:
+        print(e.args[0])
+        return 1
+    for ruta in rutas:
+        print(f"-> {ruta}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
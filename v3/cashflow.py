@@ -0,0 +1,104 @@
+import numpy as np
+from src.params import AREAS, AR_STRUCTURE, AP_STRUCTURE, TIPO_CAMBIO
+from src.compiled import PARAMS
+
+# Tablas por área (orden de AREAS) para operar en bloque
+COBRO = PARAMS.AR.view(np.ndarray)
+PAGO = PARAMS.AP.view(np.ndarray)
+TASA_POS = PARAMS.INTERES_SALDO_POS[:len(AREAS)].view(np.ndarray)
+TASA_NEG_MENOR = PARAMS.INTERES_SALDO_NEG_MENOR[:len(AREAS)].view(np.ndarray)
+TASA_NEG_MAYOR = PARAMS.INTERES_SALDO_NEG_MAYOR[:len(AREAS)].view(np.ndarray)
+SUMA_CRITICA = PARAMS.SUMAS_CRITICAS.view(np.ndarray) * 1000.0  # Gaceta en miles
+TASA_IMPUESTO = PARAMS.IMPUESTOS[:len(AREAS)].view(np.ndarray)
+
+# Fracciones cobradas / pagadas al contado en el mismo periodo (coeficientes lineales
+# de liquidez que comparten OptimizerV3, el pre-filtro y la simulación de liga)
+COBRO_CONTADO = {a: AR_STRUCTURE[a]['cash'] for a in AREAS}
+PAGO_CONTADO = {a: AP_STRUCTURE[a]['cash'] for a in AREAS}
+
+
+def intereses(saldo):
+    """Interés del periodo sobre el saldo de caja por área (..., A): positivo cobra, negativo paga por tramos."""
+    saldo = np.asarray(saldo, dtype=float)
+    deuda = np.maximum(-saldo, 0.0)
+    tramo_menor = np.minimum(deuda, SUMA_CRITICA)
+    return (TASA_POS * np.maximum(saldo, 0.0)
+            - TASA_NEG_MENOR * tramo_menor
+            - TASA_NEG_MAYOR * (deuda - tramo_menor))
+
+
+class CashFlowEngine:
+    """
+    Proyección de caja, CxC y CxP por área sobre varios periodos, en bloque para S escenarios.
+
+    Entradas por periodo (difundibles a (S, T, A)): ventas y costes variables en moneda
+    local, que se cobran/pagan según AR_STRUCTURE / AP_STRUCTURE (contado, próximo,
+    subsiguiente), costes al contado (fijos, almacén, publicidad...) y el coste de las
+    existencias vendidas, que solo resta beneficio (se pagó al producirlas).
+    Cada periodo: intereses sobre el saldo inicial (tramos de SUMAS_CRITICAS) e impuestos
+    de IMPUESTOS sobre el beneficio positivo, pagados en el mismo periodo.
+    caja_inicial va por área en moneda local (fila CAJA del LST, 'caja_area'); 'liquidez'
+    se da en FS con tipo_cambio, más la caja de casa matriz (sin flujos propios).
+    """
+    def __init__(self, caja_inicial=0.0, cxc_inicial=None, cxp_inicial=None, tipo_cambio=None, caja_matriz=0.0):
+        A = len(AREAS)
+        tipo_cambio = tipo_cambio or TIPO_CAMBIO
+        self.cambio = np.array([tipo_cambio[a] for a in AREAS], dtype=float)
+        self.caja_matriz = float(caja_matriz)
+        # Un escalar es caja consolidada en FS: se reparte por igual y se pasa a moneda local
+        caja_inicial = np.asarray(caja_inicial, dtype=float)
+        self.caja_inicial = caja_inicial / A / self.cambio if caja_inicial.ndim == 0 else caja_inicial
+        # CxC / CxP pendientes: columna 0 vence el próximo periodo, columna 1 el siguiente
+        self.cxc_inicial = np.zeros((A, 2)) if cxc_inicial is None else np.asarray(cxc_inicial, dtype=float)
+        self.cxp_inicial = np.zeros((A, 2)) if cxp_inicial is None else np.asarray(cxp_inicial, dtype=float)
+
+    def proyectar(self, ventas, costes_variables=0.0, costes_contado=0.0, coste_existencias=0.0, cobro=None):
+        """
+        Entradas (A,), (T, A) o (S, T, A). Devuelve arrays (S, T, A) y 'liquidez' (S, T) en FS.
+        cobro: fracciones (contado, próximo, subsiguiente) de las ventas, (A, 3) o (S, A, 3);
+        por defecto las de AR_STRUCTURE (p.ej. las condiciones de pago de un contrato H6).
+        """
+        arrays = np.broadcast_arrays(np.asarray(ventas, dtype=float), np.asarray(costes_variables, dtype=float),
+                                     np.asarray(costes_contado, dtype=float), np.asarray(coste_existencias, dtype=float),
+                                     np.zeros(len(AREAS)))
+        ventas, cv, fijos, existencias = (x.reshape((-1,) + x.shape[-2:]) if x.ndim >= 2 else x.reshape(1, 1, -1)
+                                          for x in arrays[:4])
+        S, T, A = ventas.shape
+        cobro = COBRO if cobro is None else np.broadcast_to(np.asarray(cobro, dtype=float), (S, A, 3))
+
+        caja = np.broadcast_to(self.caja_inicial, (S, A)).copy()
+        cxc = np.broadcast_to(self.cxc_inicial, (S, A, 2)).copy()
+        cxp = np.broadcast_to(self.cxp_inicial, (S, A, 2)).copy()
+        res = {k: np.zeros((S, T, A)) for k in ('caja', 'cxc', 'cxp', 'intereses', 'impuestos', 'beneficio', 'flujo')}
+
+        for t in range(T):
+            interes = intereses(caja)
+            cobros = ventas[:, t] * cobro[..., 0] + cxc[:, :, 0]
+            pagos = cv[:, t] * PAGO[:, 0] + cxp[:, :, 0] + fijos[:, t]
+            beneficio = ventas[:, t] - cv[:, t] - fijos[:, t] - existencias[:, t] + interes
+            impuesto = TASA_IMPUESTO * np.maximum(beneficio, 0.0)
+
+            cxc = np.stack([cxc[:, :, 1] + ventas[:, t] * cobro[..., 1], ventas[:, t] * cobro[..., 2]], axis=-1)
+            cxp = np.stack([cxp[:, :, 1] + cv[:, t] * PAGO[:, 1], cv[:, t] * PAGO[:, 2]], axis=-1)
+            flujo = cobros - pagos + interes - impuesto
+            caja = caja + flujo
+
+            res['caja'][:, t] = caja
+            res['cxc'][:, t] = cxc.sum(axis=-1)
+            res['cxp'][:, t] = cxp.sum(axis=-1)
+            res['intereses'][:, t] = interes
+            res['impuestos'][:, t] = impuesto
+            res['beneficio'][:, t] = beneficio - impuesto
+            res['flujo'][:, t] = flujo
+        res['liquidez'] = (res['caja'] * self.cambio).sum(axis=-1) + self.caja_matriz
+        return res
+
+
+def liquidez_periodo(ingresos, costes_variables=0.0, costes_contado=0.0):
+    """
+    Efecto lineal en caja de un periodo (sin intereses ni impuestos), por área en el
+    último eje: lo que usan los modelos lineales como término de liquidez.
+    """
+    return (np.asarray(ingresos, dtype=float) * COBRO[:, 0]
+            - np.asarray(costes_variables, dtype=float) * PAGO[:, 0]
+            - np.asarray(costes_contado, dtype=float)).sum(axis=-1)
@@ -0,0 +1,164 @@
+import numpy as np
+from src.params import PRECIOS_TIPICOS, SALTO_MIN
+from v3.demand_estimator import COL_MAP
+from v3.league import ELASTICIDAD_CUOTA, PRECIO_TIPICO_COL, COSTE_VAR_COL, _num_compania
+from v3.ranking import COMPANIA_PROPIA
+
+# Priors de la reacción cuando hay pocos datos (ridge hacia estos valores)
+ALFA_PRIOR = 0.3      # Fracción del hueco con el precio de los rivales que se cierra cada periodo
+BETA_PRIOR = 0.1      # Fracción del hueco con el precio típico que se cierra cada periodo
+REGULARIZACION = 2.0
+
+COLUMNAS = [k for k, _ in sorted(COL_MAP.items(), key=lambda kv: kv[1])]
+
+
+def historial_precios(historicos_parseados, compania_propia=None):
+    """Tensor (T, C, 12) de precios de Asesoría 28 y lista de compañías."""
+    companias = set()
+    for data in historicos_parseados:
+        companias |= {_num_compania(k) for k in (data or {}).get('mercado_precios', {})}
+    if compania_propia is not None:
+        companias.add(compania_propia)
+    companias = sorted(c for c in companias if c is not None)
+    H = np.zeros((len(historicos_parseados), len(companias), 12))
+    for t, data in enumerate(historicos_parseados):
+        for nombre, precios in (data or {}).get('mercado_precios', {}).items():
+            H[t, companias.index(_num_compania(nombre))] = precios[:12]
+    return H, companias
+
+
+def _referencia(P):
+    """Precio medio de los OTROS vendedores activos en cada columna (..., C, 12)."""
+    activo = P > 0
+    suma = (P * activo).sum(axis=-2, keepdims=True) - P * activo
+    n = activo.sum(axis=-2, keepdims=True) - activo
+    return np.where(n > 0, suma / np.where(n > 0, n, 1), 0.0)
+
+
+class CompetitorModel:
+    """
+    Reacción de precios por compañía aprendida del histórico de Asesoría 28:
+        p[t+1] / p[t] - 1 = alfa_i * (ref[t] / p[t] - 1) + beta_i * (tipico / p[t] - 1)
+    con ref = precio medio de los demás vendedores activos en la misma columna.
+    Se ajusta por mínimos cuadrados (ridge hacia los priors) para todas las
+    compañías a la vez, resolviendo un sistema 2x2 apilado.
+    """
+    def __init__(self, historicos_parseados, compania_propia=None):
+        ultimo = historicos_parseados[-1] if historicos_parseados else {}
+        self.compania_propia = compania_propia or (ultimo or {}).get('compania', COMPANIA_PROPIA)
+        self.H, self.companias = historial_precios(historicos_parseados, self.compania_propia)
+        self.idx_propio = self.companias.index(self.compania_propia)
+        self.alfa, self.beta, self.observaciones = self._ajustar()
+
+    def _ajustar(self):
+        H = self.H
+        C = H.shape[1]
+        if H.shape[0] < 2:
+            return np.full(C, ALFA_PRIOR), np.full(C, BETA_PRIOR), np.zeros(C, dtype=int)
+        ref = _referencia(H[:-1])
+        p0, p1 = H[:-1], H[1:]
+        valido = (p0 > 0) & (p1 > 0) & (ref > 0)
+        base = np.where(p0 > 0, p0, 1)
+        x = np.where(valido, ref / base - 1, 0.0)
+        z = np.where(valido, PRECIO_TIPICO_COL / base - 1, 0.0)
+        y = np.where(valido, p1 / base - 1, 0.0)
+        w = valido.astype(float)
+
+        # Ecuaciones normales por compañía (sumando periodos y columnas) + ridge
+        sxx = (w * x * x).sum(axis=(0, 2)) + REGULARIZACION
+        sxz = (w * x * z).sum(axis=(0, 2))
+        szz = (w * z * z).sum(axis=(0, 2)) + REGULARIZACION
+        sxy = (w * x * y).sum(axis=(0, 2)) + REGULARIZACION * ALFA_PRIOR
+        szy = (w * z * y).sum(axis=(0, 2)) + REGULARIZACION * BETA_PRIOR
+        A = np.stack([np.stack([sxx, sxz], -1), np.stack([sxz, szz], -1)], -2)
+        b = np.stack([sxy, szy], -1)
+        sol = np.linalg.solve(A, b[..., None])[..., 0]
+        alfa = np.clip(sol[:, 0], 0.0, 1.0)
+        beta = np.clip(sol[:, 1], 0.0, 1.0)
+        # alfa + beta <= 1: la reacción no sobrepasa el objetivo (iteración contractiva)
+        exceso = np.maximum(alfa + beta, 1.0)
+        return alfa / exceso, beta / exceso, w.sum(axis=(0, 2)).astype(int)
+
+    def reaccion(self, P):
+        """Un paso de reacción de todos los rivales a la vez; P: (C, 12)."""
+        ref = _referencia(P)
+        activo = P > 0
+        nuevo = (P + self.alfa[:, None] * np.where(ref > 0, ref - P, 0.0)
+                 + self.beta[:, None] * (PRECIO_TIPICO_COL - P))
+        return np.where(activo, np.maximum(nuevo, 0.0), 0.0)
+
+
+def rejilla_precios(area, prod, ancho=0.5):
+    """Precios candidatos en pasos de SALTO_MIN alrededor del precio típico."""
+    base = PRECIOS_TIPICOS[area][prod]
+    step = SALTO_MIN[area][prod]
+    k = int(base * ancho / step)
+    return base + step * np.arange(-k, k + 1, dtype=float)
+
+
+class PriceEquilibrium:
+    """
+    Iteración de mejor respuesta entre nosotros y los rivales.
+    En cada ronda elegimos, por columna, el precio de la rejilla que maximiza
+    margen * unidades (demanda total del DemandEstimator repartida por atractivo
+    de precio); después todos los rivales reaccionan con CompetitorModel.
+    """
+    def __init__(self, competidores, estimador, mercados=None):
+        self.competidores = competidores
+        self.estimador = estimador
+        P0 = competidores.H[-1].copy() if competidores.H.shape[0] else np.zeros((len(competidores.companias), 12))
+        self.P0 = P0
+        if mercados is None:
+            activos = (P0 > 0).any(axis=0)
+            mercados = [COLUMNAS[j] for j in range(12) if activos[j]]
+        self.mercados = list(mercados)
+        self.cols = np.array([COL_MAP[m] for m in self.mercados], dtype=int)
+
+        # Rejillas y modelos de demanda por columna, precalculados
+        self.rejillas = [rejilla_precios(area, prod) for area, prod, _ in self.mercados]
+        modelos = [estimador.get_demand_function(*m) for m in self.mercados]
+        self.pendiente = np.array([m['pendiente'] for m in modelos], dtype=float)
+        self.interseccion = np.array([m['interseccion'] for m in modelos], dtype=float)
+
+    def _mejor_respuesta(self, P):
+        i = self.competidores.idx_propio
+        precios = np.zeros(12)
+        for k, (j, rejilla) in enumerate(zip(self.cols, self.rejillas)):
+            rivales = np.delete(P[:, j], i)
+            rivales = rivales[rivales > 0]
+            atractivo_riv = ((PRECIO_TIPICO_COL[j] / rivales) ** ELASTICIDAD_CUOTA).sum()
+            atractivo = (PRECIO_TIPICO_COL[j] / rejilla) ** ELASTICIDAD_CUOTA
+            medio = (rivales.sum() + rejilla) / (len(rivales) + 1)
+            demanda = np.maximum(self.interseccion[k] + self.pendiente[k] * medio, 0.0)
+            unidades = demanda * atractivo / (atractivo + atractivo_riv)
+            beneficio = (rejilla - COSTE_VAR_COL[j]) * unidades
+            mejor = int(np.argmax(beneficio))
+            if beneficio[mejor] > 0:
+                precios[j] = rejilla[mejor]
+        return precios
+
+    def resolver(self, max_iter=200, tol=1e-3):
+        P = self.P0.copy()
+        i = self.competidores.idx_propio
+        convergido = False
+        for it in range(1, max_iter + 1):
+            anterior = P.copy()
+            P[i] = self._mejor_respuesta(P)
+            reaccion = self.competidores.reaccion(P)
+            reaccion[i] = P[i]
+            P = reaccion
+            cambio = np.abs(P - anterior) / np.maximum(PRECIO_TIPICO_COL, 1e-9)
+            if cambio.max() < tol:
+                convergido = True
+                break
+
+        asentado = {}
+        for m, j in zip(self.mercados, self.cols):
+            rivales = np.delete(P[:, j], i)
+            actuales = self.P0[:, j]
+            asentado[m] = {
+                'precio_propio': float(P[i, j]),
+                'precio_medio_rivales': float(rivales[rivales > 0].mean()) if (rivales > 0).any() else 0.0,
+                'precio_medio_actual': float(actuales[actuales > 0].mean()) if (actuales > 0).any() else 0.0,
+            }
+        return {'precios': P, 'mercados': asentado, 'iteraciones': it, 'convergido': convergido}
@@ -0,0 +1,158 @@
+import math
+import numpy as np
+from src.params import AREAS, CAP_MAX, COSTE_FIJO
+from src.planner import Planner
+from v3.portfolio import codigo_area
+from v3.strategy import COSTE_ID_X, COSTE_ID_Y
+
+GRADOS = (0, 1)
+PLANTAS_POR_AREA = 3   # Columnas de producción por grado en A2
+
+
+class DecisionAssembler:
+    """
+    Convierte la solución ya resuelta de una estrategia (OptimizerV3 o pre-filtro) en los
+    cinco formularios A1, A2, A3, A4 y H1 de una sola pasada, sin volver a resolver.
+
+    - A2: la producción de cada (área, producto) se reparte llenando plantas a CAP_MAX, con
+      el menor número de plantas activas (tramo más barato de COSTE_FIJO); si no caben en
+      las plantas propias, se piden plantas nuevas. La mejora de métodos se mantiene en
+      lo último enviado (mejora_k por (área, producto)).
+    - A3: transferencias desde casa matriz a las áreas cuya caja proyectada
+      (CashFlowEngine.proyectar, en moneda local por área) baja de caja_minima.
+    - A4: reserva de chips para los PCs propios (1 chip por PC, como OptimizerV3) y
+      prioridad de entrega al grado con más ventas (S estándar / D de lujo).
+    """
+    def __init__(self, patentes, plantas=None, caja_minima=0.0, planner=None, mejora_k=None):
+        self.patentes = patentes or {}
+        self.plantas = plantas or {}
+        self.caja_minima = caja_minima
+        self.planner = planner or Planner()
+        self.mejora_k = mejora_k or {}
+
+    @classmethod
+    def desde_indice(cls, patentes, indice, plantas=None, caja_minima=0.0):
+        """
+        Ensamblador con lo vigente según el eco de formularios (IndiceDecisiones): mejora
+        de métodos del último A2 y, si el LST no trae 'plantas', las plantas en uso del
+        último A2 más las nuevas pedidas.
+        """
+        mejora_k, plantas_eco = {}, {}
+        for area in AREAS:
+            for prod in ('X', 'Y'):
+                r = indice.ultimo('A2', area, prod)
+                if r is None:
+                    continue
+                mejora_k[(area, prod)] = int(round(r['mejora_k']))
+                en_uso = sum(1 for a, b in zip(r['prod_planta'], r['prod_planta_sup']) if a or b)
+                plantas_eco[(area, prod)] = en_uso + r['nuevas']
+        return cls(patentes, plantas if plantas is not None else plantas_eco, caja_minima, mejora_k=mejora_k)
+
+    def _unidades(self, solucion, nombre):
+        return max(int(round((solucion or {}).get(nombre, 0) or 0)), 0)
+
+    def reparto_plantas(self, area, prod, unidades):
+        """(producción por planta en unidades, plantas nuevas, coste fijo del tramo)."""
+        cap = CAP_MAX[area][prod]
+        propias = self.plantas.get((area, prod), 1)
+        activas = min(math.ceil(unidades / cap), PLANTAS_POR_AREA) if unidades > 0 else 0
+        reparto = np.clip(unidades - cap * np.arange(PLANTAS_POR_AREA), 0, cap)
+        reparto[activas:] = 0
+        coste_fijo = COSTE_FIJO[area][prod][activas - 1] if activas else 0
+        return reparto.astype(int).tolist(), max(activas - propias, 0), coste_fijo
+
+    def a1(self, precios, strategy_config):
+        publicidad_k = strategy_config.get('gasto_publicidad', 0) / 1000
+        a1 = {(area, prod, g): {'price': 0, 'ad': 0} for area in AREAS for prod in ('X', 'Y') for g in GRADOS}
+        for (area, prod, g), precio in (precios or {}).items():
+            a1[(area, prod, g)] = {'price': self.planner._enforce_price(area, prod, int(precio), g),
+                                   'ad': publicidad_k if area == 'EU' else 0}
+        return a1
+
+    def a2(self, solucion, strategy_config, mejora_k=None):
+        a2 = {area: {'X': {}, 'Y': {}} for area in AREAS}
+        for (area, prod), grado in strategy_config.get('production_config', {}).items():
+            unidades = self._unidades(solucion, f'prod_{area}_{prod}')
+            if grado == -1 or unidades == 0:
+                continue
+            reparto, nuevas, _ = self.reparto_plantas(area, prod, unidades)
+            reparto_k = [round(u / 1000, 1) for u in reparto]
+            vacio = [0] * PLANTAS_POR_AREA
+            # mejora_k explícito (miles) solo para chips; si no, la vigente de (área, producto)
+            mejora = self.mejora_k.get((area, prod), 0) if mejora_k is None else (mejora_k if prod == 'X' else 0)
+            a2[area][prod] = {
+                'nuevas': nuevas, 'mejora_k': mejora,
+                'grado_inf': 0, 'prod_planta': reparto_k if grado == 0 else vacio,
+                'grado_sup': max(grado, 0), 'prod_planta_sup': reparto_k if grado > 0 else vacio,
+            }
+        if mejora_k is None:
+            # La mejora de métodos vigente se sigue enviando aunque ese producto no produzca
+            for (area, prod), mejora in self.mejora_k.items():
+                if mejora and not a2[area][prod]:
+                    a2[area][prod] = {'nuevas': 0, 'mejora_k': mejora, 'grado_inf': 0,
+                                      'prod_planta': [0] * PLANTAS_POR_AREA, 'grado_sup': 0,
+                                      'prod_planta_sup': [0] * PLANTAS_POR_AREA}
+        return a2
+
+    def a3(self, proyeccion):
+        """Transferencias (miles, moneda local) para que la caja mínima proyectada no baje de caja_minima."""
+        if proyeccion is None:
+            return []
+        caja_min = np.asarray(proyeccion['caja'])[0].min(axis=0)   # (A,) peor periodo del primer escenario
+        a3 = []
+        for i, area in enumerate(AREAS):
+            falta = self.caja_minima - caja_min[i]
+            if falta > 0:
+                a3.append({'area': area, 'tipo': 'F', 'moneda': codigo_area(area),
+                           'monto_k': math.ceil(falta / 1000), 'conversion': 'N'})
+        return a3
+
+    def a4(self, solucion, strategy_config):
+        a4 = {}
+        for area in AREAS:
+            pcs = {g: self._unidades(solucion, f'ventas_{area}_Y_{g}') for g in GRADOS}
+            chips = {g: self._unidades(solucion, f'ventas_{area}_X_{g}') for g in GRADOS}
+            grado_y = strategy_config.get('production_config', {}).get((area, 'Y'), -1)
+            reserva_k = round(self._unidades(solucion, f'prod_{area}_Y') / 1000, 1) if grado_y >= 0 else 0
+            if not reserva_k and not any(pcs.values()) and not any(chips.values()):
+                continue
+            a4[area] = {
+                'precio_comp_x_std': '', 'precio_comp_x_lujo': '',
+                'reserva_x_std_k': reserva_k if grado_y == 0 else 0,
+                'reserva_x_lujo_k': reserva_k if grado_y == 1 else 0,
+                'prioridad_x': 'D' if chips[1] > chips[0] else 'S',
+                'prioridad_y': 'D' if pcs[1] > pcs[0] else 'S',
+            }
+        return a4
+
+    def h1(self, strategy_config, estudios=(), monto_estudios=0.0):
+        # I+D solo si la estrategia pide un grado por encima de la patente (como gasto_id_estrategia)
+        produccion = strategy_config.get('production_config', {})
+        id_x = COSTE_ID_X if produccion.get(('EU', 'X'), -1) > self.patentes.get(('EU', 'X'), 0) else 0
+        id_y = COSTE_ID_Y if produccion.get(('EU', 'Y'), -1) > self.patentes.get(('EU', 'Y'), 0) else 0
+        return {
+            'I+D_X_kFS': id_x / 1000, 'I+D_Y_kFS': id_y / 1000,
+            'IM_monto_kFS': (strategy_config.get('gasto_informes', 0) + monto_estudios) / 1000,
+            'IM_estudios': list(estudios), 'dividendos_kFS': 0,
+        }
+
+    def ensamblar(self, solucion, precios, strategy_config, proyeccion=None, estudios=(), monto_estudios=0.0,
+                  mejora_k=None):
+        return {
+            'A1': self.a1(precios, strategy_config),
+            'A2': self.a2(solucion, strategy_config, mejora_k),
+            'A3': self.a3(proyeccion),
+            'A4': self.a4(solucion, strategy_config),
+            'H1': self.h1(strategy_config, estudios, monto_estudios),
+        }
+
+
+def exportar_decisiones(exporter, periodo, decisiones):
+    """Escribe los cinco formularios con FormsExporter; devuelve {formulario: ruta}."""
+    return {
+        'H1': exporter.export_H1(periodo, decisiones['H1']),
+        'A1': exporter.export_A1(periodo, decisiones['A1']),
+        'A2': exporter.export_A2(periodo, decisiones['A2']),
+        'A3': exporter.export_A3(periodo, decisiones['A3']),
+        'A4': exporter.export_A4(periodo, decisiones['A4']),
+    }
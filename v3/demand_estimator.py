@@ -1,4 +1,14 @@
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from src.profiling import medido, tramo
+
+# Bootstrap de las rectas de demanda
+REMUESTRAS = 2000            # Remuestras por mercado (10.000 tardan ~1 s)
+NIVEL_IC = 0.90              # Intervalo de confianza percentil
+SEMILLA_BOOTSTRAP = 0        # Fija: mismas entradas -> mismos intervalos (y misma caché de soluciones)
+PUNTOS_MIN_VARIANZA = 3      # Con 2 puntos la recta pasa por ambos: el bootstrap no mide nada
+FRACCION_SIN_VARIANZA = 0.5  # Desviación supuesta (fracción de la demanda) de ajustes sin varianza
+ELASTICIDAD_PUBLICIDAD = 0.15  # Aumento de la demanda del mercado por cada 100.000 de publicidad
 
 # Mapeo de columnas de Asesoría 28 (Precios)
 COL_MAP = {
@@ -16,86 +26,220 @@ VENTAS_MAP = {
     ('BR', 'X'): 4, ('BR', 'Y'): 5,
 }
 
-class DemandEstimator:
-    def __init__(self, historicos_parseados):
-        self.datos_mercado = self._extraer_datos(historicos_parseados)
-        self.modelos_demanda = self._entrenar_modelos()
+def puntos_periodo(data):
+    """
+    {mercado: (precio medio del grado, ventas proxy)} de un único periodo parseado.
+    Cada periodo aporta como mucho un punto por mercado, así que se puede cachear por fichero.
+    Del eco de nuestro A1 salen nuestros precios (si faltan en Asesoría 28) y la publicidad.
+    """
+    puntos = {}
+    if not data:
+        return puntos
+    precios_mercado_periodo = data.get('mercado_precios', {})
+    a1_propio = {(area, prod): r for (form, area, prod, _), r in data.get('formularios', {}).items() if form == 'A1'}
+    compania = data.get('compania')
+    if a1_propio and precios_mercado_periodo and all(n.split()[-1] != str(compania) for n in precios_mercado_periodo):
+        # Sin nuestra fila en Asesoría 28: nuestros precios exactos salen del eco de A1
+        propios = [0.0] * 12
+        for (area, prod, grado), col in COL_MAP.items():
+            if (area, prod) in a1_propio:
+                propios[col] = float(a1_propio[(area, prod)]['precios'][grado])
+        precios_mercado_periodo = {**precios_mercado_periodo, f'COMPAÑIA {compania}': propios}
+    ventas_totales_producto_periodo = data.get('mercado_ventas_totales', [0]*6)
 
-    def _extraer_datos(self, historicos):
-        datos = {}
-        
-        for i, data in enumerate(historicos):
-            if not data: continue
-            
-            precios_mercado_periodo = data.get('mercado_precios', {})
-            ventas_totales_producto_periodo = data.get('mercado_ventas_totales', [0]*6)
-            
-            for mercado_key_grado, col_precio in COL_MAP.items():
-                area, prod, grado = mercado_key_grado
-                
-                if mercado_key_grado not in datos:
-                    datos[mercado_key_grado] = {'precios_avg': [], 'ventas_total_proxy': []}
-
-                # 1. Calcular Precio Promedio del Mercado PARA ESE GRADO
-                precios_periodo_grado = []
+    for mercado_key_grado, col_precio in COL_MAP.items():
+        area, prod, grado = mercado_key_grado
+
+        # 1. Calcular Precio Promedio del Mercado PARA ESE GRADO
+        precios_periodo_grado = []
+        for cia, precios in precios_mercado_periodo.items():
+            if len(precios) == 12 and precios[col_precio] > 0:
+                precios_periodo_grado.append(precios[col_precio])
+
+        if not precios_periodo_grado:
+            continue
+
+        precio_promedio_grado = sum(precios_periodo_grado) / len(precios_periodo_grado)
+
+        # 2. Obtener Ventas Totales del PRODUCTO (de Asesoria 3)
+        col_ventas = VENTAS_MAP.get((area, prod))
+        if col_ventas is None or col_ventas >= len(ventas_totales_producto_periodo):
+            continue
+
+        ventas_total_prod = ventas_totales_producto_periodo[col_ventas]
+
+        # --- LÓGICA DE PROXY DE VENTAS CORREGIDA ---
+        if precio_promedio_grado > 0 and ventas_total_prod > 0:
+
+            # Comprobar si el grado opuesto también tiene precios
+            grado_opuesto = 1 - grado
+            col_precio_opuesto = COL_MAP.get((area, prod, grado_opuesto))
+            precio_opuesto_presente = False
+            if col_precio_opuesto is not None:
                 for cia, precios in precios_mercado_periodo.items():
-                    if len(precios) == 12 and precios[col_precio] > 0:
-                        precios_periodo_grado.append(precios[col_precio])
-                
-                if not precios_periodo_grado:
-                    continue 
-
-                precio_promedio_grado = sum(precios_periodo_grado) / len(precios_periodo_grado)
-                
-                # 2. Obtener Ventas Totales del PRODUCTO (de Asesoria 3)
-                col_ventas = VENTAS_MAP.get((area, prod))
-                if col_ventas is None or col_ventas >= len(ventas_totales_producto_periodo):
-                    continue
-                
-                ventas_total_prod = ventas_totales_producto_periodo[col_ventas]
-                
-                # --- LÓGICA DE PROXY DE VENTAS CORREGIDA ---
-                if precio_promedio_grado > 0 and ventas_total_prod > 0:
-                    
-                    # Comprobar si el grado opuesto también tiene precios
-                    grado_opuesto = 1 - grado
-                    col_precio_opuesto = COL_MAP.get((area, prod, grado_opuesto))
-                    precio_opuesto_presente = False
-                    if col_precio_opuesto is not None:
-                        for cia, precios in precios_mercado_periodo.items():
-                             if len(precios) == 12 and precios[col_precio_opuesto] > 0:
-                                 precio_opuesto_presente = True
-                                 break
-                    
-                    ventas_proxy_grado = ventas_total_prod
-                    # Si ambos grados (G0 y G1) tienen precios, dividimos las ventas 50/50
-                    if precio_opuesto_presente:
-                        ventas_proxy_grado = ventas_total_prod * 0.5
-                    
-                    if ventas_proxy_grado > 0:
-                        datos[mercado_key_grado]['precios_avg'].append(precio_promedio_grado)
-                        datos[mercado_key_grado]['ventas_total_proxy'].append(ventas_proxy_grado)
-                    
+                     if len(precios) == 12 and precios[col_precio_opuesto] > 0:
+                         precio_opuesto_presente = True
+                         break
+
+            ventas_proxy_grado = ventas_total_prod
+            # Si ambos grados (G0 y G1) tienen precios, dividimos las ventas 50/50
+            if precio_opuesto_presente:
+                ventas_proxy_grado = ventas_total_prod * 0.5
+
+            # Nuestra publicidad de ese periodo (eco de A1) infló la demanda observada: se descuenta
+            # para que la recta sea la demanda base, a la que strategy vuelve a sumar la publicidad
+            publicidad = a1_propio.get((area, prod), {}).get('ad', 0) * 1000
+            if publicidad > 0:
+                ventas_proxy_grado = ventas_proxy_grado / (1 + ELASTICIDAD_PUBLICIDAD * (publicidad / 100000))
+
+            if ventas_proxy_grado > 0:
+                puntos[mercado_key_grado] = (precio_promedio_grado, ventas_proxy_grado)
+    return puntos
+
+
+def _bootstrap_bloque(args):
+    """
+    Pendientes e intersecciones (M, B) de B remuestras de los M mercados a la vez: las series
+    se rellenan hasta N con peso 0 y cada remuestra se resuelve con las ecuaciones normales
+    ponderadas en bloque. Remuestras degeneradas (un solo precio distinto) quedan en NaN.
+    Función de módulo para poder enviarse a otros procesos.
+    """
+    semilla, remuestras, X, Y, n = args
+    rng = np.random.default_rng(semilla)
+    M, N = X.shape
+    idx = (rng.random((M, remuestras, N)) * n[:, None, None]).astype(np.intp)
+    w = (np.arange(N) < n[:, None])[:, None, :].astype(float)
+    x = np.take_along_axis(X[:, None, :], idx, axis=2) * w
+    y = np.take_along_axis(Y[:, None, :], idx, axis=2) * w
+    sw, sx, sy = w.sum(axis=2), x.sum(axis=2), y.sum(axis=2)
+    sxx, sxy = (x * x).sum(axis=2), (x * y).sum(axis=2)
+    det = sw * sxx - sx * sx
+    valido = det > 1e-9 * np.maximum(sw * sxx, 1e-300)
+    det = np.where(valido, det, 1.0)
+    pendiente = np.where(valido, (sw * sxy - sx * sy) / det, np.nan)
+    interseccion = np.where(valido, (sy - pendiente * sx) / sw, np.nan)
+    return pendiente, interseccion
+
+
+def bootstrap_rectas(series, remuestras=REMUESTRAS, semilla=SEMILLA_BOOTSTRAP, procesos=1, nivel=NIVEL_IC):
+    """
+    series: {mercado: (precios, ventas)}. Devuelve {mercado: {'pendiente_ic', 'interseccion_ic',
+    'cov', 'remuestras'}}, con cov la covarianza bootstrap de (interseccion, pendiente) y
+    remuestras las no degeneradas. Con procesos > 1 las remuestras se reparten entre procesos.
+    """
+    if not series:
+        return {}
+    mercados = list(series)
+    n = np.array([len(series[m][0]) for m in mercados])
+    X = np.zeros((len(mercados), n.max()))
+    Y = np.zeros_like(X)
+    for i, m in enumerate(mercados):
+        X[i, :n[i]], Y[i, :n[i]] = series[m]
+
+    bloques = [len(b) for b in np.array_split(np.arange(remuestras), max(procesos, 1)) if len(b)]
+    args = [(s, b, X, Y, n) for s, b in zip(np.random.SeedSequence(semilla).spawn(len(bloques)), bloques)]
+    if len(args) > 1:
+        with ProcessPoolExecutor(max_workers=len(args)) as pool:
+            resultados = list(pool.map(_bootstrap_bloque, args))
+    else:
+        resultados = [_bootstrap_bloque(a) for a in args]
+    pendientes = np.concatenate([r[0] for r in resultados], axis=1)
+    intersecciones = np.concatenate([r[1] for r in resultados], axis=1)
+
+    cola = (1 - nivel) / 2 * 100
+    intervalos = {}
+    for i, m in enumerate(mercados):
+        ok = np.isfinite(pendientes[i])
+        if ok.sum() < 2:
+            intervalos[m] = {'pendiente_ic': None, 'interseccion_ic': None, 'cov': None, 'remuestras': int(ok.sum())}
+            continue
+        p, b = pendientes[i, ok], intersecciones[i, ok]
+        intervalos[m] = {
+            'pendiente_ic': tuple(float(v) for v in np.percentile(p, [cola, 100 - cola])),
+            'interseccion_ic': tuple(float(v) for v in np.percentile(b, [cola, 100 - cola])),
+            'cov': tuple(map(tuple, np.cov(b, p).tolist())),
+            'remuestras': int(ok.sum()),
+        }
+    return intervalos
+
+
+def desviacion_demanda(modelo, precios):
+    """
+    Desviación típica bootstrap de la demanda del modelo a esos precios. Los ajustes con menos
+    de PUNTOS_MIN_VARIANZA puntos (o el modelo por defecto) no tienen varianza medible: se
+    toma FRACCION_SIN_VARIANZA de la demanda.
+    """
+    precios = np.asarray(precios, dtype=float)
+    cov = modelo.get('cov')
+    if modelo.get('puntos_datos', 0) < PUNTOS_MIN_VARIANZA or cov is None:
+        return FRACCION_SIN_VARIANZA * np.abs(modelo['interseccion'] + modelo['pendiente'] * precios)
+    (var_b, cov_bp), (_, var_p) = cov
+    return np.sqrt(np.maximum(var_b + 2 * precios * cov_bp + precios ** 2 * var_p, 0.0))
+
+
+class DemandEstimator:
+    def __init__(self, historicos_parseados, puntos_periodos=None, previo=None, remuestras=REMUESTRAS, procesos=1):
+        """
+        puntos_periodos: puntos_periodo() ya calculados de cada histórico (p.ej. cacheados por
+        fichero en v3.watch). previo: estimador anterior; solo se reajustan los mercados cuyos
+        puntos han cambiado. remuestras / procesos: bootstrap de los intervalos de cada recta.
+        """
+        if puntos_periodos is None:
+            puntos_periodos = [puntos_periodo(data) for data in historicos_parseados]
+        self.remuestras = remuestras
+        self.procesos = procesos
+        self.descartados = {}   # Rectas con pendiente >= 0 (no cumplen la ley de demanda)
+        self.datos_mercado = self._extraer_datos(puntos_periodos)
+        self.modelos_demanda = self._entrenar_modelos(previo)
+
+    @medido('demanda.extraer')
+    def _extraer_datos(self, puntos_periodos):
+        datos = {mercado_key_grado: {'precios_avg': [], 'ventas_total_proxy': []} for mercado_key_grado in COL_MAP}
+        for puntos in puntos_periodos:
+            for mercado_key_grado, (precio, ventas) in puntos.items():
+                datos[mercado_key_grado]['precios_avg'].append(precio)
+                datos[mercado_key_grado]['ventas_total_proxy'].append(ventas)
         return datos
 
-    def _entrenar_modelos(self):
+    def _entrenar_modelos(self, previo=None):
         modelos = {}
         for mercado_key_grado, data in self.datos_mercado.items():
-            
+            if previo is not None and previo.datos_mercado.get(mercado_key_grado) == data:
+                if mercado_key_grado in previo.modelos_demanda:
+                    modelos[mercado_key_grado] = previo.modelos_demanda[mercado_key_grado]
+                if mercado_key_grado in previo.descartados:
+                    self.descartados[mercado_key_grado] = previo.descartados[mercado_key_grado]
+                continue
+
             if len(data['precios_avg']) >= 2 and np.var(data['precios_avg']) > 0:
                 try:
                     # Usar polyfit (regresión lineal)
-                    m, b = np.polyfit(data['precios_avg'], data['ventas_total_proxy'], 1)
+                    with tramo('demanda.ajuste', lambda: '-'.join(map(str, mercado_key_grado))):
+                        m, b = np.polyfit(data['precios_avg'], data['ventas_total_proxy'], 1)
+                    ajuste = {'pendiente': m, 'interseccion': b, 'puntos_datos': len(data['precios_avg'])}
                     if m < 0: # Solo aceptar si la pendiente es negativa (ley de demanda)
-                        modelos[mercado_key_grado] = {'pendiente': m, 'interseccion': b, 'puntos_datos': len(data['precios_avg'])}
+                        modelos[mercado_key_grado] = ajuste
+                    else:
+                        self.descartados[mercado_key_grado] = ajuste
                 except np.linalg.LinAlgError:
                     pass 
+
+        # Intervalos de todos los ajustes nuevos en un único bootstrap por bloques
+        nuevos = {k: v for k, v in {**modelos, **self.descartados}.items()
+                  if previo is None or (previo.modelos_demanda.get(k) or previo.descartados.get(k)) is not v}
+        if nuevos and self.remuestras:
+            with tramo('demanda.bootstrap', lambda: f'{len(nuevos)}x{self.remuestras}'):
+                intervalos = bootstrap_rectas(
+                    {k: (self.datos_mercado[k]['precios_avg'], self.datos_mercado[k]['ventas_total_proxy']) for k in nuevos},
+                    self.remuestras, procesos=self.procesos)
+            for k, ajuste in nuevos.items():
+                ajuste.update(intervalos[k])
         return modelos
 
     def get_demand_function(self, area, prod, grado):
         key = (area, prod, int(grado))
         # Modelo por defecto si falla todo
-        default_model = {'pendiente': -100.0, 'interseccion': 50000, 'puntos_datos': 0}
+        default_model = {'pendiente': -100.0, 'interseccion': 50000, 'puntos_datos': 0, 'remuestras': 0}
         
         # 1. Intentar encontrar el modelo exacto (ej. 'EU', 'Y', 1)
         modelo_encontrado = self.modelos_demanda.get(key)
@@ -0,0 +1,281 @@
+import os
+import re
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from src.params import AREAS, PRECIOS_TIPICOS, COSTE_FIJO, ALMACEN_MIN, TIPO_CAMBIO
+from src.compiled import PARAMS, Area, Producto
+from v3.demand_estimator import COL_MAP, VENTAS_MAP
+from v3.optimizer_pulp import VC_RATE
+from v3.cashflow import COBRO_CONTADO, PAGO_CONTADO
+from v3.ranking import get_ranking_model, COMPANIA_PROPIA
+
+# Reglas de respuesta de la competencia (simples, parametrizables)
+ELASTICIDAD_CUOTA = 2.0        # Atractivo de un vendedor ~ (precio_tipico / precio) ** elasticidad
+RESPUESTA_MAX = 0.5            # Fracción máxima del recorte de precio que un rival iguala
+RUIDO_MERCADO = 0.15           # Desviación (log) del tamaño de mercado entre periodos
+ESCENARIOS_POR_PROCESO = 5000  # Por debajo de esto no compensa repartir entre procesos
+
+# Columna de Asesoría 28 -> (area, prod), y columna -> índice de producto de Asesoría 3
+_COLS = sorted(COL_MAP.items(), key=lambda kv: kv[1])
+COL_PRODUCTO = np.array([VENTAS_MAP[(k[0], k[1])] for k, _ in _COLS])
+_COL_AREA = np.array([Area[k[0]] for k, _ in _COLS])
+_COL_PROD = np.array([Producto[k[1]] for k, _ in _COLS])
+_VC = np.array([VC_RATE[p] for p in Producto.__members__])
+PRECIO_TIPICO_COL = PARAMS.PRECIOS_TIPICOS.view(np.ndarray)[_COL_AREA, _COL_PROD]
+COSTE_VAR_COL = PRECIO_TIPICO_COL * _VC[_COL_PROD]
+COBRO_COL = PARAMS.AR.view(np.ndarray)[_COL_AREA, 0]
+PAGO_COL = PARAMS.AP.view(np.ndarray)[_COL_AREA, 0]
+# Asesoría 3 ordena productos como COL_MAP: (US,X), (US,Y), (EU,X)... = area * 2 + prod
+COSTE_FIJO_PRODUCTO = PARAMS.COSTE_FIJO.view(np.ndarray)[:, :, 0].reshape(-1)
+# Precios, costes y fijos anteriores van en moneda local; la liga se puntúa en FS (consolidado)
+
+
+def _num_compania(nombre):
+    m = re.search(r'(\d+)', nombre)
+    return int(m.group(1)) if m else None
+
+
+def cambio_columnas(tipo_cambio=None):
+    """FS por unidad de moneda local de cada columna de Asesoría 28."""
+    tipo_cambio = tipo_cambio or TIPO_CAMBIO
+    return np.array([tipo_cambio[AREAS[a]] for a in _COL_AREA], dtype=float)
+
+
+def componentes_periodo(precios, unidades, cambio_col):
+    """
+    Beneficio, liquidez y cuota del periodo en FS a partir de precios y unidades por
+    columna de Asesoría 28 (última dimensión, 12 columnas), con los mismos costes para
+    todas las compañías: coste variable típico y una planta por producto vendido.
+    """
+    cambio_producto = np.zeros(6)
+    cambio_producto[COL_PRODUCTO] = cambio_col
+    activo = np.zeros(np.shape(precios)[:-1] + (6,), dtype=bool)
+    for col in range(12):
+        activo[..., COL_PRODUCTO[col]] |= precios[..., col] > 0
+    fijos = (activo * COSTE_FIJO_PRODUCTO * cambio_producto).sum(axis=-1)
+    beneficio = ((precios - COSTE_VAR_COL) * unidades * cambio_col).sum(axis=-1) - fijos
+    liquidez = ((precios * COBRO_COL - COSTE_VAR_COL * PAGO_COL) * unidades * cambio_col).sum(axis=-1) - fijos
+    return beneficio, liquidez, unidades.sum(axis=-1)
+
+
+def reparto_unidades(precios, mercado):
+    """
+    Unidades por compañía y columna (..., C, 12): el mercado de cada producto de
+    Asesoría 3 (..., 6) se reparte por atractivo de precio entre quienes venden (ambos grados).
+    """
+    atractivo = np.where(precios > 0, (PRECIO_TIPICO_COL / np.where(precios > 0, precios, 1.0)) ** ELASTICIDAD_CUOTA, 0.0)
+    atractivo_producto = np.zeros(atractivo.shape[:-2] + (6,))
+    for col in range(12):
+        atractivo_producto[..., COL_PRODUCTO[col]] += atractivo[..., col].sum(axis=-1)
+    cuota_col = atractivo / np.where(atractivo_producto > 0, atractivo_producto, 1.0)[..., None, COL_PRODUCTO]
+    return cuota_col * mercado[..., None, COL_PRODUCTO]
+
+
+def componentes_companias(parsed):
+    """
+    {compañía: (beneficio, liquidez, cuota, inventarios)} estimados del periodo para todas
+    las compañías del LST: precios de Asesoría 28, mercado de Asesoría 3 repartido con
+    reparto_unidades y componentes_periodo en FS. Sin inventarios (no se publican).
+    """
+    precios_cia = {_num_compania(k): v for k, v in parsed.get('mercado_precios', {}).items()}
+    precios_cia.pop(None, None)
+    totales = parsed.get('mercado_ventas_totales')
+    if not precios_cia or not totales:
+        return {}
+    companias = sorted(precios_cia)
+    precios = np.array([precios_cia[c] for c in companias], dtype=float)
+    unidades = reparto_unidades(precios, np.asarray(totales, dtype=float))
+    beneficio, liquidez, cuota = componentes_periodo(precios, unidades, cambio_columnas(parsed.get('tipo_cambio')))
+    return {c: (float(b), float(l), float(q), 0.0) for c, b, l, q in zip(companias, beneficio, liquidez, cuota)}
+
+
+def metricas_solucion(solucion, condiciones, coste_estrategia=0.0, tipo_cambio=None, area_gastos='EU'):
+    """
+    Componentes brutos del periodo (beneficio y liquidez en FS, cuota, inventarios) de
+    una solución de OptimizerV3, con los mismos costes que su función objetivo. Los
+    gastos de la estrategia se cargan en area_gastos, como en flujos_por_area.
+    """
+    tipo_cambio = tipo_cambio or TIPO_CAMBIO
+    costes = coste_estrategia * tipo_cambio[area_gastos]
+    ingresos = 0.0
+    caja = -costes
+    cuota = 0.0
+    inventarios = 0.0
+    for k, v in (solucion or {}).items():
+        parts = k.split('_')
+        if k.startswith('ventas_'):
+            key = (parts[1], parts[2], int(parts[3]))
+            ingreso = condiciones.get(key, {}).get('precio', 0) * v * tipo_cambio[parts[1]]
+            ingresos += ingreso
+            caja += ingreso * COBRO_CONTADO[parts[1]]
+            cuota += v
+        elif k.startswith('inv_final_'):
+            almacen = v * ALMACEN_MIN[parts[2]][parts[3]] * tipo_cambio[parts[2]]
+            inventarios += v
+            costes += almacen
+            caja -= almacen
+        elif k.startswith('prod_'):
+            coste_var = v * PRECIOS_TIPICOS[parts[1]][parts[2]] * VC_RATE[parts[2]] * tipo_cambio[parts[1]]
+            costes += coste_var
+            caja -= coste_var * PAGO_CONTADO[parts[1]]
+        elif k.startswith('open_'):
+            fijo = v * COSTE_FIJO[parts[1]][parts[2]][0] * tipo_cambio[parts[1]]
+            costes += fijo
+            caja -= fijo
+    beneficio = ingresos - costes
+    return {'beneficio': beneficio, 'liquidez': caja,
+            'cuota': cuota, 'inventarios': inventarios}
+
+
+def flujos_por_area(solucion, condiciones, coste_estrategia=0.0, area_gastos='EU'):
+    """
+    Ingresos, costes variables y costes al contado por área (orden de AREAS) de una
+    solución de OptimizerV3, como entrada de CashFlowEngine. Los gastos de la
+    estrategia (publicidad, I+D, informes) se cargan en area_gastos.
+    """
+    ingresos, costes_var, contado = np.zeros(len(AREAS)), np.zeros(len(AREAS)), np.zeros(len(AREAS))
+    contado[AREAS.index(area_gastos)] += coste_estrategia
+    for k, v in (solucion or {}).items():
+        parts = k.split('_')
+        if k.startswith('ventas_'):
+            key = (parts[1], parts[2], int(parts[3]))
+            ingresos[AREAS.index(parts[1])] += condiciones.get(key, {}).get('precio', 0) * v
+        elif k.startswith('inv_final_'):
+            contado[AREAS.index(parts[2])] += v * ALMACEN_MIN[parts[2]][parts[3]]
+        elif k.startswith('prod_'):
+            costes_var[AREAS.index(parts[1])] += v * PRECIOS_TIPICOS[parts[1]][parts[2]] * VC_RATE[parts[2]]
+        elif k.startswith('open_'):
+            contado[AREAS.index(parts[1])] += v * COSTE_FIJO[parts[1]][parts[2]][0]
+    return ingresos, costes_var, contado
+
+
+def _simular_bloque(args):
+    """Simula un bloque de escenarios. Función de módulo para poder enviarse a otros procesos."""
+    (semilla, n, precios, totales, previo, periodos, idx_propio, precios_propios,
+     ventas_plan, ajuste_plan, cambio_col, pesos, bases) = args
+    rng = np.random.default_rng(semilla)
+    C = precios.shape[0]
+
+    # Respuesta de rivales: igualan parte de nuestro recorte donde compiten con nosotros
+    p = np.broadcast_to(precios, (n, C, 12)).copy()
+    respuesta = rng.uniform(0.0, RESPUESTA_MAX, size=(n, C, 1))
+    recorte = (p > 0) & (precios_propios > 0) & (precios_propios < p)
+    p = np.where(recorte, p + respuesta * (precios_propios - p), p)
+    p[:, idx_propio, :] = precios_propios
+
+    # Reparto del mercado por atractivo de precio dentro de cada producto (ambos grados)
+    mercado = totales * rng.lognormal(0.0, RUIDO_MERCADO, size=(n, 6))
+    unidades = reparto_unidades(p, mercado)
+
+    # Nuestras ventas no superan el plan del optimizador
+    unidades_propias = np.minimum(unidades[:, idx_propio, :], ventas_plan)
+    unidades[:, idx_propio, :] = unidades_propias
+
+    # Componentes del periodo (FS) para todas las compañías a la vez, nosotros incluidos
+    beneficio, liquidez, cuota = componentes_periodo(p, unidades, cambio_col)
+    inventarios = np.zeros((n, C))
+
+    # Lo propio del plan (gastos de estrategia, almacén, plantas abiertas...) va aparte;
+    # lo no vendido se produjo igual y pasa a inventario
+    no_vendido = ventas_plan - unidades_propias
+    coste_no_vendido = COSTE_VAR_COL * no_vendido * cambio_col
+    beneficio[:, idx_propio] += ajuste_plan[0] - coste_no_vendido.sum(axis=1)
+    liquidez[:, idx_propio] += ajuste_plan[1] - (coste_no_vendido * PAGO_COL).sum(axis=1)
+    inventarios[:, idx_propio] = ajuste_plan[3] + no_vendido.sum(axis=1)
+
+    w = np.asarray(pesos) / np.asarray(bases)
+    s = w[0] * beneficio + w[1] * liquidez + w[2] * cuota + w[3] * inventarios
+
+    # Puntuación relativa (estandarizada en la liga) promediada con el histórico: el
+    # PROMEDIO de 'Ranking N.txt' es la media de N periodos, el nuevo pesa 1 / (N + 1)
+    std = s.std(axis=1, keepdims=True)
+    z = (s - s.mean(axis=1, keepdims=True)) / np.where(std > 0, std, 1.0)
+    nuevo = (periodos * previo + z) / (periodos + 1)
+    rango = 1 + (nuevo > nuevo[:, [idx_propio]]).sum(axis=1)
+    return rango, nuevo[:, idx_propio]
+
+
+class LeagueSimulator:
+    """
+    Proyecta la posición de las 11 compañías en el siguiente periodo.
+
+    Estado por compañía: precios de Asesoría 28 y tamaño de mercado de Asesoría 3
+    del último LST; puntuación previa de 'Ranking N.txt'. Todas las compañías se
+    puntúan con componentes_periodo en FS (tipos de cambio del LST); nuestras
+    decisiones entran como métricas del plan (metricas_solucion) y precios por columna.
+    """
+    def __init__(self, parsed_periodo, ranking_data=None, compania_propia=None, ranking_model=None):
+        self.ranking_model = ranking_model or get_ranking_model()
+        self.compania_propia = compania_propia or parsed_periodo.get('compania', COMPANIA_PROPIA)
+
+        precios_cia = {_num_compania(k): v for k, v in parsed_periodo.get('mercado_precios', {}).items()}
+        ranking_data = ranking_data or []
+        ultimo = max((r['periodo'] for r in ranking_data), default=0)
+        previos = {r['compania']: r['score'] for r in ranking_data if r['periodo'] == ultimo}
+
+        self.companias = sorted(set(precios_cia) | set(previos) | {self.compania_propia})
+        self.idx_propio = self.companias.index(self.compania_propia)
+        self.precios = np.array([precios_cia.get(c, [0.0] * 12) for c in self.companias], dtype=float)
+        self.totales = np.array(parsed_periodo.get('mercado_ventas_totales', [0.0] * 6), dtype=float)
+        self.previo = np.array([previos.get(c, 0.0) for c in self.companias], dtype=float)
+        self.periodos = ultimo
+        self.tipo_cambio = parsed_periodo.get('tipo_cambio') or TIPO_CAMBIO
+        self.cambio_col = cambio_columnas(self.tipo_cambio)
+
+    def simular(self, metricas_plan, precios_plan=None, ventas_plan=None,
+                n_escenarios=2000, semilla=0, procesos=None):
+        """
+        metricas_plan: metricas_solucion del plan con self.tipo_cambio (FS).
+        precios_plan / ventas_plan: {(area, prod, grado): valor} de nuestra estrategia.
+        Devuelve la distribución de nuestra posición (1..C) y su media.
+        """
+        precios_propios = np.zeros(12)
+        ventas = np.zeros(12)
+        for key, precio in (precios_plan or {}).items():
+            precios_propios[COL_MAP[key]] = precio
+        for key, v in (ventas_plan or {}).items():
+            ventas[COL_MAP[key]] = v
+        # Lo que el plan añade a componentes_periodo vendiendo todo lo planificado
+        beneficio, liquidez, cuota = componentes_periodo(precios_propios, ventas, self.cambio_col)
+        ajuste = np.array([metricas_plan['beneficio'] - beneficio, metricas_plan['liquidez'] - liquidez,
+                           metricas_plan['cuota'] - cuota, metricas_plan['inventarios']])
+
+        if procesos is None:
+            procesos = min(os.cpu_count() or 1, max(1, n_escenarios // ESCENARIOS_POR_PROCESO))
+        bloques = np.array_split(np.arange(n_escenarios), procesos)
+        semillas = np.random.SeedSequence(semilla).spawn(len(bloques))
+        args = [
+            (s, len(b), self.precios, self.totales, self.previo, self.periodos, self.idx_propio,
+             precios_propios, ventas, ajuste, self.cambio_col, self.ranking_model.pesos, self.ranking_model.bases)
+            for s, b in zip(semillas, bloques) if len(b)
+        ]
+        if len(args) > 1:
+            with ProcessPoolExecutor(max_workers=len(args)) as pool:
+                resultados = list(pool.map(_simular_bloque, args))
+        else:
+            resultados = [_simular_bloque(a) for a in args]
+
+        rangos = np.concatenate([r[0] for r in resultados])
+        scores = np.concatenate([r[1] for r in resultados])
+        C = len(self.companias)
+        distribucion = np.bincount(rangos, minlength=C + 1)[1:] / len(rangos)
+        return {
+            'distribucion': distribucion,
+            'rango_esperado': float(rangos.mean()),
+            'score_esperado': float(scores.mean()),
+        }
+
+    def comparar_estrategias(self, estrategias, coste_por_estrategia=None, **kwargs):
+        """estrategias: {nombre: {'solucion', 'condiciones', 'precios'}} como en el quickstart."""
+        coste_por_estrategia = coste_por_estrategia or {}
+        resultados = {}
+        for nombre, est in estrategias.items():
+            metricas = metricas_solucion(est.get('solucion'), est.get('condiciones', {}),
+                                         coste_por_estrategia.get(nombre, 0.0), self.tipo_cambio)
+            ventas_plan = {}
+            for k, v in (est.get('solucion') or {}).items():
+                if k.startswith('ventas_'):
+                    parts = k.split('_')
+                    ventas_plan[(parts[1], parts[2], int(parts[3]))] = v
+            resultados[nombre] = self.simular(metricas, est.get('precios', {}), ventas_plan, **kwargs)
+        return resultados
@@ -1,16 +1,23 @@
 
+from collections.abc import Mapping
 from src.params import AREAS, PRECIOS_TIPICOS, SALTO_MIN, TOPE_BR_Y_LE3, CAP_MAX
 from src.demand import DemandModel
 
-from v3.ranking import calculate_ranking
+from v3.ranking import calculate_ranking, calculate_ranking_batch
+
+RANKING_KEYS = ('beneficio', 'liquidez', 'cuota', 'inventarios')
 
 class Negotiation:
     def evaluate_offer(self, offer, current_state):
-        # Simula impacto en ranking si se acepta
-        new_state = current_state.copy()
-        new_state.update(offer)
-        score = calculate_ranking(new_state)
-        return score
+        # Simula impacto en ranking si se acepta (la oferta sobrescribe el estado, sin copiarlo)
+        cols = [offer[k] if k in offer else current_state.get(k, 0) for k in RANKING_KEYS]
+        if isinstance(cols[3], Mapping):
+            cols[3] = sum(cols[3].values())
+        return float(calculate_ranking_batch(*cols))
+
+    def evaluate_offers(self, beneficio, liquidez, cuota, inventarios, normalizado=True):
+        # Versión en bloque: columnas de estados candidatos -> array de puntuaciones
+        return calculate_ranking_batch(beneficio, liquidez, cuota, inventarios, normalizado=normalizado)
 
     def generate_counteroffer(self, offer, current_state):
         # Ajusta precio y volumen para mejorar ranking
@@ -0,0 +1,232 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import numpy as np
+from src.params import AREAS, AR_STRUCTURE, PRECIOS_TIPICOS
+from src.parser import LSTParser, localizar_lsts
+from v3.optimizer_pulp import VC_RATE
+from v3.ranking import estado_bruto, cargar_modelo_calibrado
+from v3.pacts import PactAnalyzer
+
+# Campos de una oferta B2B (H6) y sus alias en castellano
+CAMPOS = ['buyer', 'area', 'product', 'grade', 'price', 'volume', 'cash', 'next', 'later']
+ALIAS = {
+    'comprador': 'buyer', 'producto': 'product', 'grado': 'grade', 'precio': 'price',
+    'volumen': 'volume', 'contado': 'cash', 'proximo': 'next', 'subsiguiente': 'later',
+    'area_comprador': 'buyer_area', 'volumen_minimo': 'min_volume', 'transporte': 'via',
+}
+PRODUCTOS = {'X': 'X', 'CHIP': 'X', 'Y': 'Y', 'PC': 'Y'}
+
+
+def numero_compania(valor, defecto=None):
+    """
+    Nº de compañía compradora (entero positivo, como en H6); ValueError si no lo es.
+    Sin comprador devuelve 'defecto' si se da.
+    """
+    if defecto is not None and str(valor if valor is not None else '').strip() in ('', 'None'):
+        return defecto
+    try:
+        numero = float(str(valor).strip())
+    except ValueError:
+        numero = 0.0
+    if numero < 1 or not numero.is_integer():
+        raise ValueError(f"compañía compradora no válida: {valor!r} (se espera su número, p.ej. 3)")
+    return int(numero)
+
+
+def normalizar_oferta(raw):
+    """Oferta con nombres canónicos. Sin condiciones de pago se usa AR_STRUCTURE del área (en %)."""
+    oferta = {}
+    for k, v in raw.items():
+        k = str(k).strip().lower()
+        oferta[ALIAS.get(k, k)] = v.strip() if isinstance(v, str) else v
+    oferta['area'] = str(oferta.get('area', '')).upper()
+    oferta['product'] = PRODUCTOS.get(str(oferta.get('product', '')).upper(), str(oferta.get('product', '')).upper())
+    if str(oferta.get('cash', '')) in ('', 'None') and oferta['area'] in AR_STRUCTURE:
+        ar = AR_STRUCTURE[oferta['area']]
+        oferta['cash'], oferta['next'], oferta['later'] = ar['cash'] * 100, ar['cxc1'] * 100, ar['cxc2'] * 100
+    return oferta
+
+
+def leer_ofertas(path_o_stream, formato=None):
+    """Lee ofertas de un CSV (con cabecera) o JSONL, desde ruta o stream abierto."""
+    if isinstance(path_o_stream, str):
+        formato = formato or ('jsonl' if path_o_stream.lower().endswith(('.jsonl', '.json')) else 'csv')
+        with open(path_o_stream, 'r', encoding='utf-8', newline='') as f:
+            return leer_ofertas(f, formato)
+    if formato == 'jsonl':
+        return [normalizar_oferta(json.loads(ln)) for ln in path_o_stream if ln.strip()]
+    return [normalizar_oferta(row) for row in csv.DictReader(path_o_stream)]
+
+
+class OfferBatchEvaluator:
+    """
+    Puntúa lotes de ofertas B2B contra el estado actual en una única pasada vectorizada.
+    Usa el mismo modelo que PactAnalyzer (CashFlowEngine: cobro según las condiciones de
+    pago de la oferta, intereses, impuestos y paso a FS); el resto del cobro queda en CxC.
+    """
+    def __init__(self, estado_bruto_actual, inventarios_detalle, ranking_model=None, caja_area=None, tipo_cambio=None):
+        self.pactos = PactAnalyzer(estado_bruto_actual, inventarios_detalle, ranking_model, caja_area, tipo_cambio)
+        self.estado = self.pactos.estado
+        self.inventarios_detalle = self.pactos.inventarios_detalle
+        self.ranking_model = self.pactos.ranking_model
+        self.ranking_actual = self.pactos.ranking_actual
+        self.cambio = dict(zip(AREAS, self.pactos.motor.cambio))
+
+    def columnas(self, ofertas):
+        n = len(ofertas)
+        cols = {
+            'precio': np.zeros(n), 'volumen': np.zeros(n), 'contado': np.zeros(n), 'proximo': np.zeros(n),
+            'subsiguiente': np.zeros(n), 'area': np.zeros(n, dtype=int), 'cambio': np.zeros(n),
+            'coste_var': np.zeros(n), 'stock': np.zeros(n), 'valida': np.ones(n, dtype=bool),
+        }
+        motivos = [''] * n
+        for i, o in enumerate(ofertas):
+            try:
+                area, prod, grado = o['area'], o['product'], int(float(o.get('grade', 0)))
+                cols['precio'][i] = float(o['price'])
+                cols['volumen'][i] = float(o['volume'])
+                cols['contado'][i] = float(o.get('cash', 0)) / 100.0
+                cols['proximo'][i] = float(o.get('next') or 0) / 100.0
+                cols['subsiguiente'][i] = float(o.get('later') or 0) / 100.0
+                if area not in AREAS or prod not in ('X', 'Y'):
+                    raise ValueError(f"mercado desconocido {area}-{prod}")
+                numero_compania(o.get('buyer'), defecto=0)
+                cols['area'][i] = AREAS.index(area)
+                cols['cambio'][i] = self.cambio[area]
+                cols['coste_var'][i] = PRECIOS_TIPICOS[area][prod] * VC_RATE[prod]
+                cols['stock'][i] = self.inventarios_detalle.get((area, prod, grado), 0)
+            except (KeyError, ValueError, TypeError) as e:
+                cols['valida'][i] = False
+                motivos[i] = f"oferta mal formada: {e}"
+        return cols, motivos
+
+    def evaluar(self, ofertas):
+        """Devuelve las ofertas ordenadas por mejora de ranking, con sus métricas añadidas."""
+        if not ofertas:
+            return []
+        cols, motivos = self.columnas(ofertas)
+        p, v = cols['precio'], cols['volumen']
+        rankings = self.pactos.puntuar_ventas(
+            cols['area'], p, v, cols['coste_var'],
+            cobro=np.stack([cols['contado'], cols['proximo'], cols['subsiguiente']], axis=-1))
+        ganancia = rankings - self.ranking_actual
+        sin_stock = cols['valida'] & (v > cols['stock'])
+        bajo_coste = cols['valida'] & (p <= cols['coste_var'])
+        valida = cols['valida'] & ~sin_stock
+
+        # Las inválidas van al final; entre válidas, mayor ganancia primero
+        orden = np.lexsort((-np.where(valida, ganancia, -np.inf), ~valida))
+        resultado = []
+        for pos, i in enumerate(orden, start=1):
+            motivo = motivos[i]
+            if sin_stock[i]:
+                motivo = f"volumen supera el stock disponible ({cols['stock'][i]:.0f})"
+            elif bajo_coste[i]:
+                motivo = "precio por debajo del coste variable"
+            fila = dict(ofertas[i])
+            fila.update({
+                'puesto': pos, 'valida': bool(valida[i]),
+                'ranking': round(float(rankings[i]), 6) if cols['valida'][i] else '',
+                'ganancia': round(float(ganancia[i]), 6) if cols['valida'][i] else '',
+                'motivo': motivo,
+            })
+            resultado.append(fila)
+        return resultado
+
+    def evaluar_stream(self, stream, salida=sys.stdout, formato='jsonl'):
+        """
+        Evalúa ofertas según llegan (una por línea, JSONL o CSV con cabecera) y
+        escribe cada una puntuada en 'salida', con su puesto entre las válidas vistas.
+        """
+        vistas = []
+        ganancias = []
+        cabecera = None
+        for ln in stream:
+            if not ln.strip():
+                continue
+            if formato == 'csv':
+                fila = next(csv.reader([ln]))
+                if cabecera is None:
+                    cabecera = fila
+                    continue
+                raw = dict(zip(cabecera, fila))
+            else:
+                raw = json.loads(ln)
+            vistas.append(normalizar_oferta(raw))
+            puntuada = self.evaluar([vistas[-1]])[0]
+            if puntuada['valida']:
+                ganancias.append(puntuada['ganancia'])
+                puntuada['puesto'] = 1 + int((np.asarray(ganancias) > puntuada['ganancia']).sum())
+            else:
+                puntuada['puesto'] = ''
+            salida.write(json.dumps(puntuada, ensure_ascii=False) + '\n')
+            salida.flush()
+        return self.evaluar(vistas)
+
+
+def escribir_resultado(resultado, destino, formato=None):
+    """Escribe las ofertas puntuadas en CSV o JSONL (según extensión) en una ruta o stream."""
+    if isinstance(destino, str):
+        formato = formato or ('jsonl' if destino.lower().endswith(('.jsonl', '.json')) else 'csv')
+        with open(destino, 'w', newline='', encoding='utf-8') as f:
+            escribir_resultado(resultado, f, formato)
+        return destino
+    if formato == 'jsonl':
+        for fila in resultado:
+            destino.write(json.dumps(fila, ensure_ascii=False) + '\n')
+        return destino
+    cols = list(dict.fromkeys(['puesto', 'valida', 'ganancia', 'ranking', 'motivo'] + CAMPOS +
+                              [k for fila in resultado for k in fila]))
+    w = csv.DictWriter(destino, fieldnames=cols, extrasaction='ignore')
+    w.writeheader()
+    w.writerows(resultado)
+    return destino
+
+
+def cargar_evaluador(data_dir):
+    """Estado actual (último LST) y ranking calibrado, listos para puntuar ofertas."""
+    files, _ = localizar_lsts(data_dir)
+    if not files:
+        raise FileNotFoundError(f"No se encontraron archivos de Decisión en {data_dir}")
+    parser = LSTParser()
+    historicos = [parser.parse_file(f) for f in files]
+    modelo = cargar_modelo_calibrado(data_dir, historicos)
+    actual = historicos[-1]
+    beneficio, liquidez, cuota, inventarios = estado_bruto(actual)
+    return OfferBatchEvaluator(
+        {'beneficio': beneficio, 'liquidez': liquidez, 'cuota': cuota, 'inventarios': inventarios},
+        actual.get('inventarios_detalle', {}), ranking_model=modelo,
+        caja_area=actual.get('caja_area'), tipo_cambio=actual.get('tipo_cambio')
+    )
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Evaluación en bloque de ofertas B2B (H6).')
+    ap.add_argument('--data', default=os.path.join(os.getcwd(), 'data'), help='Carpeta con los LST')
+    ap.add_argument('--input', help='Fichero de ofertas (.csv o .jsonl)')
+    ap.add_argument('--output', help='Fichero de resultado ordenado (.csv o .jsonl)')
+    ap.add_argument('--stdin', action='store_true', help='Leer ofertas de stdin según llegan')
+    ap.add_argument('--formato', choices=['csv', 'jsonl'], default='jsonl', help='Formato de stdin')
+    args = ap.parse_args(argv)
+
+    evaluador = cargar_evaluador(args.data)
+    if args.stdin:
+        resultado = evaluador.evaluar_stream(sys.stdin, sys.stdout, args.formato)
+    elif args.input:
+        resultado = evaluador.evaluar(leer_ofertas(args.input))
+    else:
+        ap.error('Indica --input o --stdin')
+
+    if args.output:
+        escribir_resultado(resultado, args.output)
+        print(f"-> {len(resultado)} ofertas puntuadas en {args.output}", file=sys.stderr)
+    elif not args.stdin:
+        escribir_resultado(resultado, sys.stdout, 'csv')
+    return resultado
+
+
+if __name__ == '__main__':
+    main()
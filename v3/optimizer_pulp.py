@@ -1,18 +1,57 @@
+import numpy as np
 import pulp
+from src.profiling import medido
 from src.params import (
     AREAS, PRECIOS_TIPICOS, SALTO_MIN, TOPE_BR_Y_LE3, 
-    CAP_MAX, ALMACEN_MIN, COSTE_FIJO, X_TO_Y
+    CAP_MAX, ALMACEN_MIN, COSTE_FIJO, X_TO_Y, TIPO_CAMBIO
 )
 
-# Definimos las bases de normalización aquí para que el optimizador las conozca
-BASE_BENEFICIO = 500000.0
-BASE_LIQUIDEZ = 20000000.0
-BASE_INVENTARIO = 100000.0
-BASE_CUOTA = 150000.0
+# Bases de normalización y pesos: fuente única en v3.ranking (calibrables)
+from v3.ranking import get_ranking_model
+# Fracciones cobradas/pagadas al contado (AR/AP): liquidez del periodo; intereses e impuestos
+from v3.cashflow import (
+    COBRO_CONTADO, PAGO_CONTADO, TASA_POS, TASA_NEG_MENOR, TASA_NEG_MAYOR, SUMA_CRITICA, TASA_IMPUESTO,
+    CashFlowEngine
+)
+
+# Constantes del modelo (compartidas con el pre-filtro analítico de v3.prescreen)
+VC_RATE = {'X': 0.155, 'Y': 0.30}   # Coste variable como fracción del precio típico
+PRODUCCION_MINIMA = 10              # Unidades mínimas si la planta se abre
+PENALIZACION_INACTIVIDAD = 1000     # Penalización por cada planta cerrada
+AREA_GASTOS = 'EU'                  # Publicidad, I+D e informes se pagan desde EU (como v3.league)
+# Saldos, deudas e impuestos van en miles (como SUMAS_CRITICAS en la gaceta): en unidades
+# sus coeficientes en el objetivo quedan por debajo de la tolerancia de CBC
+ESCALA_FINANCIERA = 1000.0
+
+def cambio_area(current_state):
+    """FS por unidad de moneda local de cada área: 'tipo_cambio' del estado o el de params."""
+    tipo_cambio = current_state.get('tipo_cambio') or TIPO_CAMBIO
+    return np.array([tipo_cambio[a] for a in AREAS], dtype=float)
+
+def caja_inicial_area(current_state, ranking_model):
+    """Caja de partida por área en moneda local: 'caja_area' del estado o la liquidez (FS) repartida."""
+    caja_area = current_state.get('caja_area')
+    if caja_area:
+        return np.array([caja_area[a] for a in AREAS], dtype=float)
+    return CashFlowEngine(caja_inicial=current_state.get('liquidez', 0) * ranking_model.bases[1],
+                          tipo_cambio=current_state.get('tipo_cambio')).caja_inicial
+
+def coef_financiero(ranking_model):
+    # Peso de una unidad de intereses o impuestos (es beneficio y caja a la vez); si no es
+    # positivo, maximizar no elegiría el tramo correcto y los términos financieros se omiten
+    peso_ben, peso_liq, _, _ = ranking_model.pesos
+    base_ben, base_liq, _, _ = ranking_model.bases
+    return max(peso_ben / base_ben + peso_liq / base_liq, 0.0)
+
+def _candidato(optimizer, *args, **kwargs):
+    # Etiqueta de traza: mercados y precios del candidato ('EU-Y-0@110')
+    return ','.join(f"{'-'.join(map(str, k))}@{c['precio']}" for k, c in optimizer.market_conditions.items()
+                    if c['precio']) or 'sin-ventas'
 
 class OptimizerV3:
-    def __init__(self, current_state, scenario='hybrid'):
+    def __init__(self, current_state, scenario='hybrid', ranking_model=None):
         self.scenario = scenario
+        self.ranking_model = ranking_model or get_ranking_model()
         self.current_state = current_state # Este estado DEBE estar NORMALIZADO
         self.model = pulp.LpProblem('RankingOptimization', pulp.LpMaximize)
         self.variables = {}
@@ -27,6 +66,13 @@ class OptimizerV3:
         self.coste_ID_total = 0
         self.coste_informes_total = 0
 
+        # Restricciones que dependen del inventario inicial de cada (area, prod, grado),
+        # para poder aplicar pactos aceptados sin reconstruir el modelo
+        self.restricciones_inventario = {}
+        self.pactos = []
+        # Variables auxiliares de intereses e impuestos (no son decisiones)
+        self.financieras = {}
+
     def set_market_conditions(self, area, prod, grado, precio_fijo, demanda_maxima, producir_grado):
         key = (area, prod, int(grado))
         self.market_conditions[key] = {
@@ -41,6 +87,7 @@ class OptimizerV3:
         self.coste_ID_total = coste_ID
         self.coste_informes_total = coste_informes
 
+    @medido('optimizer.build', _candidato)
     def build_model(self):
         
         # --- Variables ---
@@ -54,11 +101,11 @@ class OptimizerV3:
                     self.variables[f'inv_final_{area}_{prod}_{g}'] = pulp.LpVariable(f'inv_final_{area}_{prod}_{g}', lowBound=0, cat='Integer')
 
         # --- Listas para la Función Objetivo ---
-        ingreso_terms = []
-        coste_variable_terms = []
-        coste_fijo_terms = []
         inventario_final_terms = []
-        coste_almacen_terms = [] 
+        # Por área, en moneda local: beneficio antes de intereses e impuestos y efecto en caja
+        # del periodo (cobros y pagos al contado). Pasan a FS al entrar en el objetivo.
+        beneficio_area = {area: [] for area in AREAS}
+        liquidez_area = {area: [] for area in AREAS}
         
         inv_actual_dict = self.current_state.get('inventarios_detalle', {})
         
@@ -73,12 +120,13 @@ class OptimizerV3:
             for prod, prod_var, open_var in [('X', prod_X_var, open_X_var), ('Y', prod_Y_var, open_Y_var)]:
                 cap = CAP_MAX[area][prod]
                 self.model += prod_var <= cap * open_var
-                self.model += prod_var >= 10 * open_var 
+                self.model += prod_var >= PRODUCCION_MINIMA * open_var 
                 
-                coste_fijo_terms.append(COSTE_FIJO[area][prod][0] * open_var)
                 precio_tipico = PRECIOS_TIPICOS[area][prod]
-                vc_rate = 0.155 if prod == 'X' else 0.30
-                coste_variable_terms.append((precio_tipico * vc_rate) * prod_var)
+                beneficio_area[area].append(-COSTE_FIJO[area][prod][0] * open_var)
+                beneficio_area[area].append(-(precio_tipico * VC_RATE[prod]) * prod_var)
+                liquidez_area[area].append(-COSTE_FIJO[area][prod][0] * open_var)
+                liquidez_area[area].append(-(precio_tipico * VC_RATE[prod] * PAGO_CONTADO[area]) * prod_var)
 
             # --- Lógica de Flujo de Inventario de CHIPS (X) ---
             grado_a_producir_X = self.production_grade_map.get((area, 'X'), -1)
@@ -98,8 +146,8 @@ class OptimizerV3:
             ventas_X_lujo = self.variables[f'ventas_{area}_X_1']
             inv_final_X_lujo = self.variables[f'inv_final_{area}_X_1']
 
-            self.model += ventas_X_std <= inv_X_actual_std + prod_X_std
-            self.model += ventas_X_lujo <= inv_X_actual_lujo + prod_X_lujo
+            self.model += ventas_X_std <= inv_X_actual_std + prod_X_std, f'Disp_{area}_X_0'
+            self.model += ventas_X_lujo <= inv_X_actual_lujo + prod_X_lujo, f'Disp_{area}_X_1'
             
             chips_disponibles_G0 = (inv_X_actual_std + prod_X_std - ventas_X_std)
             chips_disponibles_G1 = (inv_X_actual_lujo + prod_X_lujo - ventas_X_lujo)
@@ -123,8 +171,8 @@ class OptimizerV3:
             ventas_Y_lujo = self.variables[f'ventas_{area}_Y_1']
             inv_final_Y_lujo = self.variables[f'inv_final_{area}_Y_1']
             
-            self.model += ventas_Y_std <= inv_Y_actual_std + prod_Y_std
-            self.model += ventas_Y_lujo <= inv_Y_actual_lujo + prod_Y_lujo
+            self.model += ventas_Y_std <= inv_Y_actual_std + prod_Y_std, f'Disp_{area}_Y_0'
+            self.model += ventas_Y_lujo <= inv_Y_actual_lujo + prod_Y_lujo, f'Disp_{area}_Y_1'
             
             # --- LÓGICA DE CONSUMO (SIMPLIFICACIÓN ESTRATÉGICA 1:1) ---
             # Asumimos 1 Y0 consume 1 X0
@@ -134,15 +182,23 @@ class OptimizerV3:
             chips_X1_necesarios = prod_Y_lujo
             
             # **RESTRICCIÓN DE CONSUMO (La clave)**
-            self.model += chips_X0_necesarios <= chips_disponibles_G0
-            self.model += chips_X1_necesarios <= chips_disponibles_G1
+            # (en forma 'necesarios - disponibles <= 0' aunque no se produzca Y, para que el
+            # inventario quede siempre en el mismo lado)
+            self.model += chips_X0_necesarios - chips_disponibles_G0 <= 0, f'Consumo_{area}_X_0'
+            self.model += chips_X1_necesarios - chips_disponibles_G1 <= 0, f'Consumo_{area}_X_1'
 
             # --- Inventarios Finales y Costes de Almacén ---
-            self.model += inv_final_X_std == chips_disponibles_G0 - chips_X0_necesarios
-            self.model += inv_final_X_lujo == chips_disponibles_G1 - chips_X1_necesarios
+            self.model += inv_final_X_std == chips_disponibles_G0 - chips_X0_necesarios, f'InvFinal_{area}_X_0'
+            self.model += inv_final_X_lujo == chips_disponibles_G1 - chips_X1_necesarios, f'InvFinal_{area}_X_1'
             
-            self.model += inv_final_Y_std == inv_Y_actual_std + prod_Y_std - ventas_Y_std
-            self.model += inv_final_Y_lujo == inv_Y_actual_lujo + prod_Y_lujo - ventas_Y_lujo
+            self.model += inv_final_Y_std == inv_Y_actual_std + prod_Y_std - ventas_Y_std, f'InvFinal_{area}_Y_0'
+            self.model += inv_final_Y_lujo == inv_Y_actual_lujo + prod_Y_lujo - ventas_Y_lujo, f'InvFinal_{area}_Y_1'
+
+            # En todas ellas el inventario inicial está a la derecha: restar un volumen
+            # del inventario equivale a sumarlo a la constante de la restricción
+            for g in [0, 1]:
+                self.restricciones_inventario[(area, 'X', g)] = [f'Disp_{area}_X_{g}', f'Consumo_{area}_X_{g}', f'InvFinal_{area}_X_{g}']
+                self.restricciones_inventario[(area, 'Y', g)] = [f'Disp_{area}_Y_{g}', f'InvFinal_{area}_Y_{g}']
             
             for key, inv_final_var in [
                 ((area, 'X', 0), inv_final_X_std),
@@ -151,11 +207,13 @@ class OptimizerV3:
                 ((area, 'Y', 1), inv_final_Y_lujo)
             ]:
                 inventario_final_terms.append(inv_final_var)
-                coste_almacen_terms.append(inv_final_var * ALMACEN_MIN[key[0]][key[1]])
+                beneficio_area[area].append(-ALMACEN_MIN[key[0]][key[1]] * inv_final_var)
+                liquidez_area[area].append(-ALMACEN_MIN[key[0]][key[1]] * inv_final_var)
                 
                 cond = self.market_conditions.get(key)
                 if cond:
-                    ingreso_terms.append(cond['precio'] * self.variables[f'ventas_{key[0]}_{key[1]}_{key[2]}'])
+                    beneficio_area[area].append(cond['precio'] * self.variables[f'ventas_{key[0]}_{key[1]}_{key[2]}'])
+                    liquidez_area[area].append(cond['precio'] * COBRO_CONTADO[area] * self.variables[f'ventas_{key[0]}_{key[1]}_{key[2]}'])
                     self.model += self.variables[f'ventas_{key[0]}_{key[1]}_{key[2]}'] <= cond['demanda']
                 else:
                     self.model += self.variables[f'ventas_{key[0]}_{key[1]}_{key[2]}'] == 0
@@ -163,51 +221,132 @@ class OptimizerV3:
 
         # --- Función Objetivo (Ranking) - CORREGIDA CON NORMALIZACIÓN ---
         
-        ingreso_total_bruto = pulp.lpSum(ingreso_terms)
-        coste_variable_bruto = pulp.lpSum(coste_variable_terms)
-        coste_fijo_bruto = pulp.lpSum(coste_fijo_terms)
-        coste_almacen_bruto = pulp.lpSum(coste_almacen_terms)
         coste_estrategia_bruto = self.coste_publicidad_total + self.coste_ID_total + self.coste_informes_total
-        penalizacion_inactividad = pulp.lpSum([1 - self.variables[f'open_{area}_{prod}'] for area in AREAS for prod in ['X','Y']]) * 1000
+        penalizacion_inactividad = pulp.lpSum([1 - self.variables[f'open_{area}_{prod}'] for area in AREAS for prod in ['X','Y']]) * PENALIZACION_INACTIVIDAD
+
+        # --- Intereses por tramos e impuestos por área (variables auxiliares) ---
+        # Intereses sobre el saldo al cierre (caja inicial + flujo del periodo): positivo cobra,
+        # negativo paga TASA_NEG_MENOR hasta SUMAS_CRITICAS y TASA_NEG_MAYOR por encima. Impuesto
+        # sobre el beneficio positivo (incluidos los intereses). Ambos son cóncavos en el objetivo
+        # (las tasas de deuda crecen por tramos), así que bastan variables continuas.
+        # Saldo e impuesto se plantean en moneda local del área.
+        financiero_area = {area: 0 for area in AREAS}
+        if coef_financiero(self.ranking_model) > 0:
+            caja_inicial = caja_inicial_area(self.current_state, self.ranking_model)
+            for i, area in enumerate(AREAS):
+                gasto = coste_estrategia_bruto if area == AREA_GASTOS else 0
+                saldo_pos = pulp.LpVariable(f'saldo_pos_{area}', lowBound=0)
+                deuda_menor = pulp.LpVariable(f'deuda_menor_{area}', lowBound=0, upBound=SUMA_CRITICA[i] / ESCALA_FINANCIERA)
+                deuda_mayor = pulp.LpVariable(f'deuda_mayor_{area}', lowBound=0)
+                impuesto = pulp.LpVariable(f'impuesto_{area}', lowBound=0)
+                self.financieras.update({v.name: v for v in (saldo_pos, deuda_menor, deuda_mayor, impuesto)})
+
+                self.model += (ESCALA_FINANCIERA * (saldo_pos - deuda_menor - deuda_mayor) - pulp.lpSum(liquidez_area[area])
+                               == caja_inicial[i] - gasto), f'Saldo_{area}'
+                interes = ESCALA_FINANCIERA * (TASA_POS[i] * saldo_pos - TASA_NEG_MENOR[i] * deuda_menor
+                                               - TASA_NEG_MAYOR[i] * deuda_mayor)
+                self.model += (ESCALA_FINANCIERA * impuesto
+                               >= TASA_IMPUESTO[i] * (pulp.lpSum(beneficio_area[area]) - gasto + interes)), f'Impuesto_{area}'
+                financiero_area[area] = interes - ESCALA_FINANCIERA * impuesto
 
+        # Beneficio y liquidez del periodo en FS (como el estado, CashFlowEngine y v3.league);
+        # los gastos de la estrategia se pagan en AREA_GASTOS
+        cambio = dict(zip(AREAS, cambio_area(self.current_state)))
+        gasto_fs = coste_estrategia_bruto * cambio[AREA_GASTOS]
         beneficio_periodo_bruto = (
-            ingreso_total_bruto 
-            - coste_variable_bruto 
-            - coste_fijo_bruto 
-            - coste_almacen_bruto
-            - coste_estrategia_bruto
+            pulp.lpSum(cambio[area] * (pulp.lpSum(beneficio_area[area]) + financiero_area[area]) for area in AREAS)
+            - gasto_fs
             - penalizacion_inactividad
         )
         
-        liquidez_periodo_bruta = beneficio_periodo_bruto * 0.5 
+        # La penalización por inactividad no es caja: solo entra en el beneficio
+        liquidez_periodo_bruta = (
+            pulp.lpSum(cambio[area] * (pulp.lpSum(liquidez_area[area]) + financiero_area[area]) for area in AREAS)
+            - gasto_fs
+        )
         cuota_periodo_bruta = pulp.lpSum(self.variables[f'ventas_{a}_{p}_{g}'] for a in AREAS for p in ['X','Y'] for g in [0,1])
         inventarios_total_final_bruto = pulp.lpSum(inventario_final_terms)
 
-        beneficio_periodo_norm = beneficio_periodo_bruto / BASE_BENEFICIO
-        liquidez_periodo_norm = liquidez_periodo_bruta / BASE_LIQUIDEZ
-        cuota_periodo_norm = cuota_periodo_bruta / BASE_CUOTA
-        inventarios_total_final_norm = inventarios_total_final_bruto / BASE_INVENTARIO
+        peso_ben, peso_liq, peso_cuota, peso_inv = self.ranking_model.pesos
+        base_ben, base_liq, base_cuota, base_inv = self.ranking_model.bases
+
+        beneficio_periodo_norm = beneficio_periodo_bruto / base_ben
+        liquidez_periodo_norm = liquidez_periodo_bruta / base_liq
+        cuota_periodo_norm = cuota_periodo_bruta / base_cuota
+        inventarios_total_final_norm = inventarios_total_final_bruto / base_inv
 
         beneficio_total_norm = self.current_state.get('beneficio', 0) + beneficio_periodo_norm
         liquidez_total_norm = self.current_state.get('liquidez', 0) + liquidez_periodo_norm
         cuota_total_norm = self.current_state.get('cuota', 0) + cuota_periodo_norm
         
         ranking_score = (
-            0.4 * beneficio_total_norm +
-            0.3 * liquidez_total_norm +
-            0.2 * cuota_total_norm +
-            0.1 * inventarios_total_final_norm
+            peso_ben * beneficio_total_norm +
+            peso_liq * liquidez_total_norm +
+            peso_cuota * cuota_total_norm +
+            peso_inv * inventarios_total_final_norm
         )
         self.model += ranking_score
 
-    def solve(self):
-        self.model.solve(pulp.PULP_CBC_CMD(msg=0))
+    @medido('optimizer.solve', _candidato)
+    def solve(self, warm_start=False):
+        self.model.solve(pulp.PULP_CBC_CMD(msg=0, warmStart=warm_start))
         solution = {}
         for v in self.model.variables():
+            if v.name in self.financieras:
+                continue
             if v.value() is not None and v.value() > 0:
                 solution[v.name] = v.value()
         return solution
 
+    def set_initial_solution(self, solution):
+        # Punto de partida para warm start: la solución previa (nombres de variable -> valor)
+        solution = solution or {}
+        for nombre, var in self.variables.items():
+            var.setInitialValue(solution.get(nombre, 0))
+
+    def aplicar_pacto(self, area, prod, grado, volumen, precio):
+        """
+        Fija un pacto aceptado (venta B2B) sobre el modelo ya construido: el volumen sale del
+        inventario inicial de (area, prod, grado) y su ingreso entra en el objetivo como
+        constante. Solo se tocan las restricciones de ese inventario; si no hay stock
+        suficiente, el resto tiene que producirse en el mismo grado.
+        """
+        key = (area, prod, int(grado))
+        inv_actual = self.current_state.get('inventarios_detalle', {}).get(key, 0)
+        comprometido = sum(p['volumen'] for p in self.pactos if p['key'] == key)
+        if volumen + comprometido > inv_actual and self.production_grade_map.get((area, prod), -1) != key[2]:
+            raise ValueError(f"Stock insuficiente en {key} ({inv_actual - comprometido}) y no se produce ese grado")
+
+        for nombre in self.restricciones_inventario[key]:
+            self.model.constraints[nombre].constant += volumen
+
+        # El ingreso del pacto también mueve el saldo al cierre y la base del impuesto del área
+        ingreso = precio * volumen
+        if f'Saldo_{area}' in self.model.constraints:
+            self.model.constraints[f'Saldo_{area}'].constant -= ingreso * COBRO_CONTADO[area]
+            self.model.constraints[f'Impuesto_{area}'].constant -= TASA_IMPUESTO[AREAS.index(area)] * ingreso
+
+        peso_ben, peso_liq, peso_cuota, _ = self.ranking_model.pesos
+        base_ben, base_liq, base_cuota, _ = self.ranking_model.bases
+        ingreso_fs = ingreso * cambio_area(self.current_state)[AREAS.index(area)]
+        self.model.objective.constant += (peso_ben * ingreso_fs / base_ben
+                                          + peso_liq * ingreso_fs * COBRO_CONTADO[area] / base_liq
+                                          + peso_cuota * volumen / base_cuota)
+
+        # El plan previo puede vender unidades que ya no existen: se recorta para el warm start
+        ventas = self.variables[f'ventas_{area}_{prod}_{key[2]}']
+        producido = self.variables[f'prod_{area}_{prod}'].varValue or 0
+        if self.production_grade_map.get((area, prod), -1) != key[2]:
+            producido = 0
+        if ventas.varValue is not None:
+            ventas.setInitialValue(max(0, min(ventas.varValue, inv_actual - comprometido - volumen + producido)))
+        self.pactos.append({'key': key, 'volumen': volumen, 'precio': precio})
+
+    def reoptimizar_con_pacto(self, area, prod, grado, volumen, precio):
+        # Delta: aplica el pacto y re-resuelve partiendo de la solución anterior
+        self.aplicar_pacto(area, prod, grado, volumen, precio)
+        return self.solve(warm_start=True)
+
     def get_objective_value(self):
         if self.model.objective:
             return self.model.objective.value()
@@ -0,0 +1,119 @@
+import numpy as np
+from src.params import AREAS, PRECIOS_TIPICOS
+from v3.optimizer_pulp import VC_RATE
+from v3.ranking import get_ranking_model
+from v3.cashflow import CashFlowEngine, COBRO
+
+
+class PactAnalyzer:
+    """
+    Evalúa pactos de venta de stock sobre una rejilla 2-D precio x volumen en una
+    sola pasada NumPy, para cualquier área/producto/grado.
+
+    estado_bruto: componentes sin normalizar del estado actual
+        {'beneficio', 'liquidez', 'cuota', 'inventarios'} (inventarios = total).
+    Beneficio y caja del pacto salen de CashFlowEngine (cobro según AR, intereses por
+    tramos e impuestos del área), con caja_area en moneda local y convertidos a FS.
+    """
+    def __init__(self, estado_bruto, inventarios_detalle, ranking_model=None, caja_area=None, tipo_cambio=None):
+        self.estado = estado_bruto
+        self.inventarios_detalle = inventarios_detalle or {}
+        self.ranking_model = ranking_model or get_ranking_model()
+        self.motor = CashFlowEngine(
+            caja_inicial=[caja_area[a] for a in AREAS] if caja_area else estado_bruto['liquidez'],
+            tipo_cambio=tipo_cambio)
+        # Periodo sin pacto: los intereses e impuestos de la caja actual no son efecto del pacto
+        base = self.motor.proyectar(np.zeros(len(AREAS)))
+        self.beneficio_sin_pacto = float((base['beneficio'][0, 0] * self.motor.cambio).sum())
+        self.liquidez_sin_pacto = float(base['liquidez'][0, 0])
+        self.ranking_actual = float(self.ranking_model.score_batch(
+            estado_bruto['beneficio'], estado_bruto['liquidez'], estado_bruto['cuota'],
+            estado_bruto['inventarios'], normalizado=False))
+
+    def coste_variable(self, area, prod):
+        return PRECIOS_TIPICOS[area][prod] * VC_RATE[prod]
+
+    def puntuar_ventas(self, areas, precios, volumenes, coste_unitario, cobro=None):
+        """
+        Ranking tras vender 'volumenes' de stock a 'precios' (precio y coste unitario en moneda
+        local del área; 'areas' son índices de AREAS). Todo se difunde a una forma común y se
+        proyecta en una sola llamada a CashFlowEngine, un escenario de un periodo por elemento.
+        cobro: fracciones (contado, próximo, subsiguiente) de cada venta, forma (..., 3);
+        por defecto las de AR_STRUCTURE del área.
+        """
+        areas, p, v, coste = np.broadcast_arrays(np.asarray(areas), np.asarray(precios, dtype=float),
+                                                 np.asarray(volumenes, dtype=float),
+                                                 np.asarray(coste_unitario, dtype=float))
+        forma, areas = p.shape, areas.ravel()
+        filas = np.arange(areas.size)
+        ventas = np.zeros((areas.size, 1, len(AREAS)))
+        existencias = np.zeros_like(ventas)
+        ventas[filas, 0, areas] = (p * v).ravel()
+        existencias[filas, 0, areas] = (coste * v).ravel()
+        if cobro is not None:
+            fracciones = np.broadcast_to(COBRO, (areas.size, len(AREAS), 3)).copy()
+            fracciones[filas, areas] = np.broadcast_to(np.asarray(cobro, dtype=float), forma + (3,)).reshape(-1, 3)
+            cobro = fracciones
+        res = self.motor.proyectar(ventas, coste_existencias=existencias, cobro=cobro)
+        beneficio = (res['beneficio'][:, 0] * self.motor.cambio).sum(axis=-1).reshape(forma) - self.beneficio_sin_pacto
+        liquidez = res['liquidez'][:, 0].reshape(forma) - self.liquidez_sin_pacto
+        return self.ranking_model.score_batch(
+            self.estado['beneficio'] + beneficio,
+            self.estado['liquidez'] + liquidez,
+            self.estado['cuota'] + v,
+            self.estado['inventarios'] - v,
+            normalizado=False
+        )
+
+    def evaluar(self, area, prod, precios, volumenes):
+        """Ranking para cada (precio, volumen): array de forma (len(precios), len(volumenes))."""
+        p = np.asarray(precios, dtype=float)[:, None]
+        v = np.asarray(volumenes, dtype=float)[None, :]
+        return self.puntuar_ventas(AREAS.index(area), p, v, self.coste_variable(area, prod))
+
+    def frontera(self, area, prod, grado, precio_min=None, precio_max=None, paso_precio=0.1,
+                 n_volumenes=200, stock=None):
+        """
+        Rejilla completa y frontera de Pareto (máxima ganancia de ranking, mínimas
+        unidades comprometidas). Como el ranking crece con el precio, el mejor precio
+        de cada volumen es siempre precio_max; lo informativo es la frontera en volumen
+        y el precio mínimo que todavía mejora el ranking actual.
+        El grado solo elige el stock; el coste variable es el del producto.
+        """
+        if stock is None:
+            stock = self.inventarios_detalle.get((area, prod, grado), 0)
+        vc = self.coste_variable(area, prod)
+        if precio_min is None:
+            precio_min = vc
+        if precio_max is None:
+            precio_max = PRECIOS_TIPICOS[area][prod]
+        # Rejilla en céntimos enteros: sin la deriva de np.arange con pasos decimales
+        paso = max(int(round(paso_precio * 100)), 1)
+        precios = np.arange(int(round(precio_min * 100)), int(round(precio_max * 100)) + 1, paso) / 100.0
+        volumenes = np.unique(np.linspace(0, stock, n_volumenes + 1).round()) if stock > 0 else np.zeros(1)
+
+        ganancia = self.evaluar(area, prod, precios, volumenes) - self.ranking_actual
+
+        # Mejor precio por volumen y precio mínimo que no empeora el ranking
+        idx_mejor = np.argmax(ganancia, axis=0)
+        mejor = ganancia[idx_mejor, np.arange(len(volumenes))]
+        rentable = ganancia > 0
+        idx_min = np.where(rentable.any(axis=0), np.argmax(rentable, axis=0), -1)
+
+        # Frontera: volúmenes cuya mejor ganancia supera a la de todos los volúmenes menores
+        previo = np.concatenate([[-np.inf], np.maximum.accumulate(mejor)[:-1]])
+        en_frontera = mejor > previo
+        frontera = [
+            {
+                'volumen': float(volumenes[j]),
+                'precio': float(precios[idx_mejor[j]]),
+                'ganancia': float(mejor[j]),
+                'ranking': float(mejor[j] + self.ranking_actual),
+                'precio_minimo_rentable': float(precios[idx_min[j]]) if idx_min[j] >= 0 else None,
+            }
+            for j in np.flatnonzero(en_frontera)
+        ]
+        return {
+            'precios': precios, 'volumenes': volumenes, 'ganancia': ganancia,
+            'frontera': frontera, 'ranking_actual': self.ranking_actual,
+        }
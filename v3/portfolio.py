@@ -0,0 +1,196 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pulp
+from src.params import AREAS, CAP_MAX, AP_STRUCTURE
+from src.parser import LSTParser, localizar_lsts, numero_decision
+from src.forms import FormsExporter
+from v3.offers import OfferBatchEvaluator, leer_ofertas, numero_compania
+from v3.ranking import estado_bruto, cargar_modelo_calibrado, COMPANIA_PROPIA
+
+NOMBRE_PRODUCTO = {'X': 'CHIP', 'Y': 'PC'}
+VIA_DEFECTO = 'EXPR'
+
+
+def codigo_area(area):
+    # Códigos de área/moneda de los formularios: US=1, EU=2, BR=3 (CM=4)
+    return AREAS.index(area) + 1 if area in AREAS else 4
+
+
+class OfferPortfolio:
+    """
+    Selecciona el subconjunto de ofertas B2B (H6) y sus volúmenes que maximiza el ranking.
+
+    Cada oferta puede servirse desde stock (inventarios_detalle, por grado) o desde
+    producción nueva (CAP_MAX * plantas menos lo ya comprometido por A2, solo grados
+    con patente), y solo se produce para un (área, producto, grado) cuando su stock
+    ya está agotado por la cartera; sin dato de plantas para un (área, producto) no hay
+    capacidad. La caja al cierre del periodo (cobros al contado de AR menos pagos al
+    contado de AP de lo producido, pasados a FS) no puede bajar de caja_minima (FS).
+    Si una oferta trae 'min_volume' se acepta parcialmente hasta ese mínimo; si no,
+    es todo o nada.
+    """
+    def __init__(self, estado_bruto_actual, inventarios_detalle, plantas=None,
+                 produccion_comprometida=None, patentes=None, caja_minima=0.0, ranking_model=None,
+                 caja_area=None, tipo_cambio=None):
+        self.evaluador = OfferBatchEvaluator(estado_bruto_actual, inventarios_detalle, ranking_model,
+                                             caja_area, tipo_cambio)
+        self.estado = self.evaluador.estado
+        self.ranking_model = self.evaluador.ranking_model
+        self.inventarios_detalle = self.evaluador.inventarios_detalle
+        self.plantas = plantas or {}
+        self.produccion_comprometida = produccion_comprometida or {}
+        self.patentes = patentes
+        self.caja_minima = caja_minima
+
+    def capacidad_libre(self, area, prod):
+        total = CAP_MAX[area][prod] * self.plantas.get((area, prod), 0)
+        return max(total - self.produccion_comprometida.get((area, prod), 0), 0)
+
+    def _coeficientes(self, cols):
+        """
+        Ganancia de ranking por unidad servida desde stock y desde producción. La de stock es
+        la secante del modelo de OfferBatchEvaluator (CashFlowEngine: impuestos, intereses y
+        paso a FS) al volumen completo; producir no consume inventario pero paga al contado.
+        """
+        _, w_l, _, w_i = (w / b for w, b in zip(self.ranking_model.pesos, self.ranking_model.bases))
+        volumen = np.maximum(cols['volumen'], 1.0)
+        ranking = self.evaluador.pactos.puntuar_ventas(
+            cols['area'], cols['precio'], volumen, cols['coste_var'],
+            cobro=np.stack([cols['contado'], cols['proximo'], cols['subsiguiente']], axis=-1))
+        desde_stock = (ranking - self.evaluador.ranking_actual) / volumen
+        desde_prod = desde_stock + w_i - w_l * cols['coste_var'] * cols['pago_contado'] * cols['cambio']
+        return desde_stock, desde_prod
+
+    def optimizar(self, ofertas, limite_tiempo=None):
+        if not ofertas:
+            return {'estado': 'Optimal', 'contratos': [], 'ganancia': 0.0,
+                    'ranking': self.evaluador.ranking_actual, 'descartadas': []}
+        cols, motivos = self.evaluador.columnas(ofertas)
+        n = len(ofertas)
+        cols['pago_contado'] = np.array([AP_STRUCTURE.get(o.get('area'), {}).get('cash', 0.0) for o in ofertas])
+        minimo = np.array([float(o.get('min_volume') or o.get('volume') or 0) if cols['valida'][i] else 0.0
+                           for i, o in enumerate(ofertas)])
+        c_stock, c_prod = self._coeficientes(cols)
+        validas = [i for i in range(n) if cols['valida'][i] and cols['volumen'][i] > 0]
+
+        model = pulp.LpProblem("Portfolio_H6", pulp.LpMaximize)
+        y = {i: pulp.LpVariable(f"acepta_{i}", cat='Binary') for i in validas}
+        s = {i: pulp.LpVariable(f"stock_{i}", lowBound=0) for i in validas}
+        q = {i: pulp.LpVariable(f"prod_{i}", lowBound=0) for i in validas}
+
+        model += pulp.lpSum(c_stock[i] * s[i] + c_prod[i] * q[i] for i in validas)
+
+        grupos_stock, grupos_cap = {}, {}
+        for i in validas:
+            o = ofertas[i]
+            area, prod, grado = o['area'], o['product'], int(float(o.get('grade', 0)))
+            grupos_stock.setdefault((area, prod, grado), []).append(i)
+            if self.patentes is not None and grado > self.patentes.get((area, prod), -1):
+                model += q[i] == 0
+            else:
+                grupos_cap.setdefault((area, prod), []).append(i)
+            model += s[i] + q[i] <= cols['volumen'][i] * y[i]
+            model += s[i] + q[i] >= min(minimo[i], cols['volumen'][i]) * y[i]
+
+        for key, idx in grupos_stock.items():
+            stock = self.inventarios_detalle.get(key, 0)
+            nombre = '_'.join(map(str, key))
+            model += pulp.lpSum(s[i] for i in idx) <= stock, f"Stock_{nombre}"
+            # Primero el stock: el término -w_i del inventario haría preferir producir
+            con_produccion = [i for i in idx if key[:2] in grupos_cap and i in grupos_cap[key[:2]]]
+            if stock > 0 and con_produccion:
+                agotado = pulp.LpVariable(f"agotado_{nombre}", cat='Binary')
+                model += pulp.lpSum(s[i] for i in idx) >= stock * agotado, f"Agota_{nombre}"
+                model += (pulp.lpSum(q[i] for i in con_produccion)
+                          <= self.capacidad_libre(key[0], key[1]) * agotado), f"ProdTrasStock_{nombre}"
+        for (area, prod), idx in grupos_cap.items():
+            model += pulp.lpSum(q[i] for i in idx) <= self.capacidad_libre(area, prod), f"Cap_{area}_{prod}"
+
+        # Calendario de caja: lo cobrado al contado menos lo pagado al contado por producir, en FS
+        model += (self.estado['liquidez']
+                  + pulp.lpSum(cols['cambio'][i] * (cols['precio'][i] * cols['contado'][i] * (s[i] + q[i])
+                                                    - cols['coste_var'][i] * cols['pago_contado'][i] * q[i])
+                               for i in validas)
+                  >= self.caja_minima), "Caja_Minima"
+
+        model.solve(pulp.PULP_CBC_CMD(msg=0, timeLimit=limite_tiempo))
+        estado = pulp.LpStatus[model.status]
+
+        contratos = []
+        ganancia = 0.0
+        for i in validas:
+            vs, vq = (s[i].varValue or 0.0), (q[i].varValue or 0.0)
+            if (y[i].varValue or 0) < 0.5 or vs + vq <= 0:
+                continue
+            g = float(c_stock[i] * vs + c_prod[i] * vq)
+            ganancia += g
+            contrato = dict(ofertas[i])
+            contrato.update({'volumen_aceptado': round(vs + vq), 'desde_stock': round(vs),
+                             'desde_produccion': round(vq), 'ganancia': round(g, 6)})
+            contratos.append(contrato)
+        contratos.sort(key=lambda c: -c['ganancia'])
+        descartadas = [dict(ofertas[i], motivo=motivos[i]) for i in range(n) if not cols['valida'][i]]
+        return {
+            'estado': estado, 'contratos': contratos, 'ganancia': ganancia,
+            'ranking': self.evaluador.ranking_actual + ganancia, 'descartadas': descartadas,
+        }
+
+
+def contratos_h6(contratos, periodo, compania):
+    """Filas H6 (ventas industriales) de los contratos elegidos, listas para FormsExporter.export_H6."""
+    filas = []
+    for c in contratos:
+        area = c['area']
+        filas.append({
+            'cia_vende': compania, 'area_vende': codigo_area(area),
+            'cia_compra': numero_compania(c.get('buyer'), defecto=0),
+            'area_compra': codigo_area(c.get('buyer_area') or area),
+            'contado': float(c.get('cash', 0)), 'proximo': float(c.get('next', 0)),
+            'subsiguiente': float(c.get('later', 0)), 'conversion': 'N',
+            'producto': NOMBRE_PRODUCTO[c['product']], 'grado': int(float(c.get('grade', 0))),
+            'unidades_k': round(c['volumen_aceptado'] / 1000.0, 2), 'moneda': codigo_area(area),
+            'precio': round(float(c['price']), 2), 'via': c.get('via') or VIA_DEFECTO, 'periodo': periodo,
+        })
+    return filas
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Cartera óptima de ofertas B2B y formulario H6.')
+    ap.add_argument('--data', default=os.path.join(os.getcwd(), 'data'), help='Carpeta con los LST')
+    ap.add_argument('--input', required=True, help='Fichero de ofertas (.csv o .jsonl)')
+    ap.add_argument('--out', default=os.path.join(os.getcwd(), 'outputs', 'forms'), help='Carpeta de formularios')
+    ap.add_argument('--caja-minima', type=float, default=0.0)
+    args = ap.parse_args(argv)
+
+    files, _ = localizar_lsts(args.data)
+    if not files:
+        raise FileNotFoundError(f"No se encontraron archivos de Decisión en {args.data}")
+    parser = LSTParser()
+    historicos = [parser.parse_file(f) for f in files]
+    modelo = cargar_modelo_calibrado(args.data, historicos)
+    actual = historicos[-1]
+    beneficio, liquidez, cuota, inventarios = estado_bruto(actual)
+    cartera = OfferPortfolio(
+        {'beneficio': beneficio, 'liquidez': liquidez, 'cuota': cuota, 'inventarios': inventarios},
+        actual.get('inventarios_detalle', {}), plantas=actual.get('plantas'),
+        patentes=actual.get('patentes_poseidas') or None,
+        caja_minima=args.caja_minima, ranking_model=modelo,
+        caja_area=actual.get('caja_area'), tipo_cambio=actual.get('tipo_cambio')
+    )
+    resultado = cartera.optimizar(leer_ofertas(args.input))
+    periodo = numero_decision(files[-1]) + 1
+    filas = contratos_h6(resultado['contratos'], periodo, actual.get('compania', COMPANIA_PROPIA))
+    path = FormsExporter(args.out).export_H6(periodo, filas)
+    print(f"[{resultado['estado']}] {len(resultado['contratos'])} contratos, "
+          f"ranking {cartera.evaluador.ranking_actual:.4f} -> {resultado['ranking']:.4f}", file=sys.stderr)
+    for c in resultado['contratos']:
+        print(f"  Cía {c.get('buyer')} {c['area']}-{c['product']}-{c.get('grade')}: {c['volumen_aceptado']} uds "
+              f"a {float(c['price']):.2f} (stock {c['desde_stock']}, producción {c['desde_produccion']})", file=sys.stderr)
+    print(f"-> {path}", file=sys.stderr)
+    return resultado
+
+
+if __name__ == '__main__':
+    main()
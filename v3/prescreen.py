@@ -0,0 +1,308 @@
+import numpy as np
+from src.profiling import medido
+from src.params import AREAS, CAP_MAX, ALMACEN_MIN, COSTE_FIJO, PRECIOS_TIPICOS
+from v3.optimizer_pulp import (
+    OptimizerV3, VC_RATE, PRODUCCION_MINIMA, PENALIZACION_INACTIVIDAD, AREA_GASTOS,
+    caja_inicial_area, cambio_area, coef_financiero
+)
+from v3.cashflow import (
+    COBRO_CONTADO, PAGO_CONTADO, TASA_POS, TASA_NEG_MENOR, TASA_NEG_MAYOR, SUMA_CRITICA, TASA_IMPUESTO
+)
+from v3.ranking import get_ranking_model
+
+# Tolerancia para declarar empate entre abrir y no abrir una planta
+TOL_EMPATE = 1e-9
+
+
+class PrescreenAnalitico:
+    """
+    Evaluador analítico (NumPy) del mismo modelo que OptimizerV3.
+
+    Con la producción de PCs (Y) desactivada en todas las áreas, el MILP se
+    separa en 6 problemas independientes (área, producto) cuyo óptimo sale de
+    comparar 'planta cerrada' contra 'planta abierta' en los puntos de ruptura
+    (producción mínima, cubrir la demanda, capacidad). Se evalúa un lote de
+    candidatos (precios/demandas) de una vez.
+    Si Y consume chips (acoplamiento X->Y) la configuración no es simple y el
+    candidato debe ir al MILP. Los empates abrir/cerrar también se marcan.
+    Los intereses por tramos y el impuesto de cada área se tratan recta a recta
+    (ver _evaluar_area); si no se puede certificar el óptimo, el candidato es ambiguo.
+    """
+    def __init__(self, current_state, production_grade_map, coste_estrategia=0.0, ranking_model=None):
+        self.current_state = current_state
+        self.inventarios = current_state.get('inventarios_detalle', {})
+        patentes = current_state.get('patentes_poseidas', {
+            ('EU', 'X'): 0, ('EU', 'Y'): 0, ('US', 'X'): 0, ('US', 'Y'): 0, ('BR', 'X'): 0, ('BR', 'Y'): 0
+        })
+        # Grado efectivo a producir (mismo chequeo de patente que build_model)
+        self.grado_efectivo = {}
+        for area in AREAS:
+            for prod in ['X', 'Y']:
+                g = production_grade_map.get((area, prod), -1)
+                if g > patentes.get((area, prod), 0):
+                    g = -1
+                self.grado_efectivo[(area, prod)] = g
+        self.coste_estrategia = coste_estrategia
+
+        # Coeficientes del objetivo normalizado (mismo modelo de ranking que OptimizerV3)
+        modelo = ranking_model or get_ranking_model()
+        self.pesos = modelo.pesos
+        peso_ben, peso_liq, peso_cuota, peso_inv = modelo.pesos
+        base_ben, base_liq, base_cuota, base_inv = modelo.bases
+        # Un euro de beneficio y un euro de caja; cobros y pagos al contado según AR/AP del área
+        self.coef_beneficio = peso_ben / base_ben
+        self.coef_caja = peso_liq / base_liq
+        self.coef_venta = peso_cuota / base_cuota
+        self.coef_inventario = peso_inv / base_inv
+        # Intereses e impuestos: mismo peso y caja de partida que OptimizerV3
+        self.coef_financiero = coef_financiero(modelo)
+        self.caja_inicial = caja_inicial_area(current_state, modelo)
+        self.cambio = cambio_area(current_state)
+        self._ultimo = None
+
+    def es_simple(self):
+        # Acoplamiento: una planta de Y con grado 0/1 consume chips de X
+        if any(self.grado_efectivo[(area, 'Y')] in (0, 1) for area in AREAS):
+            return False
+        # El MILP usa variables enteras: inventarios fraccionarios no se modelan aquí
+        return all(float(v).is_integer() for v in self.inventarios.values() if v)
+
+    @medido('prescreen')
+    def evaluar(self, condiciones, n=None):
+        """
+        condiciones: {(area, prod, grado): {'precio': array|float, 'demanda': array|float}}
+        Devuelve (objetivos, ambiguos) como arrays de longitud n.
+        """
+        if n is None:
+            n = max([np.size(c['precio']) for c in condiciones.values()] +
+                    [np.size(c['demanda']) for c in condiciones.values()] + [1])
+        a, l, c = self.coef_beneficio, self.coef_caja, self.coef_venta
+
+        objetivo = np.full(n, self.pesos[0] * self.current_state.get('beneficio', 0)
+                           + self.pesos[1] * self.current_state.get('liquidez', 0)
+                           + self.pesos[2] * self.current_state.get('cuota', 0), dtype=float)
+        objetivo -= a * PENALIZACION_INACTIVIDAD * len(AREAS) * 2
+        ambiguos = np.zeros(n, dtype=bool)
+        decisiones = {}
+
+        for i, area in enumerate(AREAS):
+            valor, amb, dec = self._evaluar_area(i, area, condiciones, n, a, l, c)
+            objetivo += valor
+            ambiguos |= amb
+            decisiones.update(dec)
+
+        if not self.es_simple():
+            ambiguos[:] = True
+        self._ultimo = decisiones
+        return objetivo, ambiguos
+
+    def _evaluar_area(self, i, area, condiciones, n, a, l, c):
+        """
+        Las dos unidades (X, Y) de un área con sus intereses e impuestos. El término
+        financiero k*(intereses - impuesto) es el mínimo de 6 rectas en (beneficio, saldo)
+        (3 tramos de interés x con/sin impuesto): con cada recta el problema es lineal y se
+        resuelve como sin ellos. La menor de esas 6 cotas es el óptimo si en su solución la
+        recta es la activa; si no, el candidato queda ambiguo.
+        Flujos en moneda local: los coeficientes de beneficio y caja llevan el tipo de cambio
+        (la penalización por inactividad no, como en OptimizerV3).
+        """
+        a_pen = a
+        a, l = a * self.cambio[i], l * self.cambio[i]
+        k = self.coef_financiero * self.cambio[i]
+        gasto = self.coste_estrategia if area == AREA_GASTOS else 0.0
+        caja = self.caja_inicial[i] if k else 0.0
+        tramos = [(TASA_POS[i], 0.0), (TASA_NEG_MENOR[i], 0.0),
+                  (TASA_NEG_MAYOR[i], (TASA_NEG_MAYOR[i] - TASA_NEG_MENOR[i]) * SUMA_CRITICA[i])]
+        rectas = [(tau, r, i0) for tau in (0.0, TASA_IMPUESTO[i]) for r, i0 in tramos] if k else [(0.0, 0.0, 0.0)]
+
+        valores, ambiguos, decisiones = [], [], []
+        for tau, r, i0 in rectas:
+            # Coeficientes efectivos de beneficio y caja con esta recta
+            a_j = a - k * tau
+            l_j = l + k * (1 - tau) * r
+            valor = np.full(n, k * (1 - tau) * (r * caja + i0) - (a_j + l_j) * gasto)
+            amb = np.zeros(n, dtype=bool)
+            dec = {}
+            for prod in ['X', 'Y']:
+                v, am, d = self._evaluar_unidad(area, prod, condiciones, n, a_j, l_j, c, a_pen)
+                valor += v
+                amb |= am
+                dec[(area, prod)] = d
+            valores.append(valor)
+            ambiguos.append(amb)
+            decisiones.append(dec)
+        if len(rectas) == 1:
+            return valores[0], ambiguos[0], decisiones[0]
+
+        j = np.argmin(np.stack(valores), axis=0)
+        cols = np.arange(n)
+        cota = np.stack(valores)[j, cols]
+        amb = np.stack(ambiguos)[j, cols]
+        dec = {}
+        for unidad in decisiones[0]:
+            dec[unidad] = {
+                'abrir': np.choose(j, [d[unidad]['abrir'] for d in decisiones]),
+                'produccion': np.choose(j, [d[unidad]['produccion'] for d in decisiones]),
+                'ventas': [np.choose(j, [d[unidad]['ventas'][g] for d in decisiones]) for g in (0, 1)],
+                'inv': decisiones[0][unidad]['inv'], 'grado': decisiones[0][unidad]['grado'],
+            }
+
+        # Término financiero real frente al de la recta elegida, en la solución elegida
+        beneficio, flujo = self._flujos_area(area, condiciones, n, dec)
+        beneficio, saldo = beneficio - gasto, caja + flujo - gasto
+        tau, r, i0 = (np.array(col)[j] for col in zip(*rectas))
+        lineal = k * ((1 - tau) * (r * saldo + i0) - tau * beneficio)
+        deuda = np.maximum(-saldo, 0.0)
+        menor = np.minimum(deuda, SUMA_CRITICA[i])
+        interes = TASA_POS[i] * np.maximum(saldo, 0.0) - TASA_NEG_MENOR[i] * menor - TASA_NEG_MAYOR[i] * (deuda - menor)
+        real = k * (interes - TASA_IMPUESTO[i] * np.maximum(beneficio + interes, 0.0))
+        amb |= lineal - real > TOL_EMPATE
+        return cota + real - lineal, amb, dec
+
+    def _flujos_area(self, area, condiciones, n, decisiones):
+        # Beneficio antes de intereses e impuestos y caja del periodo de un área (como OptimizerV3)
+        beneficio = np.zeros(n)
+        flujo = np.zeros(n)
+        for prod in ['X', 'Y']:
+            dec = decisiones[(area, prod)]
+            vc = PRECIOS_TIPICOS[area][prod] * VC_RATE[prod]
+            fijo = COSTE_FIJO[area][prod][0] * dec['abrir']
+            beneficio -= vc * dec['produccion'] + fijo
+            flujo -= vc * PAGO_CONTADO[area] * dec['produccion'] + fijo
+            for g in (0, 1):
+                cond = condiciones.get((area, prod, g))
+                precio = np.broadcast_to(np.asarray(cond['precio'], dtype=float), (n,)) if cond else 0.0
+                inv_final = dec['inv'][g] + (dec['produccion'] if dec['grado'] == g else 0.0) - dec['ventas'][g]
+                almacen = ALMACEN_MIN[area][prod] * inv_final
+                beneficio += precio * dec['ventas'][g] - almacen
+                flujo += precio * COBRO_CONTADO[area] * dec['ventas'][g] - almacen
+        return beneficio, flujo
+
+    def _evaluar_unidad(self, area, prod, condiciones, n, a, l, c, a_penalizacion):
+        cap = CAP_MAX[area][prod]
+        h = self.coef_inventario - (a + l) * ALMACEN_MIN[area][prod]  # Valor de 1 unidad en inventario final
+        gp = self.grado_efectivo[(area, prod)]
+        inv = [float(self.inventarios.get((area, prod, g), 0) or 0) for g in (0, 1)]
+        v_prod = (h if gp in (0, 1) else 0.0) - (a + l * PAGO_CONTADO[area]) * PRECIOS_TIPICOS[area][prod] * VC_RATE[prod]
+        # La penalización por inactividad no es dinero: su coeficiente no cambia con intereses e impuestos
+        coste_apertura = (a + l) * COSTE_FIJO[area][prod][0] - a_penalizacion * PENALIZACION_INACTIVIDAD
+
+        ambiguos = np.zeros(n, dtype=bool)
+        v_venta, demanda = [], []
+        for g in (0, 1):
+            cond = condiciones.get((area, prod, g))
+            if cond is None:
+                v_venta.append(np.zeros(n))
+                demanda.append(np.zeros(n))
+                continue
+            precio = np.broadcast_to(np.asarray(cond['precio'], dtype=float), (n,))
+            dem = np.broadcast_to(np.asarray(cond['demanda'], dtype=float), (n,))
+            ambiguos |= dem < 0  # MILP infactible: se deja al solver
+            v_venta.append((a + l * COBRO_CONTADO[area]) * precio + c - h)
+            demanda.append(np.floor(np.maximum(dem, 0)))
+
+        # Planta cerrada: solo se vende inventario existente
+        ventas_cerrada = [np.where(v_venta[g] > 0, np.minimum(demanda[g], inv[g]), 0.0) for g in (0, 1)]
+        valor_cerrada = v_venta[0] * ventas_cerrada[0] + v_venta[1] * ventas_cerrada[1]
+
+        # Planta abierta: función cóncava a trozos en la producción -> basta con los puntos de ruptura
+        if gp in (0, 1):
+            otro = 1 - gp
+            cubrir = np.clip(demanda[gp] - inv[gp], PRODUCCION_MINIMA, cap)
+            prod_cand = np.stack([np.full(n, float(PRODUCCION_MINIMA)), cubrir, np.full(n, float(cap))])
+            ventas_gp = np.where(v_venta[gp] > 0, np.minimum(demanda[gp], inv[gp] + prod_cand), 0.0)
+            valores = v_prod * prod_cand + v_venta[gp] * ventas_gp + (v_venta[otro] * ventas_cerrada[otro])
+            idx = np.argmax(valores, axis=0)
+            cols = np.arange(n)
+            produccion = prod_cand[idx, cols]
+            ventas_abierta = [None, None]
+            ventas_abierta[gp] = ventas_gp[idx, cols]
+            ventas_abierta[otro] = ventas_cerrada[otro]
+            valor_abierta = valores[idx, cols] - coste_apertura
+        else:
+            produccion = np.full(n, float(cap if v_prod > 0 else PRODUCCION_MINIMA))
+            ventas_abierta = ventas_cerrada
+            valor_abierta = v_prod * produccion + valor_cerrada - coste_apertura
+
+        abrir = valor_abierta > valor_cerrada
+        ambiguos |= np.abs(valor_abierta - valor_cerrada) <= TOL_EMPATE
+        valor = np.maximum(valor_abierta, valor_cerrada) + h * (inv[0] + inv[1])
+
+        decision = {
+            'abrir': abrir,
+            'produccion': np.where(abrir, produccion, 0.0),
+            'ventas': [np.where(abrir, ventas_abierta[g], ventas_cerrada[g]) for g in (0, 1)],
+            'inv': inv,
+            'grado': gp,
+        }
+        return valor, ambiguos, decision
+
+    def solucion(self, i):
+        """Reconstruye la solución del candidato i con el formato de OptimizerV3.solve()."""
+        solution = {}
+        for (area, prod), dec in self._ultimo.items():
+            produccion = float(dec['produccion'][i])
+            if dec['abrir'][i]:
+                solution[f'open_{area}_{prod}'] = 1.0
+                solution[f'prod_{area}_{prod}'] = produccion
+            for g in (0, 1):
+                ventas = float(dec['ventas'][g][i])
+                inv_final = dec['inv'][g] + (produccion if dec['grado'] == g else 0.0) - ventas
+                if ventas > 0:
+                    solution[f'ventas_{area}_{prod}_{g}'] = ventas
+                if inv_final > 0:
+                    solution[f'inv_final_{area}_{prod}_{g}'] = inv_final
+        return solution
+
+
+def comprobar_consistencia(n_instancias=200, semilla=0, verbose=True):
+    """
+    Compara el pre-filtro analítico contra OptimizerV3 (CBC) en instancias aleatorias.
+    Devuelve la máxima diferencia absoluta de objetivo entre candidatos no ambiguos.
+    """
+    rng = np.random.default_rng(semilla)
+    max_diff = 0.0
+    comparados = 0
+    for _ in range(n_instancias):
+        area = AREAS[rng.integers(len(AREAS))]
+        prod = ['X', 'Y'][rng.integers(2)]
+        grado = int(rng.integers(2))
+        inventarios = {
+            (a, p, g): int(rng.integers(0, 3) * rng.integers(0, 60000))
+            for a in AREAS for p in ['X', 'Y'] for g in (0, 1)
+        }
+        patentes = {(a, p): int(rng.integers(0, 3)) for a in AREAS for p in ['X', 'Y']}
+        estado = {
+            'beneficio': float(rng.normal()), 'liquidez': float(rng.normal()), 'cuota': float(rng.random()),
+            'inventarios_detalle': inventarios, 'patentes_poseidas': patentes,
+        }
+        # Solo X se produce (sin acoplamiento X->Y): candidatos simples
+        production_grade_map = {(a, 'X'): int(rng.integers(-1, 2)) for a in AREAS}
+        production_grade_map = {k: v for k, v in production_grade_map.items() if v != -1}
+        precio = float(rng.uniform(0.2, 2.0) * PRECIOS_TIPICOS[area][prod])
+        demanda = int(rng.integers(0, 2 * CAP_MAX[area][prod]))
+        coste = float(rng.integers(0, 4) * 100000)
+
+        pre = PrescreenAnalitico(estado, production_grade_map, coste_estrategia=coste)
+        objetivos, ambiguos = pre.evaluar({(area, prod, grado): {'precio': precio, 'demanda': demanda}}, n=1)
+        if ambiguos[0]:
+            continue
+
+        optimizer = OptimizerV3(current_state=estado)
+        optimizer.set_strategy_costs(coste_publicidad=coste)
+        optimizer.set_market_conditions(area, prod, grado, precio, demanda, -1)
+        for (p_area, p_prod), p_grado in production_grade_map.items():
+            optimizer.production_grade_map[(p_area, p_prod)] = p_grado
+        optimizer.build_model()
+        optimizer.solve()
+        diff = abs(optimizer.get_objective_value() - objetivos[0])
+        max_diff = max(max_diff, diff)
+        comparados += 1
+
+    if verbose:
+        print(f"Instancias comparadas: {comparados}/{n_instancias}. Diferencia máxima de objetivo: {max_diff:.3e}")
+    return max_diff
+
+
+if __name__ == '__main__':
+    comprobar_consistencia()
@@ -1,518 +1,602 @@
+"""
+Flujo completo de una decisión: parse -> estimate -> optimize -> export -> negotiate.
+
+    python -m v3.quickstart_v3                 # todo, como siempre
+    python -m v3.quickstart_v3 optimize        # hasta la recomendación (sin formularios)
+    python -m v3.quickstart_v3 export --tiempos
+
+Cada subcomando ejecuta las etapas previas que necesita. Las dependencias pesadas
+(numpy, pulp, modelos) se importan dentro de cada etapa, así que importar este módulo
+o pedir --help no cuesta nada; QuickstartPipeline se puede reutilizar desde otras
+herramientas.
+"""
 import os
-import glob
-import re
-import csv
-from v3.optimizer_pulp import OptimizerV3
-from v3.negotiation import Negotiation
-from v3.ranking import calculate_ranking
-from src.parser import LSTParser
-from v3.demand_estimator import DemandEstimator 
-from src.forms import FormsExporter
-from src.params import PRECIOS_TIPICOS, AR_STRUCTURE
-
-# Constantes para la simulación de estrategias
-COSTE_ID_Y = 320000 
-COSTE_ID_X = 320000 
-COSTE_PUBLICIDAD_Y_EU = 50000 
-ELASTICIDAD_PUBLICIDAD = 0.15 
-COSTE_INFORME_IM2 = 60000 
-COSTE_INFORME_IM17 = 10000 
-
-# --- Valores Base para Normalizar ---
-BASE_BENEFICIO = 500000.0
-BASE_LIQUIDEZ = 20000000.0
-BASE_INVENTARIO = 100000.0
-BASE_CUOTA = 150000.0      
-
-def load_ranking_data(data_dir, historicos_parseados):
-    ranking_data = []
-    ranking_files = glob.glob(os.path.join(data_dir, 'Ranking [0-9].txt'))
-    
-    for r_file in ranking_files:
-        try:
-            periodo_num_match = re.search(r'Ranking (\d+)\.txt', r_file)
-            if not periodo_num_match: continue
-            periodo = int(periodo_num_match.group(1))
-            
-            if (periodo - 1) < len(historicos_parseados):
-                estado_lst = historicos_parseados[periodo - 1]
-                with open(r_file, 'r') as f:
-                    reader = csv.reader(f, delimiter=';')
-                    next(reader) 
-                    for row in reader:
-                        if not row or len(row) < 2: continue
-                        if int(row[0].strip()) == 4:
-                            score_str = row[1].strip().replace("'", ".")
-                            score = float(score_str)
-                            ranking_data.append({ 'periodo': periodo, 'score': score, 'estado': estado_lst })
-                            break 
-        except Exception as e:
-            print(f"Error procesando el archivo de ranking {r_file}: {e}")
-            
-    return ranking_data
-
-def find_best_strategy(current_state_norm, patentes, estimador, strategy_config):
+import sys
+import time
+import argparse
+
+T_INICIO = time.perf_counter()
+
+ETAPAS = ('parse', 'estimate', 'optimize', 'export', 'negotiate')
+PERIODOS_PROYECCION = 3
+CAJA_MINIMA_AREA = 0.0   # Caja mínima por área (moneda local) por debajo de la cual A3 transfiere
+
+
+def configuraciones_estrategia(escalas_precios, coste_publicidad_y_eu):
+    """(nombre, etiqueta, config) de las estrategias que se comparan, con las escalas de Planner.price_ladders."""
+    return [
+        # Estrategia 1: "Vender Stock" (Vender X0)
+        ('Vender Stock EU-X', 'Vender Stock', {
+            'markets_to_test': {('EU', 'X', 0): escalas_precios[('EU', 'X', 0)]},
+            'production_config': {('EU', 'X'): -1, ('EU', 'Y'): -1},
+            'gasto_publicidad': 0,
+        }),
+        # Estrategia 2: "Abrir PCs Estándar" (Producir Y0, que consume X0)
+        ('Abrir PCs Estándar EU', 'Abrir PCs Estándar', {
+            'markets_to_test': {('EU', 'Y', 0): escalas_precios[('EU', 'Y', 0)]},
+            'production_config': {('EU', 'X'): 0, ('EU', 'Y'): 0},  # Producir X0 e Y0
+            'gasto_publicidad': 0,
+        }),
+        # Estrategia 3: "Abrir PCs Lujo con Publicidad" (Producir Y1, que consume X1)
+        ('Abrir PCs Lujo EU (con Pub)', 'Abrir PCs Lujo (con Pub)', {
+            'markets_to_test': {('EU', 'Y', 1): escalas_precios[('EU', 'Y', 1)]},
+            'production_config': {('EU', 'X'): 1, ('EU', 'Y'): 1},  # Producir X1 e Y1
+            'gasto_publicidad': coste_publicidad_y_eu,
+        }),
+        # Estrategia 4: "Producir Chips Lujo (I+D) y vender" (Producir X1)
+        ('Producir Chips Lujo EU', 'Producir Chips Lujo EU', {
+            'markets_to_test': {('EU', 'X', 1): escalas_precios[('EU', 'X', 1)]},
+            'production_config': {('EU', 'X'): 1, ('EU', 'Y'): -1},  # Producir Chips Grado 1
+            'gasto_publicidad': 0,
+        }),
+        # Estrategia 5: "No hacer nada" (Mantener costes)
+        ('No hacer nada', 'No hacer nada', {
+            'markets_to_test': {},
+            'production_config': {('EU', 'X'): -1, ('EU', 'Y'): -1},
+            'gasto_publicidad': 0,
+            'gasto_informes': 0,
+        }),
+    ]
+
+
+class QuickstartPipeline:
     """
-    Función helper para ejecutar el bucle de optimización
+    Etapas del quickstart como métodos; cada una deja sus resultados como atributos
+    y ejecuta antes las que necesita (una sola vez). tiempos: segundos por etapa.
+    almacen: HistoryStore opcional (v3.store) donde se guardan periodos, modelos,
+    soluciones y decisiones, y del que se reutilizan LST ya parseados y soluciones.
     """
-    markets_to_test = strategy_config.get('markets_to_test', {})
-    production_config = strategy_config.get('production_config', {})
-    
-    # --- Lógica de Patentes Dinámica ---
-    gasto_ID = 0
-    grado_req_X = production_config.get(('EU', 'X'), -1)
-    if grado_req_X > patentes.get(('EU', 'X'), 0):
-        gasto_ID += COSTE_ID_X
-    
-    grado_req_Y = production_config.get(('EU', 'Y'), -1)
-    if grado_req_Y > patentes.get(('EU', 'Y'), 0):
-        gasto_ID += COSTE_ID_Y
-    
-    gasto_publicidad = strategy_config.get('gasto_publicidad', 0)
-    gasto_informes = strategy_config.get('gasto_informes', 0)
-    # --- Fin Lógica de Patentes ---
-
-    mejor_ranking = -float('inf')
-    mejor_solucion = None
-    mejores_precios = {}
-    mejor_market_cond = {}
-
-    if not markets_to_test:
-        markets_to_test[()] = [0] # Iteración dummy para "No hacer nada"
-
-    for mercado_key, precios in markets_to_test.items():
-        
-        if not mercado_key:
-             precios = [0]
+    def __init__(self, data_dir=None, out_dir=None, interactivo=True, almacen=None):
+        self.data_dir = data_dir or os.path.join(os.getcwd(), 'data')
+        self.out_dir = out_dir or os.path.join(os.getcwd(), 'outputs', 'forms')
+        self.interactivo = interactivo
+        self.almacen = almacen
+        self.hechas = set()
+        self.tiempos = {}
+
+    def _requiere(self, *etapas):
+        for etapa in etapas:
+            if etapa not in self.hechas:
+                getattr(self, etapa)()
+
+    def _etapa(self, nombre, funcion):
+        from src.profiling import tramo
+        t0 = time.perf_counter()
+        with tramo('etapa', nombre):
+            funcion()
+        self.tiempos[nombre] = time.perf_counter() - t0
+        self.hechas.add(nombre)
+
+    # --- PASO 1: Cargar LSTs ---
+    def parse(self):
+        self._etapa('parse', self._parse)
+
+    def _parse(self):
+        from src.parser import localizar_lsts, numero_decision, IndiceDecisiones
+        from src.params import PARAMS_VERSION, GACETA
+
+        # Modificación: Priorizar archivos '_fixed.txt' si existen
+        self.files, usa_fixed = localizar_lsts(self.data_dir)
+        if usa_fixed:
+            print("-> Usando archivos CORREGIDOS (_fixed.txt)")
         else:
-            area, prod, grado = mercado_key
-            grado_poseido_prod = patentes.get((area, prod), 0)
-            if grado > grado_poseido_prod:
-                # No se puede VENDER un producto si no se tiene la patente
-                continue
-
-        for precio_prueba in precios:
-            
-            optimizer = OptimizerV3(current_state=current_state_norm)
-            market_conditions_actual = {}
-            
-            if mercado_key: 
-                area, prod, grado = mercado_key
-                func_demanda = estimador.get_demand_function(area, prod, grado)
-                demanda_total_mercado = func_demanda['interseccion'] + (func_demanda['pendiente'] * precio_prueba)
-                
-                if gasto_publicidad > 0:
-                    demanda_total_mercado *= (1 + ELASTICIDAD_PUBLICIDAD * (gasto_publicidad / 100000))
-
-                cuota_mercado_objetivo = 0.15 if grado == 1 else 0.10
-                demanda_maxima_cia = max(0, int(demanda_total_mercado * cuota_mercado_objetivo))
-
-                market_conditions_actual = {
-                    mercado_key: { 'precio': precio_prueba, 'demanda': demanda_maxima_cia }
-                }
-            
-            optimizer.set_strategy_costs(
-                coste_publicidad=gasto_publicidad,
-                coste_ID=gasto_ID, 
-                coste_informes=gasto_informes
-            )
-            
-            for (p_area, p_prod), p_grado in production_config.items():
-                 optimizer.set_market_conditions(
-                    area=p_area, prod=p_prod, grado=p_grado, 
-                    precio_fijo=market_conditions_actual.get((p_area, p_prod, p_grado), {}).get('precio', 0), 
-                    demanda_maxima=market_conditions_actual.get((p_area, p_prod, p_grado), {}).get('demanda', 0),
-                    producir_grado=p_grado 
-                )
-            
-            optimizer.build_model()
-            solucion_actual = optimizer.solve()
-            ranking_actual = optimizer.get_objective_value()
-
-            if ranking_actual > mejor_ranking:
-                mejor_ranking = ranking_actual
-                mejor_solucion = solucion_actual
-                if mercado_key: 
-                    mejores_precios = {mercado_key: precio_prueba}
-                mejor_market_cond = market_conditions_actual
-                
-    return mejor_ranking, mejores_precios, mejor_solucion, mejor_market_cond
-
-# --- PASO 1: Cargar LSTs ---
-DATA_DIR = os.path.join(os.getcwd(), 'data')
-
-# Modificación: Priorizar archivos '_fixed.txt' si existen
-files_fixed = glob.glob(os.path.join(DATA_DIR, '*_fixed.txt'))
-
-if files_fixed:
-    print("-> Usando archivos CORREGIDOS (_fixed.txt)")
-    files = sorted(
-        files_fixed,
-        key=lambda x: int(re.search(r'[Dd]ecisión (\d+)', os.path.basename(x)).group(1))
-    )
-else:
-    print("-> Usando archivos ORIGINALES (puede haber errores de formato)")
-    files = sorted(
-        glob.glob(os.path.join(DATA_DIR, 'Decisión [0-9].lst.txt')) + 
-        glob.glob(os.path.join(DATA_DIR, 'Descisión [0-9].lst.txt')),
-        key=lambda x: int(re.search(r'[Dd]ecisión (\d+)', os.path.basename(x)).group(1))
-    )
-
-if not files: exit("Error: No se encontraron archivos de Decisión en /data.")
-
-
-
-
-print(f"Archivos LST detectados: {[os.path.basename(f) for f in files]}")
-parser = LSTParser()
-datos_historicos = [parser.parse_file(f) for f in files]
-current_state_parsed = datos_historicos[-1]
-print(f"Última decisión detectada: {os.path.basename(files[-1])}")
-
-# --- PASO 1.5: Cargar Rankings ---
-print("\nCargando datos históricos de ranking...")
-puntos_ranking = load_ranking_data(DATA_DIR, datos_historicos)
-if puntos_ranking:
-    print(f"Encontrados {len(puntos_ranking)} puntos de datos para calibrar el ranking.")
-    ultimo_punto = puntos_ranking[-1]
-    print(f"  -> Último punto: Periodo {ultimo_punto['periodo']}, Score: {ultimo_punto['score']}")
-else:
-    print("No se encontraron archivos de Ranking. Usando fórmula de ranking por defecto.")
-
-# --- PASO 2: Entrenar Modelo de Demanda ---
-print("\nEntrenando modelo de demanda con datos históricos...")
-estimador = DemandEstimator(datos_historicos)
-modelo_eu_x0 = estimador.get_demand_function('EU', 'X', 0)
-modelo_eu_y0 = estimador.get_demand_function('EU', 'Y', 0)
-modelo_eu_y1 = estimador.get_demand_function('EU', 'Y', 1)
-print(f"Modelo de demanda para ('EU', 'X', 0): {modelo_eu_x0}")
-print(f"Modelo de demanda para ('EU', 'Y', 0): {modelo_eu_y0}")
-print(f"Modelo de demanda para ('EU', 'Y', 1): {modelo_eu_y1}")
-
-
-# --- PASO 3: Preparar Estado Actual (CON NORMALIZACIÓN Y PATENTES) ---
-beneficio_bruto = current_state_parsed.get('utilidad_periodo', 0)
-liquidez_bruta = current_state_parsed.get('caja_total', 0)
-inventarios_detalle = current_state_parsed.get('inventarios_detalle', {}) 
-ventas_propias_total = sum(current_state_parsed.get('ventas_propias', {}).values())
-inventarios_total_bruto = sum(v for v in inventarios_detalle.values() if v)
-
-# ELIMINADO EL AVISO: El parser corregido debe encontrar las patentes (o un dict vacío)
-patentes_poseidas = current_state_parsed.get('patentes_poseidas', {
-    ('EU', 'X'): 0, ('EU', 'Y'): 0, ('US', 'X'): 0, ('US', 'Y'): 0, ('BR', 'X'): 0, ('BR', 'Y'): 0
-})
-
-current_state_normalized = {
-    'beneficio': beneficio_bruto / BASE_BENEFICIO,
-    'liquidez': liquidez_bruta / BASE_LIQUIDEZ,
-    'inventarios_detalle': inventarios_detalle, 
-    'inventarios_total': inventarios_total_bruto / BASE_INVENTARIO,
-    'cuota': ventas_propias_total / BASE_CUOTA,
-    'patentes_poseidas': patentes_poseidas 
-}
-print("\nResumen del estado actual (NORMALIZADO):")
-print(f"beneficio: {current_state_normalized['beneficio']}")
-print(f"liquidez: {current_state_normalized['liquidez']}")
-print(f"inventarios_detalle: {current_state_normalized['inventarios_detalle']}")
-print(f"inventarios_total (norm): {current_state_normalized['inventarios_total']}")
-print(f"cuota (ventas propias norm): {current_state_normalized['cuota']}")
-print(f"Patentes EU: X{patentes_poseidas.get(('EU', 'X'), 0)}, Y{patentes_poseidas.get(('EU', 'Y'), 0)}")
-
-
-# --- PASO 4: Comparar Estrategias (CORREGIDAS CON LÓGICA DE PATENTES 1:1) ---
-print("\n--- Evaluando Estrategias de Mercado ---")
-estrategias_ranking = {}
-todas_las_configs = {}
-
-# Estrategia 1: "Vender Stock" (Vender X0)
-strategy_1_config = {
-    'markets_to_test': { ('EU', 'X', 0): [35, 40, 45, 50] },
-    'production_config': { ('EU', 'X'): -1, ('EU', 'Y'): -1 }, 
-    'gasto_publicidad': 0,
-}
-todas_las_configs['Vender Stock EU-X'] = strategy_1_config
-r1, p1, s1, c1 = find_best_strategy(current_state_normalized, patentes_poseidas, estimador, strategy_1_config)
-estrategias_ranking['Vender Stock EU-X'] = {'ranking': r1, 'precios': p1, 'solucion': s1, 'condiciones': c1}
-print(f"Resultado Estrategia 'Vender Stock': Ranking Estimado = {r1:.4f} (Precio: {p1})")
-
-# Estrategia 2: "Abrir PCs Estándar" (Producir Y0, que consume X0)
-strategy_2_config = {
-    'markets_to_test': { ('EU', 'Y', 0): [130, 140, 150] },
-    'production_config': { ('EU', 'X'): 0, ('EU', 'Y'): 0 }, # Producir X0 e Y0
-    'gasto_publicidad': 0, 
-}
-todas_las_configs['Abrir PCs Estándar EU'] = strategy_2_config
-r2, p2, s2, c2 = find_best_strategy(current_state_normalized, patentes_poseidas, estimador, strategy_2_config)
-estrategias_ranking['Abrir PCs Estándar EU'] = {'ranking': r2, 'precios': p2, 'solucion': s2, 'condiciones': c2}
-print(f"Resultado Estrategia 'Abrir PCs Estándar': Ranking Estimado = {r2:.4f} (Precio: {p2})")
-
-# Estrategia 3: "Abrir PCs Lujo con Publicidad" (Producir Y1, que consume X1)
-strategy_3_config = {
-    'markets_to_test': { ('EU', 'Y', 1): [150, 160, 170] },
-    'production_config': { ('EU', 'X'): 1, ('EU', 'Y'): 1 }, # Producir X1 e Y1
-    'gasto_publicidad': COSTE_PUBLICIDAD_Y_EU, 
-}
-todas_las_configs['Abrir PCs Lujo EU (con Pub)'] = strategy_3_config
-r3, p3, s3, c3 = find_best_strategy(current_state_normalized, patentes_poseidas, estimador, strategy_3_config)
-estrategias_ranking['Abrir PCs Lujo EU (con Pub)'] = {'ranking': r3, 'precios': p3, 'solucion': s3, 'condiciones': c3}
-print(f"Resultado Estrategia 'Abrir PCs Lujo (con Pub)': Ranking Estimado = {r3:.4f} (Precio: {p3})")
-
-# Estrategia 4: "Producir Chips Lujo (I+D) y vender" (Producir X1)
-strategy_4_config = {
-    'markets_to_test': { 
-        ('EU', 'X', 1): [50, 55, 60]
-    }, 
-    'production_config': { ('EU', 'X'): 1, ('EU', 'Y'): -1 }, # Producir Chips Grado 1
-    'gasto_publicidad': 0, 
-}
-todas_las_configs['Producir Chips Lujo EU'] = strategy_4_config
-r4, p4, s4, c4 = find_best_strategy(current_state_normalized, patentes_poseidas, estimador, strategy_4_config)
-estrategias_ranking['Producir Chips Lujo EU'] = {'ranking': r4, 'precios': p4, 'solucion': s4, 'condiciones': c4}
-print(f"Resultado Estrategia 'Producir Chips Lujo EU': Ranking Estimado = {r4:.4f} (Precio: {p4})")
-
-# Estrategia 5: "No hacer nada" (Mantener costes)
-strategy_5_config = {
-    'markets_to_test': {},
-    'production_config': { ('EU', 'X'): -1, ('EU', 'Y'): -1 }, 
-    'gasto_publicidad': 0, 
-    'gasto_informes': 0
-}
-todas_las_configs['No hacer nada'] = strategy_5_config
-r5, p5, s5, c5 = find_best_strategy(current_state_normalized, patentes_poseidas, estimador, strategy_5_config)
-estrategias_ranking['No hacer nada'] = {'ranking': r5, 'precios': p5, 'solucion': s5, 'condiciones': c5}
-print(f"Resultado Estrategia 'No hacer nada': Ranking Estimado = {r5:.4f} (Precio: {p5})")
-
-
-# --- PASO 5: Mostrar la MEJOR Solución ---
-print("\n--- Recomendación Estratégica ---")
-mejor_estrategia_nombre = max(estrategias_ranking, key=lambda k: estrategias_ranking[k]['ranking'])
-mejor_estrategia = estrategias_ranking[mejor_estrategia_nombre]
-
-print(f"RECOMENDACIÓN: **{mejor_estrategia_nombre}** es la estrategia más rentable.")
-print(f"Mejor Ranking Estimado: {mejor_estrategia['ranking']:.4f}")
-print(f"Mejor Estrategia de Precios: {mejor_estrategia['precios']}")
-
-print("\nDecisiones de Producción y Venta Recomendadas:")
-if not mejor_estrategia.get('solucion'):
-    print("(Ninguna acción recomendada, no se encontró beneficio)")
-else:
-    for k, v in mejor_estrategia['solucion'].items():
-        if v > 0: 
-            print(f"{k}: {v}")
-    
-    optimizer_estimador = OptimizerV3(current_state=current_state_normalized)
-    optimizer_estimador.estimate_next_period(mejor_estrategia['solucion'], mejor_estrategia['condiciones'])
-
-# --- PASO 5.5: Generar Formularios de Decisión ---
-print("\n--- Generando Archivos de Decisión ---")
-
-try:
-    periodo_actual = int(re.search(r'[Dd]ecisión (\d+)', os.path.basename(files[-1])).group(1))
-    periodo_siguiente = periodo_actual + 1
-    
-    output_dir = os.path.join(os.getcwd(), 'outputs', 'forms')
-    exporter = FormsExporter(output_dir)
-    
-    config_ganadora = todas_las_configs.get(mejor_estrategia_nombre, {})
-    solucion_ganadora = mejor_estrategia.get('solucion', {})
-    
-    # --- 1. Preparar datos H1 (I+D, Informes, Dividendos) ---
-    h1_data = {
-        'I+D_X_kFS': 0,
-        'I+D_Y_kFS': 0,
-        'IM_monto_kFS': config_ganadora.get('gasto_informes', 0) / 1000,
-        'IM_estudios': [], 
-        'dividendos_kFS': 0 
-    }
-    
-    grado_req_X_ganador = config_ganadora.get('production_config', {}).get(('EU', 'X'), -1)
-    if grado_req_X_ganador > patentes_poseidas.get(('EU', 'X'), 0):
-        h1_data['I+D_X_kFS'] = COSTE_ID_X / 1000
-        
-    grado_req_Y_ganador = config_ganadora.get('production_config', {}).get(('EU', 'Y'), -1)
-    if grado_req_Y_ganador > patentes_poseidas.get(('EU', 'Y'), 0):
-        h1_data['I+D_Y_kFS'] = COSTE_ID_Y / 1000
-    
-    if modelo_eu_x0['puntos_datos'] == 0:
-        h1_data['IM_estudios'].extend([2, 17])
-        h1_data['IM_monto_kFS'] += (COSTE_INFORME_IM2 + COSTE_INFORME_IM17) / 1000
-
-
-    # --- 2. Preparar datos A1 (Marketing) ---
-    a1_data = {}
-    for area in ['US', 'EU', 'BR']:
-        for prod in ['X', 'Y']:
-            for g in [0, 1]:
-                a1_data[(area, prod, g)] = {'price': 0, 'ad': 0}
-
-    for mercado_key, precio in mejor_estrategia.get('precios', {}).items():
-        area, prod, g = mercado_key
-        pub_asignada = config_ganadora.get('gasto_publicidad', 0) / 1000 if area == 'EU' else 0
-        
-        a1_data[mercado_key] = {
-            'price': int(precio),
-            'ad': pub_asignada 
-        }
-
-    # --- 3. Preparar datos A2 (Producción) ---
-    a2_data = { 'US': {'X': {}, 'Y': {}}, 'EU': {'X': {}, 'Y': {}}, 'BR': {'X': {}, 'Y': {}} }
-    
-    prod_config_ganadora = config_ganadora.get('production_config', {})
-    
-    for (area, prod), grado in prod_config_ganadora.items():
-        if grado != -1: 
-            prod_var_name = f'prod_{area}_{prod}'
-            unidades_produccion = int(solucion_ganadora.get(prod_var_name, 0))
-            
-            if unidades_produccion == 0:
-                continue
-
-            prod_data = {
-                'nuevas': 0, 'mejora_k': 0,
-                'grado_inf': 0, 'prod_planta': [0,0,0],
-                'grado_sup': 0, 'prod_planta_sup': [0,0,0]
-            }
-            
-            if grado == 0:
-                prod_data['grado_inf'] = 0
-                prod_data['prod_planta'] = [unidades_produccion, 0, 0] # Asigna a planta 1
-            else:
-                prod_data['grado_sup'] = grado
-                prod_data['prod_planta_sup'] = [unidades_produccion, 0, 0] # Asigna a planta 1
-            
-            a2_data[area][prod] = prod_data
-
-    # --- 4. Exportar Archivos ---
-    path_h1 = exporter.export_H1(periodo_siguiente, h1_data)
-    path_a1 = exporter.export_A1(periodo_siguiente, a1_data)
-    path_a2 = exporter.export_A2(periodo_siguiente, a2_data)
-    
-    print(f"Archivos de decisión para el Periodo {periodo_siguiente} generados en:")
-    print(f"-> {path_h1}")
-    print(f"-> {path_a1}")
-    print(f"-> {path_a2}")
-
-except Exception as e:
-    print(f"\nERROR al generar los archivos de decisión: {e}")
-    import traceback
-    traceback.print_exc()
-
-
-# --- PASO 6: Negociación Interactiva (B2B) ---
-
-print("\n--- Negociación Interactiva (B2B) ---")
-
-ranking_actual = calculate_ranking(current_state_normalized)
-stock_actual_eu_x = inventarios_detalle.get(('EU', 'X', 0), 0)
-
-costo_var_eu_x = PRECIOS_TIPICOS['EU']['X'] * 0.155 
-cash_ratio_eu = AR_STRUCTURE['EU']['cash'] 
-
-print(f"Stock actual de ('EU', 'X', 0): {stock_actual_eu_x} unidades.")
-print(f"Ranking base (sin pactos): {ranking_actual:.4f}")
-
-while True:
-    try:
-        respuesta = input("\n¿Has recibido una nueva oferta B2B por tu stock de EU-X-Std? (s/n): ").strip().lower()
-        if respuesta != 's':
-            break
-        
-        offer_price = float(input("  > Precio unitario ofertado (€): "))
-        offer_volume = float(input(f"  > Volumen (unidades) ofertado (max {stock_actual_eu_x}): "))
-
-        if offer_volume > stock_actual_eu_x:
-            print(f"  [!] Error: El volumen ofertado ({offer_volume}) supera el stock disponible ({stock_actual_eu_x}).")
-            continue
-        
-        if offer_price <= costo_var_eu_x:
-            print(f"  [!] Advertencia: El precio ofertado ({offer_price:.2f}€) es menor o igual al coste variable ({costo_var_eu_x:.2f}€).")
-            print("      Aceptar resultará en pérdidas de beneficio.")
-
-        ingreso_pacto = offer_price * offer_volume
-        costo_pacto = costo_var_eu_x * offer_volume
-        beneficio_pacto = ingreso_pacto - costo_pacto
-        liquidez_pacto = ingreso_pacto * cash_ratio_eu 
-        
-        nuevo_beneficio_bruto = beneficio_bruto + beneficio_pacto
-        nueva_liquidez_bruta = liquidez_bruta + liquidez_pacto
-        nuevo_inventario_bruto = inventarios_total_bruto - offer_volume
-        nueva_cuota_bruta = ventas_propias_total + offer_volume
-        
-        nuevo_beneficio_norm = nuevo_beneficio_bruto / BASE_BENEFICIO
-        nueva_liquidez_norm = nueva_liquidez_bruta / BASE_LIQUIDEZ
-        nuevo_inventario_norm = nuevo_inventario_bruto / BASE_INVENTARIO
-        nueva_cuota_norm = nueva_cuota_bruta / BASE_CUOTA
-        
-        nuevo_ranking_calculado = calculate_ranking({
-            'beneficio': nuevo_beneficio_norm,
-            'liquidez': nueva_liquidez_norm,
-            'cuota': nueva_cuota_norm,
-            'inventarios': nuevo_inventario_norm
-        })
-        
-        print(f"\n  --- Evaluación de la Oferta ---")
-        print(f"  Ranking Actual:   {ranking_actual:.4f}")
-        print(f"  Ranking Aceptando: {nuevo_ranking_calculado:.4f}")
-        print(f"  Impacto en Ranking: {nuevo_ranking_calculado - ranking_actual:+.4f}")
-        
-        counter_price = offer_price * 1.10 
-        counter_volume = offer_volume
-        print(f"\n  Sugerencia de Contraoferta: Precio={counter_price:.2f}, Volumen={counter_volume:.0f}")
-
-        accion = input("  ¿Qué deseas hacer? (1=Aceptar, 2=Rechazar/Ignorar, 3=Contraofertar): ").strip()
-        if accion == '1':
-            print("  (Oferta aceptada - Lógica de formulario H6 pendiente de implementar)")
+            print("-> Usando archivos ORIGINALES (puede haber errores de formato)")
+        print(f"-> Parámetros: {PARAMS_VERSION}" + (f" (gaceta {GACETA})" if GACETA else " (valores por defecto)"))
+
+        if not self.files:
+            sys.exit("Error: No se encontraron archivos de Decisión en /data.")
+
+        print(f"Archivos LST detectados: {[os.path.basename(f) for f in self.files]}")
+        self.datos_historicos = self._parsear(self.files)
+        self.indice_decisiones = IndiceDecisiones(self.datos_historicos)
+        self.current_state_parsed = self.datos_historicos[-1]
+        self.periodo_actual = numero_decision(self.files[-1])
+        print(f"Última decisión detectada: {os.path.basename(self.files[-1])}")
+
+    def _parsear(self, files):
+        # Punto de extensión: v3.watch solo vuelve a parsear los ficheros que cambian
+        from src.parser import LSTParser, numero_decision
+        parser = LSTParser()
+        if self.almacen is None:
+            return [parser.parse_file(f) for f in files]
+
+        from v3.store import huella_lst
+        historicos, nuevos = [], []
+        for f in files:
+            huella = huella_lst(f)
+            datos = self.almacen.periodo_por_huella(huella)
+            if datos is None:
+                datos = parser.parse_file(f)
+                nuevos.append((numero_decision(f), f, huella, datos))
+            historicos.append(datos)
+        if nuevos:
+            self.almacen.guardar_periodos(nuevos)
+        return historicos
+
+    def _estimador_demanda(self):
+        from v3.demand_estimator import DemandEstimator
+        return DemandEstimator(self.datos_historicos)
+
+    # --- PASOS 1.5-3: Ranking calibrado, demanda y estado normalizado ---
+    def estimate(self):
+        self._requiere('parse')
+        self._etapa('estimate', self._estimate)
+
+    def _estimate(self):
+        from src.state import EstadoCompania
+        from v3.ranking import load_ranking_data, cargar_modelo_calibrado, FILAS_MIN_CALIBRACION
+
+        # --- PASO 1.5: Cargar Rankings y calibrar la fórmula ---
+        print("\nCargando datos históricos de ranking...")
+        self.puntos_ranking = load_ranking_data(self.data_dir, self.datos_historicos)
+        self.modelo_ranking = cargar_modelo_calibrado(self.data_dir, self.datos_historicos)
+        if self.puntos_ranking:
+            puntos_propios = [p for p in self.puntos_ranking if p['estado']]
+            calibrables = sum(1 for p in self.puntos_ranking if p['componentes'] and p['score_periodo'] is not None)
+            print(f"Encontradas {len(self.puntos_ranking)} puntuaciones de liga ({calibrables} con componentes para calibrar).")
+            if puntos_propios:
+                ultimo_punto = puntos_propios[-1]
+                print(f"  -> Último punto: Periodo {ultimo_punto['periodo']}, Score: {ultimo_punto['score']}")
+            if not self.modelo_ranking.puntos_datos:
+                print(f"  -> Menos de {FILAS_MIN_CALIBRACION} filas con estado: se mantienen los pesos por defecto.")
+            print(f"  -> Pesos calibrados: {tuple(round(w, 4) for w in self.modelo_ranking.pesos)}")
+            print(f"  -> Bases calibradas: {tuple(round(b_, 1) for b_ in self.modelo_ranking.bases)}")
         else:
-            print("  (Oferta ignorada, puedes evaluar otra)")
-
-    except ValueError:
-        print("[!] Error: Introduce solo números para precio y volumen.")
-    except Exception as e:
-        print(f"Ha ocurrido un error inesperado: {e}")
-
-# --- Propuesta de Pacto Comercial (Req 3) ---
-print("\n--- Propuesta de Pacto Comercial (Venta de Stock EU-X) ---")
-print(f"Analizando rentabilidad de vender el stock de {stock_actual_eu_x} unidades...")
-print(f"El coste variable (VC) mínimo por unidad es: {costo_var_eu_x:.2f} €")
-print(f"El cobro al contado (cash ratio) en EU es: {cash_ratio_eu * 100:.0f}%")
-print(f"Para que un pacto sea rentable, el precio unitario DEBE ser superior a {costo_var_eu_x:.2f} €.")
-
-mejor_pacto = {'price': 0, 'volume': 0, 'ranking': ranking_actual}
-
-precio_minimo = int(costo_var_eu_x) + 1
-precio_maximo = int(PRECIOS_TIPICOS['EU']['X'])
-
-if stock_actual_eu_x > 0:
-    for test_price in range(precio_minimo, precio_maximo + 1):
-        test_volume = stock_actual_eu_x 
-        
-        ingreso_pacto = test_price * test_volume
-        costo_pacto = costo_var_eu_x * test_volume
-        beneficio_pacto = ingreso_pacto - costo_pacto
-        liquidez_pacto = ingreso_pacto * cash_ratio_eu 
-        
-        nuevo_beneficio_bruto = beneficio_bruto + beneficio_pacto
-        nueva_liquidez_bruta = liquidez_bruta + liquidez_pacto
-        nuevo_inventario_bruto = inventarios_total_bruto - test_volume
-        nueva_cuota_bruta = ventas_propias_total + test_volume
-        
-        nuevo_ranking_calculado = calculate_ranking({
-            'beneficio': (nuevo_beneficio_bruto / BASE_BENEFICIO),
-            'liquidez': (nueva_liquidez_bruta / BASE_LIQUIDEZ),
-            'cuota': (nueva_cuota_bruta / BASE_CUOTA),
-            'inventarios': (nuevo_inventario_bruto / BASE_INVENTARIO)
+            print("No se encontraron archivos de Ranking. Usando fórmula de ranking por defecto.")
+
+        # --- PASO 2: Entrenar Modelo de Demanda ---
+        print("\nEntrenando modelo de demanda con datos históricos...")
+        self.estimador = self._estimador_demanda()
+        if self.almacen is not None:
+            from src.params import PARAMS_VERSION
+            self.almacen.guardar_modelos(self.periodo_actual, self.estimador.modelos_demanda, PARAMS_VERSION)
+        self.modelo_eu_x0 = self.estimador.get_demand_function('EU', 'X', 0)
+        print(f"Modelo de demanda para ('EU', 'X', 0): {self.modelo_eu_x0}")
+        print(f"Modelo de demanda para ('EU', 'Y', 0): {self.estimador.get_demand_function('EU', 'Y', 0)}")
+        print(f"Modelo de demanda para ('EU', 'Y', 1): {self.estimador.get_demand_function('EU', 'Y', 1)}")
+
+        # --- PASO 3: Preparar Estado Actual (CON NORMALIZACIÓN Y PATENTES) ---
+        actual = self.current_state_parsed
+        self.beneficio_bruto = actual.get('utilidad_periodo', 0)
+        self.liquidez_bruta = actual.get('caja_total', 0)
+        self.inventarios_detalle = actual.get('inventarios_detalle', {})
+        self.ventas_propias_total = sum(actual.get('ventas_propias', {}).values())
+        self.inventarios_total_bruto = sum(v for v in self.inventarios_detalle.values() if v)
+
+        # ELIMINADO EL AVISO: El parser corregido debe encontrar las patentes (o un dict vacío)
+        self.patentes_poseidas = actual.get('patentes_poseidas', {
+            ('EU', 'X'): 0, ('EU', 'Y'): 0, ('US', 'X'): 0, ('US', 'Y'): 0, ('BR', 'X'): 0, ('BR', 'Y'): 0
         })
-        
-        if nuevo_ranking_calculado > mejor_pacto['ranking']:
-            mejor_pacto = {'price': test_price, 'volume': test_volume, 'ranking': nuevo_ranking_calculado}
-
-if mejor_pacto['price'] > 0:
-    print(f"\nPropuesta ÓPTIMA para maximizar ranking (vendiendo todo el stock):")
-    print(f"  Precio Mínimo Rentable: {mejor_pacto['price']:.2f} €")
-    print(f"  Volumen: {mejor_pacto['volume']:.0f} unidades")
-    print(f"  Ranking Estimado: {mejor_pacto['ranking']:.4f} (Mejora: {mejor_pacto['ranking'] - ranking_actual:+.4f})")
-    print(f"  Condiciones: Pago 50% contado, 50% a crédito (según AR_STRUCTURE['EU']).")
-else:
-    print("\nNo se ha encontrado un pacto rentable que mejore el ranking actual vendiendo solo el stock.")
-
-print("\n--- Fin de la Ejecución ---")
\ No newline at end of file
+
+        estado_norm = self.modelo_ranking.normalizar(self.beneficio_bruto, self.liquidez_bruta,
+                                                     self.ventas_propias_total, self.inventarios_total_bruto)
+        self.current_state_normalized = EstadoCompania(
+            beneficio=estado_norm['beneficio'],
+            liquidez=estado_norm['liquidez'],
+            cuota=estado_norm['cuota'],
+            inventarios_total=estado_norm['inventarios'],
+            inventarios_detalle=self.inventarios_detalle,
+            patentes_poseidas=self.patentes_poseidas,
+            caja_area=self.current_state_parsed.get('caja_area'),
+            tipo_cambio=self.current_state_parsed.get('tipo_cambio'),
+        )
+        estado = self.current_state_normalized
+        print("\nResumen del estado actual (NORMALIZADO):")
+        print(f"beneficio: {estado['beneficio']}")
+        print(f"liquidez: {estado['liquidez']}")
+        print(f"inventarios_detalle: {estado['inventarios_detalle']}")
+        print(f"inventarios_total (norm): {estado['inventarios_total']}")
+        print(f"cuota (ventas propias norm): {estado['cuota']}")
+        print(f"Patentes EU: X{self.patentes_poseidas.get(('EU', 'X'), 0)}, Y{self.patentes_poseidas.get(('EU', 'Y'), 0)}")
+
+    # --- PASOS 4-5.2: Estrategias, liga, recomendación, caja y equilibrio de precios ---
+    def optimize(self):
+        self._requiere('estimate')
+        self._etapa('optimize', self._optimize)
+
+    def _optimize(self):
+        import numpy as np
+        from src.planner import Planner
+        from v3.optimizer_pulp import OptimizerV3
+        from src.params import PARAMS_VERSION, AREAS
+        from v3.strategy import find_best_strategy, coste_estrategia, usar_almacen, _clave_solucion, COSTE_PUBLICIDAD_Y_EU
+        from v3.league import LeagueSimulator, flujos_por_area
+        from v3.cashflow import CashFlowEngine
+        from v3.competitors import CompetitorModel, PriceEquilibrium, COLUMNAS
+        from v3.demand_estimator import COL_MAP
+
+        estado, patentes = self.current_state_normalized, self.patentes_poseidas
+
+        # --- PASO 4: Comparar Estrategias (CORREGIDAS CON LÓGICA DE PATENTES 1:1) ---
+        print("\n--- Evaluando Estrategias de Mercado ---")
+        self.estrategias_ranking = {}
+        self.todas_las_configs = {}
+        # Escalas de precios admisibles de los 12 mercados (rejilla SALTO_MIN alrededor del precio típico)
+        escalas_precios = Planner().price_ladders()
+        if self.almacen is not None:
+            usar_almacen(self.almacen)
+        for nombre, etiqueta, config in configuraciones_estrategia(escalas_precios, COSTE_PUBLICIDAD_Y_EU):
+            self.todas_las_configs[nombre] = config
+            r, p, s, c = find_best_strategy(estado, patentes, self.estimador, config, self.modelo_ranking)
+            self.estrategias_ranking[nombre] = {'ranking': r, 'precios': p, 'solucion': s, 'condiciones': c}
+            print(f"Resultado Estrategia '{etiqueta}': Ranking Estimado = {r:.4f} (Precio: {p})")
+        if self.almacen is not None:
+            self.almacen.guardar_estrategias(self.periodo_actual + 1, [
+                (nombre, _clave_solucion(estado, patentes, self.estimador, self.todas_las_configs[nombre],
+                                         self.modelo_ranking),
+                 res['ranking'], res['precios']) for nombre, res in self.estrategias_ranking.items()
+            ], PARAMS_VERSION)
+
+        # --- PASO 4.5: Simulación de la liga (11 compañías) ---
+        print("\n--- Simulación de la Liga (posición esperada por estrategia) ---")
+        simulador_liga = LeagueSimulator(self.current_state_parsed, self.puntos_ranking,
+                                         ranking_model=self.modelo_ranking)
+        resultados_liga = simulador_liga.comparar_estrategias(
+            self.estrategias_ranking,
+            {nombre: coste_estrategia(cfg, patentes) for nombre, cfg in self.todas_las_configs.items()}
+        )
+        for nombre, res in resultados_liga.items():
+            top3 = res['distribucion'][:3].sum()
+            print(f"{nombre}: posición esperada {res['rango_esperado']:.2f} (P[top 3] = {top3:.0%}, "
+                  f"puntuación esperada {res['score_esperado']:.3f})")
+
+        # --- PASO 5: Mostrar la MEJOR Solución ---
+        print("\n--- Recomendación Estratégica ---")
+        self.mejor_estrategia_nombre = max(self.estrategias_ranking, key=lambda k: self.estrategias_ranking[k]['ranking'])
+        mejor = self.mejor_estrategia = self.estrategias_ranking[self.mejor_estrategia_nombre]
+
+        print(f"RECOMENDACIÓN: **{self.mejor_estrategia_nombre}** es la estrategia más rentable.")
+        print(f"Mejor Ranking Estimado: {mejor['ranking']:.4f}")
+        print(f"Mejor Estrategia de Precios: {mejor['precios']}")
+
+        print("\nDecisiones de Producción y Venta Recomendadas:")
+        if not mejor.get('solucion'):
+            print("(Ninguna acción recomendada, no se encontró beneficio)")
+        else:
+            for k, v in mejor['solucion'].items():
+                if v > 0:
+                    print(f"{k}: {v}")
+
+            optimizer_estimador = OptimizerV3(current_state=estado, ranking_model=self.modelo_ranking)
+            optimizer_estimador.estimate_next_period(mejor['solucion'], mejor['condiciones'])
+
+        # --- PASO 5.1: Proyección de caja (AR/AP, intereses por tramos e impuestos) ---
+        print(f"\n--- Proyección de Caja ({PERIODOS_PROYECCION} periodos repitiendo el plan recomendado) ---")
+        ingresos_area, costes_var_area, contado_area = flujos_por_area(
+            mejor.get('solucion'), mejor.get('condiciones', {}),
+            coste_estrategia(self.todas_las_configs.get(self.mejor_estrategia_nombre, {}), patentes))
+        # Caja por área en moneda local (fila CAJA del LST); sin ella, la consolidada repartida
+        caja_area = self.current_state_parsed.get('caja_area')
+        motor_caja = CashFlowEngine(
+            caja_inicial=[caja_area[a] for a in AREAS] if caja_area else self.liquidez_bruta,
+            tipo_cambio=self.current_state_parsed.get('tipo_cambio'),
+            caja_matriz=caja_area.get('CM', 0.0) if caja_area else 0.0)
+        self.proyeccion = proyeccion = motor_caja.proyectar(
+            np.tile(ingresos_area, (PERIODOS_PROYECCION, 1)), costes_var_area, contado_area)
+        for t in range(PERIODOS_PROYECCION):
+            print(f"  t+{t + 1}: caja {proyeccion['liquidez'][0, t]:,.0f} | CxC {proyeccion['cxc'][0, t].sum():,.0f} | "
+                  f"CxP {proyeccion['cxp'][0, t].sum():,.0f} | intereses {proyeccion['intereses'][0, t].sum():,.0f} | "
+                  f"impuestos {proyeccion['impuestos'][0, t].sum():,.0f}")
+
+        # --- PASO 5.2: Equilibrio de precios con la competencia (antes de fijar A1) ---
+        print("\n--- Equilibrio de Precios Esperado (mejor respuesta vs. rivales) ---")
+        competidores = CompetitorModel(self.datos_historicos)
+        mercados_eq = sorted(set(mejor.get('precios', {})) | {
+            k for k in COLUMNAS
+            if any(p[COL_MAP[k]] > 0 for p in self.current_state_parsed.get('mercado_precios', {}).values())
+        }, key=lambda k: COL_MAP[k])
+        equilibrio = PriceEquilibrium(competidores, self.estimador, mercados_eq).resolver()
+        print(f"Iteraciones: {equilibrio['iteraciones']} (convergido: {equilibrio['convergido']})")
+        for mercado_key, res in equilibrio['mercados'].items():
+            print(f"  {mercado_key}: rivales {res['precio_medio_actual']:.1f} -> {res['precio_medio_rivales']:.1f}, "
+                  f"nuestra mejor respuesta {res['precio_propio']:.1f}")
+
+    # --- PASO 5.5: Generar Formularios de Decisión ---
+    def export(self):
+        self._requiere('optimize')
+        self._etapa('export', self._export)
+
+    def _export(self):
+        from src.forms import FormsExporter
+        from src.params import PARAMS_VERSION, GACETA
+        from v3.decisions import DecisionAssembler, exportar_decisiones
+        from v3.strategy import COSTE_INFORME_IM2, COSTE_INFORME_IM17
+
+        print("\n--- Generando Archivos de Decisión ---")
+        try:
+            periodo_siguiente = self.periodo_actual + 1
+            exporter = FormsExporter(self.out_dir)
+
+            config_ganadora = self.todas_las_configs.get(self.mejor_estrategia_nombre, {})
+            solucion_ganadora = self.mejor_estrategia.get('solucion', {})
+
+            # --- Ensamblar A1–A4 y H1 de la solución ya resuelta (sin re-optimizar) ---
+            estudios, monto_estudios = [], 0
+            if self.modelo_eu_x0['puntos_datos'] == 0:
+                estudios, monto_estudios = [2, 17], COSTE_INFORME_IM2 + COSTE_INFORME_IM17
+            # Plantas del LST (o del eco) y mejora de métodos vigente del último A2 enviado.
+            # A3 solo con caja por área del LST: la consolidada repartida no sirve para transferir
+            ensamblador = DecisionAssembler.desde_indice(
+                self.patentes_poseidas, self.indice_decisiones, self.current_state_parsed.get('plantas'),
+                caja_minima=CAJA_MINIMA_AREA)
+            proyeccion_a3 = self.proyeccion if self.current_state_parsed.get('caja_area') else None
+            decisiones = ensamblador.ensamblar(solucion_ganadora, self.mejor_estrategia.get('precios', {}),
+                                               config_ganadora, proyeccion=proyeccion_a3,
+                                               estudios=estudios, monto_estudios=monto_estudios)
+            rutas = exportar_decisiones(exporter, periodo_siguiente, decisiones)
+            if self.almacen is not None:
+                self.almacen.guardar_decisiones(periodo_siguiente, decisiones, self.mejor_estrategia_nombre,
+                                                PARAMS_VERSION)
+            # Formularios que cambian respecto a lo enviado el periodo anterior (eco del último LST)
+            cambios = None
+            if self.periodo_actual in self.indice_decisiones.periodos():
+                cambios = sorted(self.indice_decisiones.diferencias(self.periodo_actual, decisiones))
+            exporter.export_manifest(periodo_siguiente, {
+                'params_version': PARAMS_VERSION, 'gaceta': GACETA, 'estrategia': self.mejor_estrategia_nombre,
+                'lst': [os.path.basename(f) for f in self.files], 'generado': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'cambios_vs_anterior': cambios,
+            })
+
+            print(f"Archivos de decisión para el Periodo {periodo_siguiente} generados en:")
+            for ruta in rutas.values():
+                print(f"-> {ruta}")
+
+        except Exception as e:
+            print(f"\nERROR al generar los archivos de decisión: {e}")
+            import traceback
+            traceback.print_exc()
+
+    # --- PASO 6: Negociación Interactiva (B2B) y propuesta de pactos ---
+    def negotiate(self):
+        self._requiere('estimate')
+        self._etapa('negotiate', self._negotiate)
+
+    def _negotiate(self):
+        if self.interactivo:
+            self._negociacion_interactiva()
+        self._propuesta_pactos()
+
+    def _negociacion_interactiva(self):
+        from src.forms import FormsExporter
+        from src.params import PRECIOS_TIPICOS, AR_STRUCTURE
+        from v3.portfolio import contratos_h6
+        from v3.offers import OfferBatchEvaluator, numero_compania, normalizar_oferta
+        from v3.optimizer_pulp import VC_RATE
+        from v3.strategy import optimizador_estrategia
+
+        print("\n--- Negociación Interactiva (B2B) ---")
+        print("(Para lotes de ofertas sin interacción: python -m v3.offers --input ofertas.csv --output ranking.csv)")
+
+        # Mismo modelo que v3.offers / v3.pacts (CashFlowEngine: cobros, intereses, impuestos, FS)
+        evaluador = OfferBatchEvaluator(
+            {'beneficio': self.beneficio_bruto, 'liquidez': self.liquidez_bruta,
+             'cuota': self.ventas_propias_total, 'inventarios': self.inventarios_total_bruto},
+            self.inventarios_detalle, ranking_model=self.modelo_ranking,
+            caja_area=self.current_state_parsed.get('caja_area'),
+            tipo_cambio=self.current_state_parsed.get('tipo_cambio'),
+        )
+        ranking_actual = evaluador.ranking_actual
+        # Los pactos aceptados descuentan stock de una copia (copy-on-write) del estado
+        estado_pactos = self.current_state_normalized.fork()
+        stock_actual_eu_x = estado_pactos.inventarios_detalle.get(('EU', 'X', 0), 0)
+
+        costo_var_eu_x = PRECIOS_TIPICOS['EU']['X'] * VC_RATE['X']
+        cash_ratio_eu = AR_STRUCTURE['EU']['cash']
+
+        print(f"Stock actual de ('EU', 'X', 0): {stock_actual_eu_x} unidades.")
+        print(f"Ranking base (sin pactos): {ranking_actual:.4f}")
+
+        contratos_aceptados = []
+        # Pactos ya aceptados (mismas condiciones de cobro): cada oferta se evalúa sumada a ellos
+        volumen_pactado, ingreso_pactado = 0.0, 0.0
+        optimizador_plan = None
+        while True:
+            try:
+                respuesta = input("\n¿Has recibido una nueva oferta B2B por tu stock de EU-X-Std? (s/n): ").strip().lower()
+                if respuesta != 's':
+                    break
+
+                offer_price = float(input("  > Precio unitario ofertado (€): "))
+                offer_volume = float(input(f"  > Volumen (unidades) ofertado (max {stock_actual_eu_x}): "))
+
+                if offer_volume > stock_actual_eu_x:
+                    print(f"  [!] Error: El volumen ofertado ({offer_volume}) supera el stock disponible ({stock_actual_eu_x}).")
+                    continue
+
+                if offer_price <= costo_var_eu_x:
+                    print(f"  [!] Advertencia: El precio ofertado ({offer_price:.2f}€) es menor o igual al coste variable ({costo_var_eu_x:.2f}€).")
+                    print("      Aceptar resultará en pérdidas de beneficio.")
+
+                # Con las mismas condiciones de pago, los pactos se suman en una venta a precio medio
+                volumen_total = volumen_pactado + offer_volume
+                ingreso_total = ingreso_pactado + offer_price * offer_volume
+                evaluada = evaluador.evaluar([normalizar_oferta({
+                    'area': 'EU', 'product': 'X', 'grade': 0,
+                    'price': ingreso_total / volumen_total if volumen_total else offer_price, 'volume': volumen_total,
+                })])[0]
+                if not evaluada['valida']:
+                    print(f"  [!] Error: {evaluada['motivo']}.")
+                    continue
+                nuevo_ranking_calculado = evaluada['ranking']
+
+                print(f"\n  --- Evaluación de la Oferta ---")
+                print(f"  Ranking Actual:   {ranking_actual:.4f}")
+                print(f"  Ranking Aceptando: {nuevo_ranking_calculado:.4f}")
+                print(f"  Impacto en Ranking: {nuevo_ranking_calculado - ranking_actual:+.4f}")
+
+                counter_price = offer_price * 1.10
+                counter_volume = offer_volume
+                print(f"\n  Sugerencia de Contraoferta: Precio={counter_price:.2f}, Volumen={counter_volume:.0f}")
+
+                accion = input("  ¿Qué deseas hacer? (1=Aceptar, 2=Rechazar/Ignorar, 3=Contraofertar): ").strip()
+                if accion == '1':
+                    # El comprador se valida antes de tocar el plan o la lista de contratos (H6)
+                    try:
+                        comprador = numero_compania(input("  > Compañía compradora: "))
+                    except ValueError as e:
+                        print(f"  [!] Error: {e}. Oferta no registrada.")
+                        continue
+                    # Delta: el pacto entra como venta fija sobre el plan ganador (warm start)
+                    if optimizador_plan is None:
+                        self._requiere('optimize')
+                        optimizador_plan = optimizador_estrategia(
+                            self.current_state_normalized, self.patentes_poseidas,
+                            self.todas_las_configs.get(self.mejor_estrategia_nombre, {}),
+                            self.mejor_estrategia.get('condiciones', {}), self.mejor_estrategia.get('solucion') or {},
+                            ranking_model=self.modelo_ranking)
+                    t_pacto = time.perf_counter()
+                    try:
+                        plan_actualizado = optimizador_plan.reoptimizar_con_pacto('EU', 'X', 0, offer_volume, offer_price)
+                    except ValueError as e:
+                        print(f"  [!] Error: {e}. Oferta no registrada.")
+                        continue
+                    print(f"  Plan reconciliado en {(time.perf_counter() - t_pacto) * 1000:.0f} ms "
+                          f"(ranking {optimizador_plan.get_objective_value():.4f}):")
+                    for k, v in plan_actualizado.items():
+                        print(f"    {k}: {v}")
+                    contratos_aceptados.append({
+                        'buyer': comprador, 'area': 'EU', 'product': 'X',
+                        'grade': 0, 'price': offer_price, 'volume': offer_volume, 'volumen_aceptado': offer_volume,
+                        'cash': cash_ratio_eu * 100, 'next': AR_STRUCTURE['EU']['cxc1'] * 100,
+                        'later': AR_STRUCTURE['EU']['cxc2'] * 100,
+                    })
+                    estado_pactos.inventarios_detalle.sumar(('EU', 'X', 0), -offer_volume)
+                    stock_actual_eu_x = estado_pactos.inventarios_detalle[('EU', 'X', 0)]
+                    volumen_pactado, ingreso_pactado = volumen_total, ingreso_total
+                    ranking_actual = nuevo_ranking_calculado
+                    periodo_h6 = self.periodo_actual + 1
+                    path_h6 = FormsExporter(self.out_dir).export_H6(
+                        periodo_h6, contratos_h6(contratos_aceptados, periodo_h6,
+                                                 self.current_state_parsed.get('compania', 4)))
+                    print(f"  (Oferta aceptada -> {path_h6})")
+                else:
+                    print("  (Oferta ignorada, puedes evaluar otra)")
+
+            except ValueError:
+                print("[!] Error: Introduce solo números para precio y volumen.")
+            except EOFError:
+                break
+            except Exception as e:
+                print(f"Ha ocurrido un error inesperado: {e}")
+
+    def _propuesta_pactos(self):
+        from src.params import AR_STRUCTURE
+        from v3.pacts import PactAnalyzer
+
+        # --- Propuesta de Pacto Comercial (Req 3): frontera precio x volumen ---
+        print("\n--- Propuesta de Pacto Comercial (Venta de Stock) ---")
+        analizador_pactos = PactAnalyzer(
+            {'beneficio': self.beneficio_bruto, 'liquidez': self.liquidez_bruta,
+             'cuota': self.ventas_propias_total, 'inventarios': self.inventarios_total_bruto},
+            self.inventarios_detalle, ranking_model=self.modelo_ranking,
+            caja_area=self.current_state_parsed.get('caja_area'),
+            tipo_cambio=self.current_state_parsed.get('tipo_cambio'),
+        )
+        print(f"Ranking base (incluyendo inventarios): {analizador_pactos.ranking_actual:.4f}")
+
+        for (area, prod, grado), stock in sorted(self.inventarios_detalle.items()):
+            if not stock:
+                continue
+            resultado_pacto = analizador_pactos.frontera(area, prod, grado)
+            frontera_pacto = resultado_pacto['frontera']
+            vc = analizador_pactos.coste_variable(area, prod)
+            print(f"\n{(area, prod, grado)}: stock {stock} uds, VC {vc:.2f}, cobro al contado {AR_STRUCTURE[area]['cash'] * 100:.0f}%")
+            print(f"  Rejilla evaluada: {len(resultado_pacto['precios'])} precios x {len(resultado_pacto['volumenes'])} volúmenes")
+            if len(frontera_pacto) <= 1:
+                print("  No hay pacto que mejore el ranking actual vendiendo este stock.")
+                continue
+            for punto in frontera_pacto[1::max(1, len(frontera_pacto) // 5)] + [frontera_pacto[-1]]:
+                print(f"  Volumen {punto['volumen']:>8.0f} -> mejor precio {punto['precio']:.2f}, "
+                      f"ganancia {punto['ganancia']:+.4f}, precio mínimo rentable {punto['precio_minimo_rentable']:.2f}")
+
+    def run(self, hasta=None):
+        """Ejecuta las etapas en orden hasta 'hasta' (todas si es None)."""
+        for etapa in ETAPAS[:ETAPAS.index(hasta) + 1] if hasta else ETAPAS:
+            self._requiere(etapa)
+        return self
+
+
+def _guardar_perfil(perfil, destino):
+    import pstats
+    from src import profiling
+    perfil.disable()
+    profiling.desactivar()
+    os.makedirs(destino, exist_ok=True)
+    path_prof = os.path.join(destino, 'quickstart.prof')
+    perfil.dump_stats(path_prof)
+    path_traza = profiling.guardar_traza(os.path.join(destino, 'traza.json'))
+    print("\n--- Perfil por tramos ---")
+    profiling.imprimir_resumen()
+    print("\n--- cProfile (20 funciones con más tiempo acumulado) ---")
+    pstats.Stats(perfil).sort_stats('cumulative').print_stats(20)
+    print(f"-> {path_prof} (pstats / snakeviz)")
+    print(f"-> {path_traza} (chrome://tracing o Perfetto)")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Quickstart INTOPIA v3: parse, estimate, optimize, export, negotiate.')
+    ap.add_argument('etapa', nargs='?', choices=ETAPAS,
+                    help='Ejecuta hasta esta etapa (con las previas que necesite). Sin etapa: flujo completo.')
+    ap.add_argument('--data', default=None, help='Carpeta con los LST (por defecto ./data)')
+    ap.add_argument('--out', default=None, help='Carpeta de formularios (por defecto ./outputs/forms)')
+    ap.add_argument('--no-interactivo', action='store_true', help='Sin preguntas de negociación por consola')
+    ap.add_argument('--tiempos', action='store_true', help='Muestra el tiempo de arranque y de cada etapa')
+    ap.add_argument('--profile', nargs='?', const=os.path.join('outputs', 'profile'), default=None, metavar='DIR',
+                    help='cProfile + traza JSON por tramo (tiempo, llamadas, pico de memoria) en DIR')
+    ap.add_argument('--db', nargs='?', const=os.path.join('outputs', 'historia.sqlite'),
+                    default=os.environ.get('INTOPIA_DB'), metavar='PATH',
+                    help='Guarda el historial (periodos, modelos, soluciones, decisiones) en SQLite y reutiliza su caché')
+    args = ap.parse_args(argv)
+
+    arranque = time.perf_counter() - T_INICIO
+    almacen = None
+    if args.db:
+        from v3.store import HistoryStore, temporada_de
+        almacen = HistoryStore(args.db, temporada=temporada_de(args.data))
+    pipeline = QuickstartPipeline(args.data, args.out, interactivo=not args.no_interactivo, almacen=almacen)
+    perfil = None
+    if args.profile:
+        import cProfile
+        from src import profiling
+        profiling.activar()
+        perfil = cProfile.Profile()
+        perfil.enable()
+    if args.etapa:
+        getattr(pipeline, args.etapa)()
+    else:
+        pipeline.run()
+    print("\n--- Fin de la Ejecución ---")
+    if perfil is not None:
+        _guardar_perfil(perfil, args.profile)
+    if almacen is not None:
+        print(f"Historial: {args.db} {almacen.resumen()}")
+        almacen.cerrar()
+    if args.tiempos:
+        print(f"Arranque (imports + argumentos): {arranque * 1000:.0f} ms")
+        for etapa, segundos in pipeline.tiempos.items():
+            print(f"  {etapa}: {segundos * 1000:.0f} ms")
+    return pipeline
+
+
+if __name__ == '__main__':
+    main()
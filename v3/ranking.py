@@ -1,12 +1,205 @@
-
+import os
+import re
+import csv
+import glob
+from collections.abc import Mapping
+import numpy as np
 from src.params import AREAS, PRECIOS_TIPICOS, SALTO_MIN, TOPE_BR_Y_LE3, CAP_MAX
 from src.demand import DemandModel
 
+# --- Pesos y bases de normalización por defecto (fuente única) ---
+# Orden de los componentes: beneficio, liquidez, cuota, inventarios
+PESOS_RANKING = (0.4, 0.3, 0.2, 0.1)
+BASE_BENEFICIO = 500000.0
+BASE_LIQUIDEZ = 20000000.0
+BASE_INVENTARIO = 100000.0
+BASE_CUOTA = 150000.0
+BASES_RANKING = (BASE_BENEFICIO, BASE_LIQUIDEZ, BASE_CUOTA, BASE_INVENTARIO)
+
+COMPANIA_PROPIA = 4
+# Filas con estado por debajo de las cuales se mantienen los pesos por defecto:
+# con 4 coeficientes, menos de 2 filas por coeficiente no calibran nada fiable
+FILAS_MIN_CALIBRACION = 8
+
+
+class RankingModel:
+    """
+    Fórmula de ranking: suma ponderada de beneficio, liquidez, cuota e inventarios,
+    cada uno dividido por su base de normalización.
+    """
+    def __init__(self, pesos=PESOS_RANKING, bases=BASES_RANKING, puntos_datos=0):
+        self.pesos = tuple(float(w) for w in pesos)
+        self.bases = tuple(float(b) for b in bases)
+        self.puntos_datos = puntos_datos
+
+    def score(self, state):
+        # Estado ya normalizado (mismo contrato que calculate_ranking)
+        beneficio = state.get('beneficio', 0)
+        liquidez = state.get('liquidez', 0)
+        cuota = state.get('cuota', 0)
+        inventarios = state.get('inventarios', 0)
+        inventarios_total = sum(inventarios.values()) if isinstance(inventarios, Mapping) else inventarios
+        return (self.pesos[0]*beneficio + self.pesos[1]*liquidez
+                + self.pesos[2]*cuota + self.pesos[3]*inventarios_total)
+
+    def score_batch(self, beneficio, liquidez, cuota, inventarios, normalizado=True):
+        """
+        Puntuación vectorizada sobre columnas (arrays o escalares que se difunden).
+        Con normalizado=False las columnas son brutas y se dividen por las bases.
+        """
+        w_ben, w_liq, w_cuota, w_inv = self.pesos
+        if not normalizado:
+            b_ben, b_liq, b_cuota, b_inv = self.bases
+            w_ben, w_liq, w_cuota, w_inv = w_ben / b_ben, w_liq / b_liq, w_cuota / b_cuota, w_inv / b_inv
+        scores = np.multiply(w_ben, beneficio, dtype=float)
+        scores += np.multiply(w_liq, liquidez, dtype=float)
+        scores += np.multiply(w_cuota, cuota, dtype=float)
+        scores += np.multiply(w_inv, inventarios, dtype=float)
+        return scores
+
+    def normalizar(self, beneficio=0.0, liquidez=0.0, cuota=0.0, inventarios=0.0):
+        return {
+            'beneficio': beneficio / self.bases[0],
+            'liquidez': liquidez / self.bases[1],
+            'cuota': cuota / self.bases[2],
+            'inventarios': inventarios / self.bases[3],
+        }
+
+    def __repr__(self):
+        return f"RankingModel(pesos={self.pesos}, bases={self.bases}, puntos_datos={self.puntos_datos})"
+
+
+# Modelo activo, compartido por el optimizador y la negociación
+_modelo_activo = RankingModel()
+_cache_calibracion = {}
+
+
+def get_ranking_model():
+    return _modelo_activo
+
+
+def set_ranking_model(modelo):
+    global _modelo_activo
+    _modelo_activo = modelo if modelo is not None else RankingModel()
+    return _modelo_activo
+
 
 def calculate_ranking(state):
-    beneficio = state.get('beneficio', 0)
-    liquidez = state.get('liquidez', 0)
-    cuota = state.get('cuota', 0)
-    inventarios = state.get('inventarios', 0)
-    inventarios_total = sum(inventarios.values()) if isinstance(inventarios, dict) else inventarios
-    return 0.4*beneficio + 0.3*liquidez + 0.2*cuota + 0.1*inventarios_total
+    return _modelo_activo.score(state)
+
+
+def calculate_ranking_batch(beneficio, liquidez, cuota, inventarios, normalizado=True):
+    return _modelo_activo.score_batch(beneficio, liquidez, cuota, inventarios, normalizado=normalizado)
+
+
+def estado_bruto(parsed):
+    """Componentes brutos del ranking (beneficio, liquidez, cuota, inventarios) de un LST parseado."""
+    return (
+        float(parsed.get('utilidad_periodo', 0)),
+        float(parsed.get('caja_total', 0)),
+        float(sum(parsed.get('ventas_propias', {}).values())),
+        float(sum(v for v in parsed.get('inventarios_detalle', {}).values() if v)),
+    )
+
+
+def load_ranking_data(data_dir, historicos_parseados):
+    """
+    Lee todos los 'Ranking N.txt' con la puntuación de todas las compañías.
+    A las filas de la compañía propia se les une el estado parseado del periodo N; cada
+    fila lleva sus componentes brutos ('componentes'): los del LST para la propia y los
+    estimados con Asesoría 28/3 (league.componentes_companias) para las rivales.
+    'score' es el PROMEDIO acumulado; 'score_periodo' = N·R_N − (N−1)·R_{N−1} es la
+    puntuación del propio periodo (None si falta el ranking anterior).
+    """
+    from v3.league import componentes_companias
+    ranking_data = []
+    ranking_files = glob.glob(os.path.join(data_dir, 'Ranking [0-9]*.txt'))
+
+    for r_file in sorted(ranking_files):
+        try:
+            periodo_num_match = re.search(r'Ranking (\d+)\.txt', r_file)
+            if not periodo_num_match: continue
+            periodo = int(periodo_num_match.group(1))
+
+            estado_lst = None
+            if 0 < periodo <= len(historicos_parseados):
+                estado_lst = historicos_parseados[periodo - 1]
+            compania_propia = (estado_lst or {}).get('compania', COMPANIA_PROPIA)
+            estimados = componentes_companias(estado_lst) if estado_lst else {}
+
+            with open(r_file, 'r', encoding='utf-8', errors='replace') as f:
+                reader = csv.reader(f, delimiter=';')
+                next(reader)
+                for row in reader:
+                    if not row or len(row) < 2: continue
+                    compania = int(row[0].strip())
+                    score = float(row[1].strip().replace("'", "."))
+                    posicion = int(row[2].strip()) if len(row) > 2 and row[2].strip() else None
+                    propia = compania == compania_propia
+                    ranking_data.append({
+                        'periodo': periodo, 'compania': compania, 'score': score, 'posicion': posicion,
+                        'estado': estado_lst if propia else None,
+                        'componentes': estado_bruto(estado_lst) if propia and estado_lst else estimados.get(compania),
+                    })
+        except (OSError, ValueError, IndexError, StopIteration, csv.Error) as e:
+            print(f"Error procesando el archivo de ranking {r_file}: {e}")
+
+    acumulados = {(p['periodo'], p['compania']): p['score'] for p in ranking_data}
+    for p in ranking_data:
+        n = p['periodo']
+        anterior = 0.0 if n == 1 else acumulados.get((n - 1, p['compania']))
+        p['score_periodo'] = None if anterior is None else n * p['score'] - (n - 1) * anterior
+    return ranking_data
+
+
+def calibrar_ranking(ranking_data, regularizacion=1.0, modelo_base=None):
+    """
+    Ajusta pesos y bases por mínimos cuadrados de la puntuación de cada periodo
+    ('score_periodo') sobre los componentes de todas las filas que los tienen.
+    Solo el cociente peso/base es identificable: se ajustan los coeficientes con un
+    ridge hacia los pesos por defecto, y después se reparten en pesos que suman 1 y
+    una escala común de las bases.
+    Con menos de FILAS_MIN_CALIBRACION filas se devuelve el modelo base.
+    """
+    modelo_base = modelo_base or RankingModel()
+    filas = [p for p in ranking_data if p.get('componentes') and p.get('score_periodo') is not None]
+    if len(filas) < FILAS_MIN_CALIBRACION:
+        return modelo_base
+
+    X = np.array([p['componentes'] for p in filas], dtype=float)
+    y = np.array([p['score_periodo'] for p in filas], dtype=float)
+    bases0 = np.array(modelo_base.bases)
+    pesos0 = np.array(modelo_base.pesos)
+
+    # Ridge resuelto como un único lstsq sobre el sistema aumentado
+    Xn = X / bases0
+    sqrt_lam = np.sqrt(regularizacion)
+    A = np.vstack([Xn, sqrt_lam * np.eye(4)])
+    b = np.concatenate([y, sqrt_lam * pesos0])
+    pesos, *_ = np.linalg.lstsq(A, b, rcond=None)
+
+    escala = np.abs(pesos).sum()
+    if not np.isfinite(escala) or escala < 1e-12:
+        return modelo_base
+    return RankingModel(pesos=pesos / escala, bases=bases0 / escala, puntos_datos=len(filas))
+
+
+def cargar_modelo_calibrado(data_dir, historicos_parseados, regularizacion=1.0):
+    """
+    Calibra (o recupera de caché) el modelo de ranking. No toca el modelo activo:
+    quien lo use lo recibe explícitamente (ranking_model=...).
+    La caché se invalida si cambia cualquier 'Ranking N.txt' o el estado (propio o de
+    mercado) de algún periodo parseado.
+    """
+    ficheros = sorted(glob.glob(os.path.join(data_dir, 'Ranking [0-9]*.txt')))
+    estados = tuple((estado_bruto(h), h.get('compania'), repr(h.get('mercado_precios')),
+                     repr(h.get('mercado_ventas_totales')), repr(h.get('tipo_cambio'))) if h else None
+                    for h in historicos_parseados)
+    clave = (os.path.abspath(data_dir), estados, regularizacion,
+             tuple((f, os.path.getmtime(f), os.path.getsize(f)) for f in ficheros))
+    modelo = _cache_calibracion.get(clave)
+    if modelo is None:
+        puntos = load_ranking_data(data_dir, historicos_parseados)
+        modelo = calibrar_ranking(puntos, regularizacion=regularizacion)
+        _cache_calibracion[clave] = modelo
+    return modelo
@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import http.client
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from src import params
+from src.parser import LSTParser, localizar_lsts, numero_decision
+from src.state import EstadoCompania
+from v3.demand_estimator import DemandEstimator
+from v3.offers import OfferBatchEvaluator, normalizar_oferta
+from v3.portfolio import OfferPortfolio, contratos_h6
+from v3.strategy import find_best_strategy
+from v3.ranking import estado_bruto, cargar_modelo_calibrado, COMPANIA_PROPIA
+
+HOST = '127.0.0.1'
+PUERTO = 8765
+MAX_CUERPO = 10 * 1024 * 1024
+CONTRA_PRECIO_MAX = 1.10   # Una contraoferta pide como mucho un 10% más que el precio ofertado
+
+
+def _clave(texto):
+    # "('EU', 'X', 0)" / "EU-X-0" / "EU,X" -> tupla, para recibir configuraciones de estrategia en JSON
+    partes = [p.strip(" ()'\"") for p in texto.replace('-', ',').split(',') if p.strip(" ()'\"")]
+    return tuple(int(p) if p.lstrip('-').isdigit() else p for p in partes)
+
+
+class EstadoServicio:
+    """
+    Estado caliente del servicio: LSTs parseados, ranking calibrado, modelos de demanda
+    y evaluadores se construyen una sola vez al arrancar y se comparten entre peticiones
+    (solo lectura). Las re-optimizaciones MILP se mandan a un pool de hilos.
+    """
+    def __init__(self, data_dir, hilos=4):
+        t0 = time.perf_counter()
+        self.data_dir = data_dir
+        self.files, _ = localizar_lsts(data_dir)
+        if not self.files:
+            raise FileNotFoundError(f"No se encontraron archivos de Decisión en {data_dir}")
+        parser = LSTParser()
+        self.historicos = [parser.parse_file(f) for f in self.files]
+        self.actual = self.historicos[-1]
+        self.periodo = numero_decision(self.files[-1])
+        self.compania = self.actual.get('compania', COMPANIA_PROPIA)
+
+        self.ranking_model = cargar_modelo_calibrado(data_dir, self.historicos)
+        self.estimador = DemandEstimator(self.historicos)
+        beneficio, liquidez, cuota, inventarios = estado_bruto(self.actual)
+        self.estado_bruto = {'beneficio': beneficio, 'liquidez': liquidez,
+                             'cuota': cuota, 'inventarios': inventarios}
+        self.inventarios_detalle = self.actual.get('inventarios_detalle', {})
+        self.patentes = self.actual.get('patentes_poseidas', {})
+        estado_norm = self.ranking_model.normalizar(beneficio, liquidez, cuota, inventarios)
+        self.estado_norm = EstadoCompania(
+            beneficio=estado_norm['beneficio'], liquidez=estado_norm['liquidez'], cuota=estado_norm['cuota'],
+            inventarios_total=estado_norm['inventarios'], inventarios_detalle=self.inventarios_detalle,
+            patentes_poseidas=self.patentes, caja_area=self.actual.get('caja_area'),
+            tipo_cambio=self.actual.get('tipo_cambio'),
+        )
+        self.evaluador = OfferBatchEvaluator(self.estado_bruto, self.inventarios_detalle, self.ranking_model,
+                                             self.actual.get('caja_area'), self.actual.get('tipo_cambio'))
+        self.pool = ThreadPoolExecutor(max_workers=hilos)
+        self.tiempo_carga = time.perf_counter() - t0
+
+    # --- Operaciones (síncronas; las rápidas se atienden en el bucle de eventos) ---
+
+    def evaluate_offer(self, payload):
+        ofertas = payload.get('ofertas') or [payload.get('oferta', payload)]
+        resultado = self.evaluador.evaluar([normalizar_oferta(o) for o in ofertas])
+        return {'ranking_actual': self.evaluador.ranking_actual, 'ofertas': resultado}
+
+    def counter_offer(self, payload):
+        """
+        Contraoferta en forma cerrada: CONTRA_PRECIO_MAX veces el precio ofertado y el
+        volumen ofertado sin pasar del stock. Sin un modelo de aceptación del comprador,
+        el ranking crece con el precio y (con margen positivo) con el volumen, así que
+        cualquier búsqueda en rejilla acabaría siempre en esa esquina.
+        Si no mejora el ranking de la oferta original, 'contraoferta' es None.
+        """
+        oferta = normalizar_oferta(payload.get('oferta', payload))
+        precio, volumen = float(oferta['price']), float(oferta['volume'])
+        original = self.evaluador.evaluar([oferta])[0]
+        stock = self.inventarios_detalle.get((oferta['area'], oferta['product'], int(float(oferta.get('grade', 0)))), 0)
+        volumen_max = min(volumen, stock)
+        contra = None
+        if volumen_max > 0:
+            propuesta = {**oferta, 'price': round(precio * CONTRA_PRECIO_MAX, 2), 'volume': float(volumen_max)}
+            mejor = self.evaluador.evaluar([propuesta])[0]
+            base = original['ganancia'] if original['valida'] else -np.inf
+            if mejor['valida'] and mejor['ganancia'] > base:
+                contra = {k: v for k, v in mejor.items() if k != 'puesto'}
+        return {'ranking_actual': self.evaluador.ranking_actual, 'oferta': original, 'contraoferta': contra}
+
+    def reoptimize(self, payload):
+        """Cartera de ofertas H6 ('ofertas') y/o estrategia de mercado ('estrategia')."""
+        respuesta = {}
+        if 'ofertas' in payload:
+            cartera = OfferPortfolio(self.estado_bruto, self.inventarios_detalle, plantas=self.actual.get('plantas'),
+                                     patentes=self.patentes or None,
+                                     caja_minima=payload.get('caja_minima', 0.0), ranking_model=self.ranking_model,
+                                     caja_area=self.actual.get('caja_area'), tipo_cambio=self.actual.get('tipo_cambio'))
+            resultado = cartera.optimizar([normalizar_oferta(o) for o in payload['ofertas']])
+            resultado['h6'] = contratos_h6(resultado['contratos'], self.periodo + 1, self.compania)
+            respuesta['cartera'] = resultado
+        if 'estrategia' in payload:
+            cfg = payload['estrategia']
+            config = {
+                'markets_to_test': {_clave(k): v for k, v in cfg.get('markets_to_test', {}).items()},
+                'production_config': {_clave(k): v for k, v in cfg.get('production_config', {}).items()},
+                'gasto_publicidad': cfg.get('gasto_publicidad', 0),
+                'gasto_informes': cfg.get('gasto_informes', 0),
+            }
+            ranking, precios, solucion, _ = find_best_strategy(self.estado_norm, self.patentes, self.estimador, config,
+                                                               self.ranking_model)
+            respuesta['estrategia'] = {
+                'ranking': ranking, 'solucion': solucion,
+                'precios': {'-'.join(map(str, k)): v for k, v in precios.items()},
+            }
+        return respuesta
+
+    def estado(self, payload=None):
+        return {
+            'periodo': self.periodo, 'compania': self.compania, 'estado_bruto': self.estado_bruto,
+            'ranking_actual': self.evaluador.ranking_actual, 'pesos': self.ranking_model.pesos,
+            'bases': self.ranking_model.bases, 'tiempo_carga': self.tiempo_carga, 'params_version': params.PARAMS_VERSION,
+        }
+
+
+class NegotiationServer:
+    """Servidor HTTP/1.1 mínimo sobre asyncio (solo localhost, JSON en el cuerpo)."""
+    RUTAS_RAPIDAS = ('evaluate_offer', 'counter_offer', 'estado')
+    RUTAS_LENTAS = ('reoptimize',)
+
+    def __init__(self, servicio, host=HOST, puerto=PUERTO):
+        self.servicio = servicio
+        self.host = host
+        self.puerto = puerto
+        self.server = None
+
+    async def _atender(self, reader, writer):
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                metodo, ruta, _ = linea.decode('latin-1').split(' ', 2)
+                cabeceras = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b'\r\n', b'\n', b''):
+                        break
+                    k, _, v = h.decode('latin-1').partition(':')
+                    cabeceras[k.strip().lower()] = v.strip()
+                largo = int(cabeceras.get('content-length', 0))
+                if largo > MAX_CUERPO:
+                    await self._responder(writer, 413, {'error': 'cuerpo demasiado grande'})
+                    break
+                cuerpo = await reader.readexactly(largo) if largo else b''
+                estado, respuesta = await self._despachar(metodo, ruta.strip('/').split('?')[0], cuerpo)
+                await self._responder(writer, estado, respuesta)
+                if cabeceras.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _despachar(self, metodo, ruta, cuerpo):
+        try:
+            payload = json.loads(cuerpo) if cuerpo else {}
+        except json.JSONDecodeError as e:
+            return 400, {'error': f'JSON no válido: {e}'}
+        if ruta not in self.RUTAS_RAPIDAS + self.RUTAS_LENTAS:
+            return 404, {'error': f'ruta desconocida: /{ruta}'}
+        t0 = time.perf_counter()
+        try:
+            funcion = getattr(self.servicio, ruta)
+            if ruta in self.RUTAS_LENTAS:
+                loop = asyncio.get_running_loop()
+                resultado = await loop.run_in_executor(self.servicio.pool, funcion, payload)
+            else:
+                resultado = funcion(payload)
+        except (KeyError, ValueError, TypeError) as e:
+            return 400, {'error': f'petición no válida: {e}'}
+        except Exception as e:
+            # Un fallo interno (p.ej. del solver) no debe cerrar la conexión sin respuesta
+            print(f"[/{ruta}] {type(e).__name__}: {e}", file=sys.stderr)
+            return 500, {'error': f'error interno: {type(e).__name__}: {e}'}
+        resultado['ms'] = round((time.perf_counter() - t0) * 1000, 3)
+        return 200, resultado
+
+    async def _responder(self, writer, estado, respuesta):
+        cuerpo = json.dumps(respuesta, ensure_ascii=False, default=float).encode('utf-8')
+        razon = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+                 500: 'Internal Server Error'}[estado]
+        writer.write(f"HTTP/1.1 {estado} {razon}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(cuerpo)}\r\n\r\n".encode('latin-1') + cuerpo)
+        await writer.drain()
+
+    async def iniciar(self):
+        self.server = await asyncio.start_server(self._atender, self.host, self.puerto)
+        self.puerto = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def servir(self):
+        if self.server is None:
+            await self.iniciar()
+        async with self.server:
+            await self.server.serve_forever()
+
+
+class ServiceClient:
+    """Cliente local del servicio (conexión persistente, solo librería estándar)."""
+    def __init__(self, host=HOST, puerto=PUERTO, timeout=60):
+        self.conexion = http.client.HTTPConnection(host, puerto, timeout=timeout)
+
+    def _post(self, ruta, payload=None):
+        cuerpo = json.dumps(payload or {})
+        self.conexion.request('POST', f'/{ruta}', cuerpo, {'Content-Type': 'application/json'})
+        respuesta = self.conexion.getresponse()
+        datos = json.loads(respuesta.read())
+        if respuesta.status != 200:
+            raise RuntimeError(f"{respuesta.status}: {datos.get('error')}")
+        return datos
+
+    def evaluate_offer(self, oferta):
+        return self._post('evaluate_offer', {'oferta': oferta})
+
+    def evaluate_offers(self, ofertas):
+        return self._post('evaluate_offer', {'ofertas': ofertas})
+
+    def counter_offer(self, oferta):
+        return self._post('counter_offer', {'oferta': oferta})
+
+    def reoptimize(self, ofertas=None, estrategia=None, caja_minima=0.0):
+        payload = {'caja_minima': caja_minima}
+        if ofertas is not None:
+            payload['ofertas'] = ofertas
+        if estrategia is not None:
+            payload['estrategia'] = estrategia
+        return self._post('reoptimize', payload)
+
+    def estado(self):
+        return self._post('estado')
+
+    def cerrar(self):
+        self.conexion.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Servicio local de negociación con estado caliente.')
+    ap.add_argument('--data', default=os.path.join(os.getcwd(), 'data'), help='Carpeta con los LST')
+    ap.add_argument('--host', default=HOST)
+    ap.add_argument('--port', type=int, default=PUERTO)
+    args = ap.parse_args(argv)
+
+    servicio = EstadoServicio(args.data)
+    servidor = NegotiationServer(servicio, args.host, args.port)
+
+    async def arrancar():
+        await servidor.iniciar()
+        print(f"Estado cargado en {servicio.tiempo_carga:.2f}s. Escuchando en http://{args.host}:{servidor.puerto}",
+              file=sys.stderr)
+        await servidor.servir()
+
+    try:
+        asyncio.run(arrancar())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
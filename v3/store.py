@@ -0,0 +1,292 @@
+"""
+Historial local en SQLite: periodos parseados por compañía, instantáneas de los modelos de
+demanda, soluciones de estrategias por huella de entradas y decisiones emitidas.
+
+    python -m v3.quickstart_v3 export --no-interactivo --db      # guarda en outputs/historia.sqlite
+    python -m v3.store resumen
+    python -m v3.store modelos --area EU --producto Y
+    python -m v3.store estrategias --estrategia "No hacer nada"
+
+Los objetos (LST parseado, solución, formulario) se guardan con pickle, como la caché de
+gacetas; las columnas por las que se consulta (periodo, compañía, mercado, estrategia)
+son columnas normales con índice. Las escrituras van en lote (executemany) dentro de una
+transacción. Periodos, modelos, estrategias y decisiones llevan la temporada (liga) en la
+clave: por defecto la carpeta de los LST (temporada_de), o INTOPIA_TEMPORADA.
+"""
+import os
+import sys
+import time
+import pickle
+import sqlite3
+import hashlib
+import argparse
+
+DB_DEFECTO = os.environ.get('INTOPIA_DB', os.path.join(os.getcwd(), 'outputs', 'historia.sqlite'))
+VERSION_ESQUEMA = 2   # 2: temporada en las claves de periodos, modelos, estrategias y decisiones
+TABLAS_TEMPORADA = ('periodos', 'modelos_demanda', 'estrategias', 'decisiones')
+# Código que produce una solución de find_best_strategy (y los modelos que usa: caja,
+# demanda y ranking): forma parte de su clave en la caché
+MODULOS_SOLUCION = ('optimizer_pulp', 'prescreen', 'strategy', 'cashflow', 'demand_estimator', 'ranking')
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS periodos (
+    temporada TEXT NOT NULL DEFAULT '', compania INTEGER NOT NULL, periodo INTEGER NOT NULL, fichero TEXT,
+    huella TEXT NOT NULL, beneficio REAL, liquidez REAL, cuota REAL, inventarios REAL, datos BLOB NOT NULL,
+    creado TEXT,
+    PRIMARY KEY (temporada, compania, periodo)
+);
+CREATE INDEX IF NOT EXISTS ix_periodos_periodo ON periodos (periodo);
+CREATE INDEX IF NOT EXISTS ix_periodos_huella ON periodos (huella);
+
+CREATE TABLE IF NOT EXISTS modelos_demanda (
+    temporada TEXT NOT NULL DEFAULT '', periodo INTEGER NOT NULL, area TEXT NOT NULL, producto TEXT NOT NULL,
+    grado INTEGER NOT NULL, params_version TEXT NOT NULL, pendiente REAL, interseccion REAL, puntos_datos INTEGER,
+    creado TEXT,
+    PRIMARY KEY (temporada, periodo, area, producto, grado, params_version)
+);
+CREATE INDEX IF NOT EXISTS ix_modelos_mercado ON modelos_demanda (area, producto, grado, periodo);
+
+CREATE TABLE IF NOT EXISTS soluciones (
+    clave TEXT PRIMARY KEY, params_version TEXT, resultado BLOB NOT NULL, creado TEXT
+);
+
+CREATE TABLE IF NOT EXISTS estrategias (
+    temporada TEXT NOT NULL DEFAULT '', periodo INTEGER NOT NULL, estrategia TEXT NOT NULL,
+    params_version TEXT NOT NULL, clave TEXT, ranking REAL, precios BLOB, creado TEXT,
+    PRIMARY KEY (temporada, periodo, estrategia, params_version)
+);
+CREATE INDEX IF NOT EXISTS ix_estrategias_nombre ON estrategias (estrategia, periodo);
+
+CREATE TABLE IF NOT EXISTS decisiones (
+    temporada TEXT NOT NULL DEFAULT '', periodo INTEGER NOT NULL, formulario TEXT NOT NULL, estrategia TEXT,
+    params_version TEXT, contenido BLOB NOT NULL, creado TEXT,
+    PRIMARY KEY (temporada, periodo, formulario)
+);
+CREATE INDEX IF NOT EXISTS ix_decisiones_estrategia ON decisiones (estrategia, periodo);
+"""
+
+_huella_parser = None
+_huella_solucion = None
+
+
+def huella_lst(path):
+    """sha256 del LST y del código del parser: si cambia cualquiera de los dos, se vuelve a parsear."""
+    global _huella_parser
+    if _huella_parser is None:
+        from src import parser
+        with open(parser.__file__, 'rb') as f:
+            _huella_parser = hashlib.sha256(f.read()).hexdigest()
+    h = hashlib.sha256(_huella_parser.encode('ascii'))
+    with open(path, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def huella_codigo_solucion():
+    """sha256 del código de MODULOS_SOLUCION: si cambia el optimizador, no se reutilizan soluciones."""
+    global _huella_solucion
+    if _huella_solucion is None:
+        import v3
+        h = hashlib.sha256()
+        for modulo in MODULOS_SOLUCION:
+            with open(os.path.join(os.path.dirname(v3.__file__), f'{modulo}.py'), 'rb') as f:
+                h.update(f.read())
+        _huella_solucion = h.hexdigest()
+    return _huella_solucion
+
+
+def clave_texto(clave):
+    """Clave de strategy._clave_solucion (más la huella del código) como texto estable para la tabla soluciones."""
+    return hashlib.sha256((huella_codigo_solucion() + repr(clave)).encode('utf-8')).hexdigest()
+
+
+def temporada_de(data_dir):
+    """Temporada por defecto de un historial: INTOPIA_TEMPORADA o la carpeta de los LST."""
+    return os.environ.get('INTOPIA_TEMPORADA') or os.path.abspath(data_dir or os.path.join(os.getcwd(), 'data'))
+
+
+def _migrar(con):
+    """Historiales sin temporada (esquema 1): sus filas pasan a la temporada ''."""
+    existentes = {f[0] for f in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    viejas = [t for t in TABLAS_TEMPORADA if t in existentes
+              and 'temporada' not in {c[1] for c in con.execute(f'PRAGMA table_info({t})')}]
+    for tabla in viejas:
+        con.execute(f'ALTER TABLE {tabla} RENAME TO {tabla}_v1')
+    con.executescript(ESQUEMA)
+    with con:
+        for tabla in viejas:
+            con.execute(f"INSERT INTO {tabla} SELECT '', * FROM {tabla}_v1")
+            con.execute(f'DROP TABLE {tabla}_v1')
+    # Los índices de las tablas renombradas se fueron con ellas: se crean ahora
+    con.executescript(ESQUEMA)
+    con.execute(f'PRAGMA user_version = {VERSION_ESQUEMA}')
+
+
+def _ahora():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _filtro(**condiciones):
+    # WHERE con las condiciones que no son None (los nombres son columnas fijas del código)
+    activas = [(k, v) for k, v in condiciones.items() if v is not None]
+    if not activas:
+        return '', ()
+    return ' WHERE ' + ' AND '.join(f'{k} = ?' for k, _ in activas), tuple(v for _, v in activas)
+
+
+class HistoryStore:
+    """
+    Conexión al historial. Se puede usar como contexto (with HistoryStore() as db: ...).
+    Las consultas devuelven listas de dicts con los objetos ya deserializados.
+    temporada: se guarda en cada fila y filtra las consultas (None: todas, y se escribe '').
+    """
+    def __init__(self, path=None, temporada=None):
+        self.path = path or DB_DEFECTO
+        self.temporada = temporada
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.con = sqlite3.connect(self.path)
+        self.con.row_factory = sqlite3.Row
+        self.con.execute('PRAGMA journal_mode=WAL')
+        self.con.execute('PRAGMA synchronous=NORMAL')
+        if self.con.execute('PRAGMA user_version').fetchone()[0] < VERSION_ESQUEMA:
+            _migrar(self.con)
+        else:
+            self.con.executescript(ESQUEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
+
+    def cerrar(self):
+        self.con.close()
+
+    # --- Periodos parseados ---
+    def guardar_periodos(self, filas):
+        """filas: iterable de (periodo, fichero, huella, datos parseados)."""
+        from v3.ranking import estado_bruto, COMPANIA_PROPIA
+        ahora = _ahora()
+        with self.con:
+            self.con.executemany(
+                'INSERT OR REPLACE INTO periodos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(self.temporada or '', datos.get('compania', COMPANIA_PROPIA), periodo, os.path.basename(fichero), huella,
+                  *estado_bruto(datos), pickle.dumps(datos, protocol=pickle.HIGHEST_PROTOCOL), ahora)
+                 for periodo, fichero, huella, datos in filas])
+
+    def periodo_por_huella(self, huella):
+        """LST ya parseado con esa huella (ver huella_lst) en esta temporada, o None."""
+        sql, args = _filtro(huella=huella, temporada=self.temporada)
+        fila = self.con.execute(f'SELECT datos FROM periodos{sql} LIMIT 1', args).fetchone()
+        return pickle.loads(fila['datos']) if fila else None
+
+    def periodos(self, compania=None, periodo=None):
+        sql, args = _filtro(temporada=self.temporada, compania=compania, periodo=periodo)
+        filas = self.con.execute(f'SELECT * FROM periodos{sql} ORDER BY temporada, compania, periodo', args).fetchall()
+        return [{**dict(f), 'datos': pickle.loads(f['datos'])} for f in filas]
+
+    # --- Modelos de demanda ---
+    def guardar_modelos(self, periodo, modelos_demanda, params_version):
+        ahora = _ahora()
+        with self.con:
+            self.con.executemany(
+                'INSERT OR REPLACE INTO modelos_demanda VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(self.temporada or '', periodo, area, prod, int(grado), params_version, float(m['pendiente']),
+                  float(m['interseccion']), int(m['puntos_datos']), ahora)
+                 for (area, prod, grado), m in modelos_demanda.items()])
+
+    def modelos(self, area=None, producto=None, grado=None, periodo=None):
+        sql, args = _filtro(temporada=self.temporada, area=area, producto=producto, grado=grado, periodo=periodo)
+        return [dict(f) for f in self.con.execute(
+            f'SELECT * FROM modelos_demanda{sql} ORDER BY temporada, area, producto, grado, periodo', args)]
+
+    # --- Soluciones (caché persistente de find_best_strategy) y ranking por estrategia ---
+    def solucion(self, clave):
+        fila = self.con.execute('SELECT resultado FROM soluciones WHERE clave = ?', (clave_texto(clave),)).fetchone()
+        return pickle.loads(fila['resultado']) if fila else None
+
+    def guardar_solucion(self, clave, resultado):
+        with self.con:
+            self.con.execute('INSERT OR REPLACE INTO soluciones VALUES (?, ?, ?, ?)',
+                             (clave_texto(clave), clave[0], pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL),
+                              _ahora()))
+
+    def guardar_estrategias(self, periodo, filas, params_version):
+        """filas: iterable de (nombre, clave de la solución, ranking, precios)."""
+        ahora = _ahora()
+        with self.con:
+            self.con.executemany(
+                'INSERT OR REPLACE INTO estrategias VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(self.temporada or '', periodo, nombre, params_version, clave_texto(clave), float(ranking),
+                  pickle.dumps(precios, protocol=pickle.HIGHEST_PROTOCOL), ahora)
+                 for nombre, clave, ranking, precios in filas])
+
+    def estrategias(self, estrategia=None, periodo=None):
+        sql, args = _filtro(temporada=self.temporada, estrategia=estrategia, periodo=periodo)
+        filas = self.con.execute(f'SELECT * FROM estrategias{sql} ORDER BY temporada, periodo, ranking DESC', args).fetchall()
+        return [{**dict(f), 'precios': pickle.loads(f['precios'])} for f in filas]
+
+    # --- Decisiones emitidas ---
+    def guardar_decisiones(self, periodo, decisiones, estrategia, params_version):
+        """decisiones: {formulario: contenido}, como DecisionAssembler.ensamblar."""
+        ahora = _ahora()
+        with self.con:
+            self.con.executemany(
+                'INSERT OR REPLACE INTO decisiones VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(self.temporada or '', periodo, formulario, estrategia, params_version,
+                  pickle.dumps(contenido, protocol=pickle.HIGHEST_PROTOCOL), ahora)
+                 for formulario, contenido in decisiones.items()])
+
+    def decisiones(self, periodo=None, formulario=None, estrategia=None):
+        sql, args = _filtro(temporada=self.temporada, periodo=periodo, formulario=formulario, estrategia=estrategia)
+        filas = self.con.execute(f'SELECT * FROM decisiones{sql} ORDER BY temporada, periodo, formulario', args).fetchall()
+        return [{**dict(f), 'contenido': pickle.loads(f['contenido'])} for f in filas]
+
+    def resumen(self):
+        """Nº de filas por tabla."""
+        return {tabla: self.con.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+                for tabla in ('periodos', 'modelos_demanda', 'soluciones', 'estrategias', 'decisiones')}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Consulta el historial SQLite de INTOPIA helper.')
+    ap.add_argument('tabla', choices=('resumen', 'periodos', 'modelos', 'estrategias', 'decisiones'))
+    ap.add_argument('--db', default=DB_DEFECTO)
+    ap.add_argument('--temporada', default=None, help='Solo esta temporada (por defecto todas)')
+    ap.add_argument('--periodo', type=int)
+    ap.add_argument('--compania', type=int)
+    ap.add_argument('--area')
+    ap.add_argument('--producto')
+    ap.add_argument('--grado', type=int)
+    ap.add_argument('--estrategia')
+    ap.add_argument('--formulario')
+    args = ap.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"No existe {args.db} (ejecuta el quickstart con --db)")
+        return 1
+    with HistoryStore(args.db, temporada=args.temporada) as db:
+        if args.tabla == 'resumen':
+            for tabla, n in db.resumen().items():
+                print(f"{tabla:<16}{n:>8}")
+        elif args.tabla == 'periodos':
+            for f in db.periodos(args.compania, args.periodo):
+                print(f"Cía {f['compania']} P{f['periodo']}: beneficio {f['beneficio']:,.0f} | liquidez {f['liquidez']:,.0f} | "
+                      f"cuota {f['cuota']:,.0f} | inventarios {f['inventarios']:,.0f} ({f['fichero']})")
+        elif args.tabla == 'modelos':
+            for f in db.modelos(args.area, args.producto, args.grado, args.periodo):
+                print(f"P{f['periodo']} {f['area']}-{f['producto']}-{f['grado']}: pendiente {f['pendiente']:.2f}, "
+                      f"intersección {f['interseccion']:,.0f} ({f['puntos_datos']} puntos, {f['params_version']})")
+        elif args.tabla == 'estrategias':
+            for f in db.estrategias(args.estrategia, args.periodo):
+                print(f"P{f['periodo']} {f['estrategia']}: ranking {f['ranking']:.4f} precios {f['precios']}")
+        else:
+            for f in db.decisiones(args.periodo, args.formulario, args.estrategia):
+                print(f"P{f['periodo']} {f['formulario']} ({f['estrategia']}): {f['contenido']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import copy
+import hashlib
+import numpy as np
+from src import params
+from src.planner import Planner
+from src.profiling import tramo
+from v3.optimizer_pulp import OptimizerV3
+from v3.prescreen import PrescreenAnalitico
+from v3.demand_estimator import desviacion_demanda, ELASTICIDAD_PUBLICIDAD
+from v3.ranking import get_ranking_model
+
+# Constantes para la simulación de estrategias
+COSTE_ID_Y = 320000 
+COSTE_ID_X = 320000 
+COSTE_PUBLICIDAD_Y_EU = 50000 
+COSTE_INFORME_IM2 = 60000 
+COSTE_INFORME_IM17 = 10000 
+CUOTA_OBJETIVO = {0: 0.10, 1: 0.15}   # Cuota de la demanda del mercado que se planifica por grado
+PENALIZACION_INCERTIDUMBRE = 1.0      # Desviaciones típicas (bootstrap) que se restan a la demanda estimada
+
+# Soluciones de find_best_strategy por versión de parámetros + entradas (ver _clave_solucion);
+# con usar_almacen() se guardan también en el historial SQLite (v3.store) entre ejecuciones
+_cache_soluciones = {}
+_almacen = None
+_PLANNER = Planner()
+
+def gasto_id_estrategia(strategy_config, patentes):
+    # --- Lógica de Patentes Dinámica ---
+    production_config = strategy_config.get('production_config', {})
+    gasto_ID = 0
+    grado_req_X = production_config.get(('EU', 'X'), -1)
+    if grado_req_X > patentes.get(('EU', 'X'), 0):
+        gasto_ID += COSTE_ID_X
+    
+    grado_req_Y = production_config.get(('EU', 'Y'), -1)
+    if grado_req_Y > patentes.get(('EU', 'Y'), 0):
+        gasto_ID += COSTE_ID_Y
+    return gasto_ID
+
+def coste_estrategia(strategy_config, patentes):
+    # Costes fijos de la estrategia (publicidad + I+D + informes), como en OptimizerV3
+    return (strategy_config.get('gasto_publicidad', 0) + gasto_id_estrategia(strategy_config, patentes)
+            + strategy_config.get('gasto_informes', 0))
+
+def optimizador_estrategia(current_state_norm, patentes, strategy_config, market_conditions, solucion_previa=None,
+                           ranking_model=None):
+    """
+    OptimizerV3 construido para una estrategia y unas condiciones de mercado concretas.
+    Con solucion_previa queda listo para re-resolver con warm start (p.ej. tras un pacto).
+    """
+    optimizer = OptimizerV3(current_state=current_state_norm, ranking_model=ranking_model)
+    optimizer.set_strategy_costs(
+        coste_publicidad=strategy_config.get('gasto_publicidad', 0),
+        coste_ID=gasto_id_estrategia(strategy_config, patentes),
+        coste_informes=strategy_config.get('gasto_informes', 0)
+    )
+    for (p_area, p_prod), p_grado in strategy_config.get('production_config', {}).items():
+        optimizer.set_market_conditions(
+            area=p_area, prod=p_prod, grado=p_grado,
+            precio_fijo=market_conditions.get((p_area, p_prod, p_grado), {}).get('precio', 0),
+            demanda_maxima=market_conditions.get((p_area, p_prod, p_grado), {}).get('demanda', 0),
+            producir_grado=p_grado
+        )
+    optimizer.build_model()
+    if solucion_previa is not None:
+        optimizer.set_initial_solution(solucion_previa)
+    return optimizer
+
+def _clave_solucion(current_state_norm, patentes, estimador, strategy_config, ranking_model=None):
+    # Una solución solo es reutilizable con la misma gaceta (PARAMS_VERSION), el mismo
+    # modelo de ranking y las mismas entradas; el contenido se resume en una huella.
+    # De la demanda solo cuentan los mercados que la estrategia prueba.
+    modelo = ranking_model or get_ranking_model()
+    demanda = [(k, estimador.get_demand_function(*k)) for k in sorted(strategy_config.get('markets_to_test', {})) if k]
+    contenido = repr((sorted(current_state_norm.items(), key=repr), sorted(patentes.items(), key=repr),
+                      sorted(strategy_config.items(), key=repr), demanda))
+    return (params.PARAMS_VERSION, modelo.pesos, modelo.bases, hashlib.sha256(contenido.encode('utf-8')).hexdigest())
+
+def find_best_strategy(current_state_norm, patentes, estimador, strategy_config, ranking_model=None):
+    """
+    Función helper para ejecutar el bucle de optimización.
+    Los resultados se cachean por versión de parámetros, modelo de ranking y entradas.
+    """
+    clave = _clave_solucion(current_state_norm, patentes, estimador, strategy_config, ranking_model)
+    if clave not in _cache_soluciones:
+        resultado = _almacen.solucion(clave) if _almacen is not None else None
+        if resultado is None:
+            with tramo('estrategia', lambda: ','.join('-'.join(map(str, k)) for k in strategy_config.get('markets_to_test', {}))):
+                resultado = _buscar_estrategia(current_state_norm, patentes, estimador, strategy_config, ranking_model)
+            if _almacen is not None:
+                _almacen.guardar_solucion(clave, resultado)
+        _cache_soluciones[clave] = resultado
+    return copy.deepcopy(_cache_soluciones[clave])
+
+def usar_almacen(almacen):
+    """Activa (o con None desactiva) la caché persistente de soluciones en un HistoryStore."""
+    global _almacen
+    _almacen = almacen
+
+def _buscar_estrategia(current_state_norm, patentes, estimador, strategy_config, ranking_model=None):
+    markets_to_test = strategy_config.get('markets_to_test', {})
+    production_config = strategy_config.get('production_config', {})
+    
+    gasto_ID = gasto_id_estrategia(strategy_config, patentes)
+    gasto_publicidad = strategy_config.get('gasto_publicidad', 0)
+    gasto_informes = strategy_config.get('gasto_informes', 0)
+
+    mejor_ranking = -float('inf')
+    mejor_solucion = None
+    mejores_precios = {}
+    mejor_market_cond = {}
+
+    if not markets_to_test:
+        markets_to_test = {(): [0]} # Iteración dummy para "No hacer nada" (sin tocar la config)
+
+    coste_estrategia = gasto_publicidad + gasto_ID + gasto_informes
+    production_grade_map = {k: g for k, g in production_config.items() if g != -1}
+
+    for mercado_key, precios in markets_to_test.items():
+        
+        if not mercado_key:
+             precios = [0]
+        else:
+            area, prod, grado = mercado_key
+            grado_poseido_prod = patentes.get((area, prod), 0)
+            if grado > grado_poseido_prod:
+                # No se puede VENDER un producto si no se tiene la patente
+                continue
+            # Solo precios admisibles (rejilla SALTO_MIN, tope BR-Y): nunca llegan al MILP
+            precios = np.asarray(precios)
+            precios = precios[_PLANNER.valid_price_mask(area, prod, grado, precios)].tolist()
+
+        # --- Demanda de todos los precios candidatos en bloque ---
+        precios_arr = np.asarray(precios, dtype=float)
+        demandas_arr = np.zeros(len(precios_arr), dtype=int)
+        if mercado_key:
+            func_demanda = estimador.get_demand_function(area, prod, grado)
+            demanda_total_mercado = func_demanda['interseccion'] + (func_demanda['pendiente'] * precios_arr)
+            # Demanda prudente: los ajustes con pocos puntos o muy dispersos planifican menos ventas
+            penalizacion = strategy_config.get('penalizacion_incertidumbre', PENALIZACION_INCERTIDUMBRE)
+            if penalizacion:
+                demanda_total_mercado = demanda_total_mercado - penalizacion * desviacion_demanda(func_demanda, precios_arr)
+            if gasto_publicidad > 0:
+                demanda_total_mercado = demanda_total_mercado * (1 + ELASTICIDAD_PUBLICIDAD * (gasto_publicidad / 100000))
+            cuota_mercado_objetivo = CUOTA_OBJETIVO[grado]
+            demandas_arr = np.maximum(0, (demanda_total_mercado * cuota_mercado_objetivo).astype(int))
+
+        # --- Pre-filtro analítico: mismo objetivo que OptimizerV3 sin lanzar CBC ---
+        # Solo se condiciona la venta si el mercado coincide con un grado de production_config
+        condiciones = {}
+        for (p_area, p_prod), p_grado in production_config.items():
+            key = (p_area, p_prod, int(p_grado))
+            if key == mercado_key:
+                condiciones[key] = {'precio': precios_arr, 'demanda': demandas_arr}
+            else:
+                condiciones[key] = {'precio': 0, 'demanda': 0}
+        prescreen = PrescreenAnalitico(current_state_norm, production_grade_map, coste_estrategia,
+                                       ranking_model=ranking_model)
+        objetivos, ambiguos = prescreen.evaluar(condiciones, n=len(precios_arr))
+
+        for i, precio_prueba in enumerate(precios):
+            market_conditions_actual = {}
+            if mercado_key:
+                market_conditions_actual = {
+                    mercado_key: { 'precio': precio_prueba, 'demanda': int(demandas_arr[i]) }
+                }
+
+            if not ambiguos[i]:
+                ranking_actual = float(objetivos[i])
+                if ranking_actual > mejor_ranking:
+                    mejor_ranking = ranking_actual
+                    mejor_solucion = prescreen.solucion(i)
+                    if mercado_key:
+                        mejores_precios = {mercado_key: precio_prueba}
+                    mejor_market_cond = market_conditions_actual
+                continue
+
+            optimizer = optimizador_estrategia(current_state_norm, patentes, strategy_config, market_conditions_actual,
+                                               ranking_model=ranking_model)
+            solucion_actual = optimizer.solve()
+            ranking_actual = optimizer.get_objective_value()
+
+            if ranking_actual > mejor_ranking:
+                mejor_ranking = ranking_actual
+                mejor_solucion = solucion_actual
+                if mercado_key: 
+                    mejores_precios = {mercado_key: precio_prueba}
+                mejor_market_cond = market_conditions_actual
+                
+    return mejor_ranking, mejores_precios, mejor_solucion, mejor_market_cond
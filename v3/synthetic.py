@@ -0,0 +1,238 @@
+"""
+Generador de ligas sintéticas: escribe 'Decisión N.lst.txt' y 'Ranking N.txt' con el
+formato del árbitro (cabeceras de página, balance, resultados, INFORMACION NO CONTABLE,
+ASESORIA 3, 28 y 17 y eco de formularios) para cualquier nº de periodos y compañías.
+
+    python -m v3.synthetic --out /tmp/liga --periodos 20 --companias 11
+"""
+import os
+import argparse
+import numpy as np
+from src.params import AREAS, PRECIOS_TIPICOS, SALTO_MIN, TOPE_BR_Y_LE3
+from v3.demand_estimator import COL_MAP, VENTAS_MAP
+
+CIA = 'COMPA¥IA'   # Así sale la Ñ en los listados del árbitro
+NOMBRE_AREA = ('U.S.', 'EC/EU', 'BRAZIL')
+LINEAS_POR_PAGINA = 58
+# Demanda total por (área, producto) en miles de unidades al precio típico, y elasticidad
+DEMANDA_BASE = {('US', 'X'): 45.0, ('US', 'Y'): 60.0, ('EU', 'X'): 20.0,
+                ('EU', 'Y'): 65.0, ('BR', 'X'): 4.0, ('BR', 'Y'): 3.0}
+ELASTICIDAD = 1.8
+
+
+def _num(v, ancho):
+    # Enteros con punto final ('12345.'), como en los listados
+    return f"{v:.0f}.".rjust(ancho)
+
+
+def _fila(etiqueta, valores, ancho=18, sangria=35):
+    return etiqueta.ljust(sangria) + ''.join(_num(v, ancho) for v in valores)
+
+
+class SyntheticLeague:
+    """
+    Liga simulada: precios de cada compañía alrededor del precio típico (en la rejilla
+    SALTO_MIN), demanda total lineal en el precio medio con ruido, y estado propio
+    (caja, beneficio, inventarios, patentes) como paseo aleatorio.
+    """
+    def __init__(self, periodos=5, companias=11, compania_propia=4, semilla=0, prob_activa=0.15):
+        self.periodos = periodos
+        self.companias = companias
+        self.compania_propia = compania_propia
+        self.rng = np.random.default_rng(semilla)
+        self.prob_activa = prob_activa
+        self.base = np.array([PRECIOS_TIPICOS[a][p] * (1 + 0.10 * g) for (a, p, g) in COL_MAP])
+        self.salto = np.array([SALTO_MIN[a][p] for (a, p, g) in COL_MAP])
+        self.tipico = np.array([PRECIOS_TIPICOS[a][p] for (a, p, g) in COL_MAP])
+
+    def _precios(self):
+        """(compañías, 12) precios fijados; 0 = no vende en ese mercado."""
+        n = self.companias
+        activa = self.rng.random((n, 12)) < self.prob_activa
+        precio = self.base * (1 + self.rng.normal(0, 0.12, (n, 12)))
+        precio = self.tipico + np.round((precio - self.tipico) / self.salto) * self.salto
+        precio = np.maximum(precio, self.salto)
+        br_y = [COL_MAP[('BR', 'Y', 0)], COL_MAP[('BR', 'Y', 1)]]
+        precio[:, br_y] = np.minimum(precio[:, br_y], TOPE_BR_Y_LE3)
+        return np.where(activa, precio, 0.0)
+
+    def _ventas_totales(self, precios):
+        """Ventas a consumidores por (área, producto), en miles, según el precio medio relativo."""
+        ventas = np.zeros(6)
+        for (area, prod), col in VENTAS_MAP.items():
+            cols = [COL_MAP[(area, prod, 0)], COL_MAP[(area, prod, 1)]]
+            p = precios[:, cols]
+            if not (p > 0).any():
+                continue
+            relativo = p[p > 0].mean() / PRECIOS_TIPICOS[area][prod]
+            demanda = DEMANDA_BASE[(area, prod)] * (1 - ELASTICIDAD * (relativo - 1))
+            ventas[col] = max(demanda * (1 + self.rng.normal(0, 0.05)), 0.0)
+        return ventas
+
+    def simular(self):
+        """Lista de periodos con todo lo que se escribe en cada listado."""
+        caja, utilidad = 8e6, 0.0
+        inventario = self.rng.integers(0, 60000, 12) * (self.rng.random(12) < 0.3)
+        patentes = self.rng.integers(0, 3, 6)
+        puntuacion = self.rng.normal(0, 1, self.companias)
+        periodos = []
+        for t in range(1, self.periodos + 1):
+            precios = self._precios()
+            ventas = self._ventas_totales(precios)
+            propia = precios[self.compania_propia - 1]
+            vendido = np.zeros(12)
+            for (area, prod, g), col in COL_MAP.items():
+                if propia[col] > 0:
+                    n_activas = max((precios[:, col] > 0).sum(), 1)
+                    vendido[col] = min(ventas[VENTAS_MAP[(area, prod)]] * 1000 / n_activas, inventario[col] + 30000)
+            inventario = np.maximum(inventario + self.rng.integers(0, 20000, 12) * (inventario > 0) - vendido, 0)
+            ingresos = float((vendido * propia).sum())
+            utilidad = ingresos * 0.25 + self.rng.normal(0, 150000)
+            caja = max(caja + utilidad + self.rng.normal(0, 400000), 0.0)
+            puntuacion = 0.8 * puntuacion + self.rng.normal(0, 0.5, self.companias)
+            periodos.append({
+                'periodo': t, 'precios': precios, 'ventas_totales': ventas, 'vendido': vendido,
+                'inventario': inventario.copy(), 'patentes': patentes.copy(), 'caja': caja,
+                'utilidad': utilidad, 'puntuacion': puntuacion.copy(),
+            })
+        return periodos
+
+    # --- Escritura con el formato del árbitro ---
+
+    def _cabecera(self, t, pagina):
+        return [
+            '1' + 'THORELLI-GRAVES-LOPEZ'.rjust(76) + f'PERIODO: {t:2d}'.rjust(49),
+            'INTERNATIONAL OPERATIONS SIMULATION 2000'.rjust(86) + '01/01/2026 00:00'.rjust(42),
+            ' INTOPIA 2000 --' + 'UPPSALA U, SYNTHETIC LEAGUE'.rjust(53) + f'PAGINA: {pagina:03d}'.rjust(54),
+            '',
+        ]
+
+    def _secciones(self, d):
+        t, cia = d['periodo'], self.compania_propia
+        por_area = lambda v: [v * 0.0, v * 0.5, v * 0.0, v * 0.5]
+        cols = lambda v, g: [v[COL_MAP[(a, p, g)]] for a in AREAS for p in ('X', 'Y')]
+
+        balance = [
+            f' {CIA} {cia:3d} SYNTHETIC_{cia:02d}',
+            ' BALANCE                               U.S.                     EC/EU                     BRAZIL            LIECHTENST  CONSOLIDADO',
+            ' ACTIVOS',
+            '',
+            _fila('   CAJA', por_area(d['caja']) + [d['caja']], 13, 40),
+            _fila(f'   CxC PERIODO {t + 1:3d}', [0, 0, 0, 0], 13, 40),
+            _fila(f'   CxC PERIODO {t + 2:3d}', [0, 0, 0, 0], 13, 40),
+        ]
+        resultados = [
+            f' {CIA} {cia:3d} SYNTHETIC_{cia:02d}',
+            ' ESTADO DE RESULTADOS',
+            _fila(' UTILIDAD BRUTA', por_area(d['utilidad'] * 1.4) + [d['utilidad'] * 1.4], 13, 40),
+            _fila(' UTILIDAD DEL PERIODO', por_area(d['utilidad']) + [d['utilidad']], 13, 40),
+            _fila('   DIVIDENDOS', [0, 0], 13, 105),
+            _fila(' A UTILIDADES RETENIDAS', por_area(d['utilidad']) + [d['utilidad']], 13, 40),
+        ]
+        areas = ''.join(n.center(33) for n in NOMBRE_AREA)
+        info = [
+            f' {CIA} {cia:3d} SYNTHETIC_{cia:02d}',
+            '',
+            ' INFORMACION NO CONTABLE'.ljust(35) + areas,
+            ' ' * 35 + '      CHIP             PC       ' * 3,
+            '',
+            ' VENTAS UNIDADES ESTANDAR',
+            _fila('   A CONSUMIDORES', cols(d['vendido'], 0)),
+            _fila('   INTER-COMPA¥IA', [0] * 6),
+            ' VENTA UNIDADES DE LUJO',
+            _fila('   A CONSUMIDORES', cols(d['vendido'], 1)),
+            _fila('   INTER-COMPA¥IA', [0] * 6),
+            '',
+            ' INVENTARIO FINAL',
+            _fila('   UNIDADES ESTANDAR', cols(d['inventario'], 0)),
+            _fila('            GRADO', [0] * 6),
+            _fila('   UNIDADES DE LUJO', cols(d['inventario'], 1)),
+            _fila('            GRADO', [1] * 6),
+            _fila('CANTIDAD DE PLANTAS', [0, 0, 1, 0, 0, 0]),
+            _fila(' MAXIMO GRADO DE PRODUCCION', d['patentes']),
+            _fila(' MAXIMO GRADO POSEIDO', d['patentes']),
+        ]
+        cab_mercados = [
+            ' ' * 51 + ''.join(n.center(32) for n in NOMBRE_AREA),
+            ' ' * 43 + '    CHIP             PC       ' * 3,
+        ]
+        asesorias = [
+            f' {CIA} {cia:2d} ASESORIA NUMERO 3           :',
+            f' TOTAL DE VENTAS A CONSUMIDORES EN PERIODO {t}. EN MILES DE UNIDADES',
+            *cab_mercados,
+            ' VENTAS TOTALES:   .    .    .    .   ' + ''.join(f'{v:.2f}'.lstrip('0').rjust(16) for v in d['ventas_totales']),
+            '',
+            f' {CIA} {cia:2d} ASESORIA NUMERO 28          :',
+            f' PRECIOS FIJADOS PARA EL PERIODO {t:2d}.',
+            *cab_mercados,
+            ' ' * 41 + '   STD.    DEL.' * 6,
+        ]
+        for i, fila in enumerate(d['precios'], start=1):
+            asesorias.append(f' {CIA} {i:2d}  .    .    .    .    .  ' + ''.join(_num(p, 8) for p in fila))
+        asesorias += [
+            '',
+            f' {CIA} {cia:2d} ASESORIA NUMERO 17          :',
+            ' GRADO DE LAS VENTAS A CONSUMIDORES ESTE PERIODO.',
+            *cab_mercados,
+        ]
+        for i, fila in enumerate(d['precios'], start=1):
+            grados = [g if p > 0 else -1 for p, (_, _, g) in zip(fila, COL_MAP)]
+            asesorias.append(f' {CIA} {i:2d}  .    .    .    .    .  ' + ''.join(f'{g}.'.rjust(8) for g in grados))
+        formularios = [
+            f' FORMULARIOS DE DECISION PARA LA {CIA} NUMERO: {cia:2d}.',
+            '',
+            ' FORM NUMERO BOR PER CIA AREA    PRODUCTO    NUEVAS  MEJ.MET.   INF. PLANTA 1 PLANTA 2 PLANTA 3  SUP. PLANTA 1 PLANTA 2 PLANTA 3',
+            f'  A2     14   N {t:3d}. {cia:3d}.  2.       CHIP       0.        .00     0.     30.       0.       0.      0.     0.       0.       0.',
+            ' FORM NUMERO BOR PER CIA        CHIP                  PC          SERV.ESPEC  ITEM.1 ITEM.2 ITEM.3 ITEM.4 ITEM.5 ITEM.6  DIVIDENDOS',
+            f'  H1     29   N {t:3d}. {cia:3d}.        .00                  .00                .00      0.     0.     0.     0.     0.     0.        .00',
+        ]
+        return [balance, resultados, info, asesorias, formularios]
+
+    def escribir_periodo(self, d, destino):
+        lineas, pagina = [], 1
+        for seccion in self._secciones(d):
+            # Cada sección empieza en página nueva y se corta si no cabe (como en el listado)
+            for i in range(0, len(seccion), LINEAS_POR_PAGINA):
+                lineas += self._cabecera(d['periodo'], pagina) + seccion[i:i + LINEAS_POR_PAGINA] + ['']
+                pagina += 1
+        path = os.path.join(destino, f"Decisión {d['periodo']}.lst.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lineas) + '\n')
+        return path
+
+    def escribir_ranking(self, d, destino):
+        orden = np.argsort(-d['puntuacion'])
+        posicion = np.empty(self.companias, dtype=int)
+        posicion[orden] = np.arange(1, self.companias + 1)
+        path = os.path.join(destino, f"Ranking {d['periodo']}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('EMPRESA; PROMEDIO; POSICIÓN RANKING\n')
+            for i, (s, pos) in enumerate(zip(d['puntuacion'], posicion), start=1):
+                f.write(f"{i}; {repr(float(s)).replace('.', chr(39))}; {pos}\n")
+        return path
+
+    def generar(self, destino, rankings=True):
+        """Escribe la liga completa en destino; devuelve la lista de LST escritos."""
+        os.makedirs(destino, exist_ok=True)
+        ficheros = []
+        for d in self.simular():
+            ficheros.append(self.escribir_periodo(d, destino))
+            if rankings:
+                self.escribir_ranking(d, destino)
+        return ficheros
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Genera una liga INTOPIA sintética con el formato del árbitro.')
+    ap.add_argument('--out', required=True, help='Carpeta destino (tipo data/)')
+    ap.add_argument('--periodos', type=int, default=5)
+    ap.add_argument('--companias', type=int, default=11)
+    ap.add_argument('--propia', type=int, default=4, help='Compañía propia')
+    ap.add_argument('--semilla', type=int, default=0)
+    args = ap.parse_args(argv)
+    ficheros = SyntheticLeague(args.periodos, args.companias, args.propia, args.semilla).generar(args.out)
+    print(f"{len(ficheros)} listados en {args.out}")
+
+
+if __name__ == '__main__':
+    main()
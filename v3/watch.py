@@ -0,0 +1,156 @@
+"""
+Modo vigilancia: sondea data/ y, en cuanto llega (o cambia) un 'Decisión N' o un
+'Ranking N', vuelve a planificar y regenera los formularios de outputs/forms.
+
+    python -m v3.watch                      # sondea cada segundo hasta Ctrl+C
+    python -m v3.watch --intervalo 5 --detalle
+    python -m v3.watch --una-vez            # un solo ciclo con lo que haya
+
+Solo se vuelven a parsear los ficheros cuya firma (mtime, tamaño) cambia; la demanda solo
+se reajusta en los mercados con puntos nuevos, y la calibración del ranking y las estrategias
+salen de sus cachés (ranking._cache_calibracion, strategy._cache_soluciones) mientras sus
+entradas no cambien. Un cambio se procesa cuando la carpeta es estable entre dos sondeos,
+para no leer un fichero a medio copiar. Solo usa os.stat: sin dependencias ni inotify.
+"""
+import io
+import os
+import sys
+import glob
+import time
+import argparse
+import contextlib
+
+from v3.quickstart_v3 import QuickstartPipeline
+
+
+def _firma(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def instantanea(data_dir):
+    """{ruta: (mtime_ns, tamaño)} de los LST que usaría el quickstart y de los 'Ranking N.txt'."""
+    from src.parser import localizar_lsts
+    files, _ = localizar_lsts(data_dir)
+    firmas = {}
+    for f in files + sorted(glob.glob(os.path.join(data_dir, 'Ranking [0-9]*.txt'))):
+        try:
+            firmas[f] = _firma(f)
+        except OSError:
+            pass  # Borrado entre el glob y el stat: ya aparecerá en el siguiente sondeo
+    return firmas
+
+
+class WatchPipeline(QuickstartPipeline):
+    """
+    QuickstartPipeline no interactivo que conserva entre ciclos los LST parseados (con sus
+    puntos de demanda) y el último estimador, para que cada ciclo solo rehaga lo que cambia.
+    """
+    def __init__(self, data_dir=None, out_dir=None, almacen=None):
+        super().__init__(data_dir, out_dir, interactivo=False, almacen=almacen)
+        self.parseados = {}   # ruta -> (firma, datos parseados, puntos_periodo)
+        self.reparseados = []
+        self.estimador = None
+
+    def _parsear(self, files):
+        from src.parser import LSTParser
+        from v3.demand_estimator import puntos_periodo
+        parser = None
+        self.reparseados = []
+        for f in files:
+            firma = _firma(f)
+            guardado = self.parseados.get(f)
+            if guardado is None or guardado[0] != firma:
+                parser = parser or LSTParser()
+                datos = parser.parse_file(f)
+                self.parseados[f] = (firma, datos, puntos_periodo(datos))
+                self.reparseados.append(f)
+        for f in set(self.parseados) - set(files):
+            del self.parseados[f]
+        return [self.parseados[f][1] for f in files]
+
+    def _estimador_demanda(self):
+        from v3.demand_estimator import DemandEstimator
+        return DemandEstimator(self.datos_historicos, puntos_periodos=[self.parseados[f][2] for f in self.files],
+                               previo=self.estimador)
+
+    def ciclo(self):
+        """Vuelve a ejecutar parse..export; devuelve lo que se ha rehecho."""
+        from v3 import strategy
+        self.hechas.clear()
+        self.tiempos.clear()
+        resoluciones = len(strategy._cache_soluciones)
+        t0 = time.perf_counter()
+        self.run('export')
+        return {
+            'reparseados': [os.path.basename(f) for f in self.reparseados],
+            'resoluciones': len(strategy._cache_soluciones) - resoluciones,
+            'estrategias': len(self.estrategias_ranking),
+            'segundos': time.perf_counter() - t0,
+        }
+
+
+def _procesar(pipeline, detalle):
+    salida = io.StringIO()
+    try:
+        if detalle:
+            res = pipeline.ciclo()
+        else:
+            with contextlib.redirect_stdout(salida):
+                res = pipeline.ciclo()
+    except (Exception, SystemExit) as e:
+        print(salida.getvalue(), end='')
+        print(f"[{time.strftime('%H:%M:%S')}] ERROR: {e} (se reintentará cuando cambie data/)")
+        return None
+    print(f"[{time.strftime('%H:%M:%S')}] P{pipeline.periodo_actual} -> P{pipeline.periodo_actual + 1}: "
+          f"{pipeline.mejor_estrategia_nombre} (ranking {pipeline.mejor_estrategia['ranking']:.4f}) | "
+          f"parseados {res['reparseados'] or '-'} | estrategias resueltas {res['resoluciones']}/{res['estrategias']} | "
+          f"{res['segundos'] * 1000:.0f} ms -> {pipeline.out_dir}")
+    return res
+
+
+def vigilar(data_dir=None, out_dir=None, intervalo=1.0, una_vez=False, detalle=False, almacen=None):
+    """Bucle de sondeo. Con una_vez procesa lo que haya y termina (1 si no hay LST)."""
+    pipeline = WatchPipeline(data_dir, out_dir, almacen)
+    procesada, previa = None, None
+    print(f"Vigilando {pipeline.data_dir} cada {intervalo:g} s (Ctrl+C para salir)")
+    while True:
+        actual = instantanea(pipeline.data_dir)
+        # La primera vez se procesa sin esperar; después, solo cambios estables
+        if actual and actual != procesada and (procesada is None or actual == previa):
+            procesada = actual
+            _procesar(pipeline, detalle)
+        if una_vez:
+            if not actual:
+                print(f"No hay ficheros de Decisión en {pipeline.data_dir}")
+            return 0 if actual else 1
+        previa = actual
+        time.sleep(intervalo)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Re-planifica y regenera los formularios al llegar un nuevo LST.')
+    ap.add_argument('--data', default=None, help='Carpeta con los LST (por defecto ./data)')
+    ap.add_argument('--out', default=None, help='Carpeta de formularios (por defecto ./outputs/forms)')
+    ap.add_argument('--intervalo', type=float, default=1.0, help='Segundos entre sondeos')
+    ap.add_argument('--una-vez', action='store_true', help='Un solo ciclo y salir')
+    ap.add_argument('--detalle', action='store_true', help='Muestra la salida completa del quickstart en cada ciclo')
+    ap.add_argument('--db', default=os.environ.get('INTOPIA_DB'), metavar='PATH',
+                    help='Historial SQLite (v3.store) para modelos, soluciones y decisiones de cada ciclo')
+    args = ap.parse_args(argv)
+    almacen = None
+    if args.db:
+        from v3.store import HistoryStore, temporada_de
+        almacen = HistoryStore(args.db, temporada=temporada_de(args.data))
+    try:
+        return vigilar(args.data, args.out, args.intervalo, args.una_vez, args.detalle, almacen)
+    except KeyboardInterrupt:
+        print("\nVigilancia detenida.")
+        return 0
+    finally:
+        if almacen is not None:
+            almacen.cerrar()
+
+
+if __name__ == '__main__':
+    sys.exit(main())